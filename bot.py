@@ -3,6 +3,11 @@
 При обнаружении нецензурной лексики отправляет GIF-изображение в ответ.
 """
 
+import time
+# Момент запуска фиксируется до импорта остальных модулей для отчета о времени запуска
+_STARTUP_STARTED = time.perf_counter()
+
+import io
 import logging
 import os
 import random
@@ -10,14 +15,39 @@ import signal
 import sys
 import asyncio
 from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, executor, types
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import ContentType, ParseMode
-
-from profanity_filter import contains_profanity, initialize_bad_words
-from gif_service import get_gif_url, get_caption
-from constants import PROFANITY_RESPONSES, HELP_TEXT
-from utils import retry_on_timeout_bot
+from aiogram.utils.exceptions import RetryAfter
+
+from profanity_filter import find_profanity, first_profanity, mask_profanity, initialize_bad_words, start_background_initialization
+from profanity_filter import follow_journal, start_journal_follower, stop_journal_follower
+from chat_dictionaries import ChatDictionaryStore
+from gif_service import get_gif_url, get_caption, close_session
+from constants import PROFANITY_RESPONSES, HELP_TEXT, MASK_REPOST_TEMPLATE
+from utils import retry_on_timeout_bot, StartupTimer
+from send_queue import SendScheduler, send_scheduler, PRIORITY_PROFANITY, PRIORITY_NOTIFICATION, PRIORITY_DIGEST
+from constants import SEND_GLOBAL_RATE, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, TRACE_DEFAULT_LIMIT
+from constants import REPLY_FIRST_GIF_TIMEOUT, REPLY_FIRST_MAX_PENDING, OFFENSE_TOP_DEFAULT, OFFENSE_TOP_MAX
+from update_pool import PooledDispatcher, UpdatePool, is_degraded
+from shadow import shadow
+from offense_counters import OffenseCounters
+import profiler
+import tracing
+
+startup_timer = StartupTimer(_STARTUP_STARTED)
+startup_timer.mark('import')
+
+# Названия этапов для отчета о запуске
+STARTUP_PHASE_LABELS = {
+    'import': "Импорт модулей",
+    'config': "Загрузка конфигурации",
+    'on_startup': "Инициализация (on_startup)",
+    'first_poll': "До первого запроса обновлений",
+    'dictionary': "Загрузка полного словаря (в фоне)"
+}
 
 # Загрузка переменных окружения из файла .env
 load_dotenv()
@@ -27,6 +57,17 @@ API_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_ID = os.getenv('ADMIN_ID')
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
 API_SOURCE = os.getenv('API_SOURCE', 'yesno').lower()
+# Адрес Bot API (для локального сервера Bot API или нагрузочного тестирования)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+# Количество процессов-воркеров; 0 или 1 — обычный однопроцессный режим
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0') or 0)
+# Режим ответа: вместо GIF бот повторяет сообщение с замаскированной нецензурной лексикой
+MASK_REPOST = os.getenv('MASK_REPOST', 'false').lower() in ('1', 'true', 'yes')
+# Режим ответа: сразу текстовая подпись, которая заменяется GIF, когда он будет получен
+REPLY_FIRST = os.getenv('REPLY_FIRST', 'false').lower() in ('1', 'true', 'yes')
+# Несколько ботов в одном процессе: имена через запятую, для каждого BOT_<ИМЯ>_TOKEN
+# и необязательные BOT_<ИМЯ>_ADMIN_ID, BOT_<ИМЯ>_API_SOURCE (по умолчанию — общие ADMIN_ID и API_SOURCE)
+BOTS = [name.strip() for name in os.getenv('BOTS', '').split(',') if name.strip()]
 
 # Определение путей в зависимости от окружения
 if ENVIRONMENT.lower() == 'production':
@@ -34,34 +75,47 @@ if ENVIRONMENT.lower() == 'production':
 else:
     DATA_DIR = 'data'
 
-# Преобразуем ID администратора в число, если он задан
-ADMIN_ID = int(ADMIN_ID) if ADMIN_ID and ADMIN_ID.isdigit() else None
+def parse_admin_id(value: Optional[str]) -> Optional[int]:
+    """Преобразует ID администратора в число, если он задан"""
+    return int(value) if value and value.isdigit() else None
+
+ADMIN_ID = parse_admin_id(ADMIN_ID)
 
 # Список для хранения неотправленных уведомлений об ошибках
 pending_error_notifications = []
 
+# Отправлять ли администратору уведомления об ошибках. Приемщик многопроцессного режима
+# не запускает очередь отправки, поэтому его ошибки записываются только в лог
+error_notifications_enabled = True
+
 class TelegramLogHandler(logging.Handler):
     """Кастомный обработчик логов для отправки уведомлений в Telegram"""
 
     def emit(self, record):
         try:
-            if record.levelno >= logging.ERROR:
+            if record.levelno >= logging.ERROR and error_notifications_enabled:
                 error_message = self.format(record)
                 # Добавляем уведомление в список для отправки
                 pending_error_notifications.append(error_message)
-                # Пытаемся отправить уведомление
-                asyncio.create_task(send_error_notification(error_message))
+                # Пытаемся отправить уведомление; до запуска очереди оно уйдет в сводке при старте
+                if primary.scheduler.started:
+                    asyncio.create_task(send_error_notification(error_message))
         except Exception:
             self.handleError(record)
 
 async def send_error_notification(error_message):
-    """Отправка уведомления об ошибке администратору"""
-    if ADMIN_ID:
+    """Отправка уведомления об ошибке администратору (через основного бота процесса)"""
+    admin_id = primary.admin_id
+    if admin_id:
         try:
             # Очищаем сообщение от потенциально проблемных символов
             clean_message = error_message.replace('*', '').replace('_', '').replace('`', '')
             notification = f"⚠️ Внимание! Зафиксирована ошибка приложения @OopsNoCursingBot\n\n{clean_message}"
-            await retry_on_timeout_bot(bot.send_message, ADMIN_ID, notification)
+            await primary.scheduler.submit(
+                admin_id,
+                lambda: retry_on_timeout_bot(primary.bot.send_message, admin_id, notification),
+                PRIORITY_NOTIFICATION
+            )
             # Убираем сообщение из списка только при успешной отправке
             if error_message in pending_error_notifications:
                 pending_error_notifications.remove(error_message)
@@ -71,11 +125,16 @@ async def send_error_notification(error_message):
 
 async def send_pending_notifications():
     """Отправка накопившихся уведомлений об ошибках"""
-    if ADMIN_ID and pending_error_notifications:
+    admin_id = primary.admin_id
+    if admin_id and pending_error_notifications:
         try:
             notification = "⚠️ *Накопившиеся уведомления об ошибках:*\n\n"
             notification += "\n\n".join(pending_error_notifications)
-            await bot.send_message(ADMIN_ID, notification, parse_mode=ParseMode.MARKDOWN)
+            await primary.scheduler.submit(
+                admin_id,
+                lambda: primary.bot.send_message(admin_id, notification, parse_mode=ParseMode.MARKDOWN),
+                PRIORITY_DIGEST
+            )
             # Очищаем список после отправки
             pending_error_notifications.clear()
         except Exception as e:
@@ -94,29 +153,128 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера с увеличенными таймаутами
-bot = Bot(token=API_TOKEN, timeout=90)  # Увеличиваем таймаут с 30 до 90 секунд
-dp = Dispatcher(bot)
-
 def signal_handler(sig, frame):
     """Обработчик сигналов завершения"""
     logger.info("Получен сигнал завершения. Корректно завершаем работу бота...")
-    # Закрываем сессию бота
+    # Закрываем сессии ботов
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(bot.session.close())
+    for instance in instances:
+        loop.run_until_complete(instance.bot.session.close())
     sys.exit(0)
 
 # Регистрируем обработчики сигналов
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+class BotInstance:
+    """
+    Бот, обслуживаемый процессом: свои токен, диспетчер, администратор, источник GIF,
+    очередь отправки и папка данных со словарями чатов. Словарь нецензурных слов,
+    HTTP-сессия GIF API и теневая проверка общие для всех ботов процесса.
+    """
+
+    def __init__(self, name: str, token: str, admin_id: Optional[int], api_source: str, data_dir: str,
+                 scheduler: Optional[SendScheduler] = None):
+        self.name = name
+        self.admin_id = admin_id
+        self.api_source = api_source
+        self.data_dir = data_dir
+        # Инициализация бота и диспетчера с увеличенными таймаутами
+        self.bot = Bot(
+            token=token,
+            timeout=90,  # Увеличиваем таймаут с 30 до 90 секунд
+            server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION
+        )
+        self.dp = PooledDispatcher(self.bot)
+        self.dp['instance'] = self
+        self.dp.middleware.setup(tracing.TracingMiddleware())
+        # Пул обработки обновлений: ограничивает число одновременно обрабатываемых обновлений и размер очереди
+        self.dp.update_pool = UpdatePool(is_priority=lambda update: is_admin_command(update, self))
+        # Лимиты Telegram действуют для каждого бота отдельно, поэтому и очередь отправки у каждого своя
+        self.scheduler = scheduler or SendScheduler()
+        self.chat_dictionaries = ChatDictionaryStore(os.path.join(data_dir, "chat_dictionaries"))
+        # Счетчики нарушений пользователей по чатам
+        self.offenses = OffenseCounters(os.path.join(data_dir, "offenses.sqlite3"))
+
+    def is_admin(self, user_id) -> bool:
+        """Проверяет, является ли пользователь администратором этого бота"""
+        return bool(self.admin_id and user_id == self.admin_id)
+
+def load_bot_instances() -> List[BotInstance]:
+    """
+    Создает ботов по переменной окружения BOTS. Если она не задана, процесс
+    обслуживает одного бота с токеном BOT_TOKEN и папкой данных DATA_DIR.
+
+    Returns:
+        Список ботов; первый из них основной: он получает общую очередь отправки
+        и уведомления об ошибках процесса
+    """
+    if not BOTS:
+        return [BotInstance('main', API_TOKEN, ADMIN_ID, API_SOURCE, DATA_DIR, send_scheduler)]
+
+    loaded = []
+    for name in BOTS:
+        prefix = f"BOT_{name.upper()}_"
+        token = os.getenv(prefix + 'TOKEN')
+        if not token:
+            logger.warning(f"Не задан токен {prefix}TOKEN, бот {name} пропущен")
+            continue
+        admin_id = parse_admin_id(os.getenv(prefix + 'ADMIN_ID')) or ADMIN_ID
+        api_source = os.getenv(prefix + 'API_SOURCE', API_SOURCE).lower()
+        data_dir = os.path.join(DATA_DIR, 'bots', name)
+        loaded.append(BotInstance(name, token, admin_id, api_source, data_dir,
+                                  None if loaded else send_scheduler))
+    if not loaded:
+        sys.exit("Не задан ни один токен бота из списка BOTS")
+    return loaded
+
+def current_instance() -> BotInstance:
+    """Возвращает бота, обновление которого сейчас обрабатывается"""
+    return Dispatcher.get_current()['instance']
+
+def queue_reply(message: types.Message, text: str, **kwargs) -> asyncio.Future:
+    """Ставит ответ на сообщение в очередь отправки, не дожидаясь самой отправки"""
+    return current_instance().scheduler.submit(message.chat.id, lambda: message.reply(text, **kwargs),
+                                               PRIORITY_NOTIFICATION)
+
 # Вспомогательная функция для проверки прав администратора
 def is_admin(user_id):
-    """Проверяет, является ли пользователь администратором бота"""
-    return ADMIN_ID and user_id == ADMIN_ID
+    """Проверяет, является ли пользователь администратором бота, обрабатывающего обновление"""
+    return current_instance().is_admin(user_id)
+
+def is_admin_command(update: types.Update, instance: BotInstance) -> bool:
+    """Отбирает команды администратора в отдельную очередь пула обработки"""
+    message = update.message
+    return bool(message and message.from_user and message.is_command() and instance.is_admin(message.from_user.id))
+
+instances = load_bot_instances()
+# Основной бот; модульные bot и dp оставлены для многопроцессного режима и нагрузочного теста
+primary = instances[0]
+bot = primary.bot
+dp = primary.dp
+startup_timer.mark('config')
+
+# Обработчики сообщений регистрируются в диспетчере каждого бота функцией register_handlers
+_message_handlers: List[Tuple[Callable, Dict[str, Any]]] = []
+
+def message_handler(**kwargs):
+    """Запоминает обработчик сообщений для регистрации в диспетчерах всех ботов"""
+    def decorator(callback):
+        _message_handlers.append((callback, kwargs))
+        return callback
+    return decorator
+
+def register_handlers(dispatcher: Dispatcher) -> None:
+    """Регистрирует обработчики сообщений в диспетчере в порядке их объявления"""
+    for callback, kwargs in _message_handlers:
+        dispatcher.register_message_handler(callback, **kwargs)
 
 # Инициализация списка нецензурных слов
 async def on_startup(dp):
+    await start_bots([dp['instance']])
+
+async def start_bots(started: List[BotInstance]):
+    """Подготовка процесса и запуск ботов: общий словарь загружается один раз для всех"""
     logger.info("Запуск бота и инициализация списка нецензурных слов...")
     logger.info(f"Переменные окружения: ENVIRONMENT={ENVIRONMENT}, API_SOURCE={API_SOURCE}, DATA_DIR={DATA_DIR}")
 
@@ -129,28 +287,157 @@ async def on_startup(dp):
         except Exception as e:
             logger.error(f"Ошибка при создании директории {DATA_DIR}: {e}")
 
-    await initialize_bad_words()
-    # Отправляем накопившиеся уведомления при запуске
-    await send_pending_notifications()
+    # Боты начинают работу сразу с базовым набором слов, полный словарь подгружается в фоне
+    dictionary_task = start_background_initialization()
+    dictionary_task.add_done_callback(on_dictionary_loaded)
+    track_first_poll(started[0].bot)
+
+    for instance in started:
+        instance.scheduler.start()
+        instance.dp.update_pool.start(instance.dp)
+    await asyncio.gather(*(load_chat_dictionaries(instance) for instance in started),
+                         *(instance.offenses.start() for instance in started))
+
+    # Отправляем накопившиеся уведомления при запуске, не дожидаясь отправки
+    asyncio.create_task(send_pending_notifications())
+    startup_timer.mark('on_startup')
+    if len(started) > 1:
+        logger.info(f"Запущено ботов: {len(started)} ({', '.join(instance.name for instance in started)})")
     logger.info("Бот запущен и готов к работе")
 
-@dp.message_handler(commands=['start', 'help'])
+async def load_chat_dictionaries(instance: BotInstance):
+    """Загружает словари чатов бота, не блокируя цикл событий"""
+    try:
+        await asyncio.to_thread(instance.chat_dictionaries.load_all)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке словарей чатов бота {instance.name}: {e}")
+
+def on_dictionary_loaded(task: asyncio.Task):
+    """Фиксирует время фоновой загрузки словаря"""
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error(f"Ошибка при фоновой загрузке словаря: {task.exception()}")
+        return
+    startup_timer.record('dictionary', task.result())
+    log_startup_report()
+
+def track_first_poll(bot: Bot):
+    """Отмечает момент первого запроса обновлений после запуска"""
+    get_updates = bot.get_updates
+
+    async def first_get_updates(*args, **kwargs):
+        # Возвращаем обычный метод: замер нужен только один раз
+        del bot.get_updates
+        startup_timer.mark('first_poll')
+        log_startup_report()
+        return await get_updates(*args, **kwargs)
+
+    bot.get_updates = first_get_updates
+
+def log_startup_report():
+    """Пишет отчет о запуске, когда замерены и первый запрос обновлений, и загрузка словаря"""
+    if startup_timer.has('first_poll', 'dictionary'):
+        logger.info(startup_timer.report(STARTUP_PHASE_LABELS))
+
+async def on_shutdown(dp):
+    await stop_bots([dp['instance']])
+
+async def stop_bots(stopped: List[BotInstance]):
+    """Остановка ботов с отправкой оставшихся сообщений и закрытие общей HTTP-сессии"""
+    logger.info("Остановка бота, отправляем оставшиеся сообщения из очереди...")
+    # Сначала дообрабатываем принятые обновления: их ответы тоже попадут в очередь отправки
+    await asyncio.gather(*(instance.dp.update_pool.stop() for instance in stopped))
+    # Текстовые ответы, еще не замененные GIF, остаются как есть
+    for task in list(upgrade_tasks):
+        task.cancel()
+    await asyncio.gather(*(instance.scheduler.stop() for instance in stopped),
+                         *(instance.offenses.stop() for instance in stopped))
+    await close_session()
+
+async def run_bots(started: List[BotInstance]):
+    """Опрос обновлений для нескольких ботов в одном цикле событий до сигнала завершения"""
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await start_bots(started)
+    for instance in started:
+        await instance.dp.skip_updates()
+    polling = [asyncio.create_task(instance.dp.start_polling()) for instance in started]
+    await stop_event.wait()
+
+    logger.info("Получен сигнал завершения. Корректно завершаем работу ботов...")
+    for instance in started:
+        instance.dp.stop_polling()
+    # Не ждем окончания текущего долгого запроса обновлений
+    for task in polling:
+        task.cancel()
+    await asyncio.gather(*polling, return_exceptions=True)
+    await stop_bots(started)
+    for instance in started:
+        await instance.bot.close()
+
+async def on_receiver_startup(dp):
+    """Подготовка процесса-приемщика в многопроцессном режиме: словарь загружается один раз для всех воркеров"""
+    global error_notifications_enabled
+    # Очередь отправки в приемщике не запускается: задания в ней унаследовали бы все воркеры
+    error_notifications_enabled = False
+    logger.info(f"Запуск в многопроцессном режиме: {SHARD_WORKERS} воркеров, DATA_DIR={DATA_DIR}")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    from profanity_filter import CACHE_FILE
+    if os.path.exists(CACHE_FILE):
+        # Воркеры наследуют словарь при запуске, поэтому кеш читается до их создания.
+        # Журнал сжимают воркеры, которые его дописывают, а не приемщик
+        await initialize_bad_words(compact=False)
+    else:
+        # Без кеша воркеры стартуют с базовым набором и перезапускаются,
+        # когда загруженный словарь будет сохранен в кеш
+        start_background_initialization(compact=False)
+
+async def on_worker_startup(dp, worker_index):
+    """Запуск воркера: глобальный лимит отправки делится между воркерами"""
+    global error_notifications_enabled
+    # Задания и уведомления, унаследованные от приемщика при fork, повторно не отправляются
+    send_scheduler.reset_after_fork()
+    pending_error_notifications.clear()
+    error_notifications_enabled = True
+    send_scheduler.set_global_rate(SEND_GLOBAL_RATE / SHARD_WORKERS)
+    send_scheduler.start()
+    # Перезапущенный воркер должен увидеть словари чатов и слова, добавленные после запуска приемщика
+    await load_chat_dictionaries(dp['instance'])
+    await follow_journal()
+    start_journal_follower()
+    await dp['instance'].offenses.start()
+    # Каждый воркер отправляет только свои ошибки, накопившиеся до запуска очереди
+    await send_pending_notifications()
+
+async def on_worker_shutdown(dp, worker_index):
+    await stop_journal_follower()
+    for task in list(upgrade_tasks):
+        task.cancel()
+    await send_scheduler.stop()
+    await dp['instance'].offenses.stop()
+    await close_session()
+
+@message_handler(commands=['start', 'help'])
 async def send_welcome(message: types.Message):
     """
     Обработчик команд /start и /help
     """
-    await message.reply(HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
+    queue_reply(message, HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
 
-@dp.message_handler(commands=['update_words'])
+@message_handler(commands=['update_words'])
 async def update_bad_words(message: types.Message):
     """
     Обработчик команды обновления списка нецензурных слов (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
-    await message.reply("Обновляю список нецензурных слов из Викисловаря...")
+    queue_reply(message, "Обновляю список нецензурных слов из Викисловаря...")
 
     # Обновляем список слов
     await initialize_bad_words()
@@ -158,47 +445,45 @@ async def update_bad_words(message: types.Message):
     # Получаем количество слов для отчета
     from profanity_filter import BAD_WORDS
     count = len(BAD_WORDS)
-    await message.reply(f"✅ Список обновлен! Загружено {count} слов.")
+    queue_reply(message, f"✅ Список обновлен! Загружено {count} слов.")
 
-@dp.message_handler(commands=['force_update'])
+@message_handler(commands=['force_update'])
 async def force_update_words(message: types.Message):
     """
     Обработчик команды принудительного обновления списка нецензурных слов (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
-    from profanity_filter import CACHE_FILE
-    import os
+    from profanity_filter import CACHE_FILE, remove_dictionary_files
 
-    await message.reply("Начинаю принудительное обновление списка...")
+    queue_reply(message, "Начинаю принудительное обновление списка...")
 
-    # Удаляем кеш-файл если он существует
-    if os.path.exists(CACHE_FILE):
-        try:
-            os.remove(CACHE_FILE)
-            await message.reply(f"Кеш-файл {CACHE_FILE} удален.")
-        except Exception as e:
-            await message.reply(f"Ошибка при удалении кеш-файла: {e}")
+    # Удаляем кеш-файл и журнал изменений, если они существуют
+    try:
+        await remove_dictionary_files()
+        queue_reply(message, f"Кеш-файл {CACHE_FILE} и журнал изменений удалены.")
+    except Exception as e:
+        queue_reply(message, f"Ошибка при удалении кеш-файла: {e}")
 
     # Запускаем обновление
     await initialize_bad_words()
 
     from profanity_filter import BAD_WORDS
     count = len(BAD_WORDS)
-    await message.reply(f"✅ Список принудительно обновлен! Загружено {count} слов.")
+    queue_reply(message, f"✅ Список принудительно обновлен! Загружено {count} слов.")
 
-@dp.message_handler(commands=['debug'])
+@message_handler(commands=['debug'])
 async def debug_info(message: types.Message):
     """
     Отладочная информация (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
-    from profanity_filter import BAD_WORDS
+    from profanity_filter import BAD_WORDS, current_snapshot
     count = len(BAD_WORDS)
     sample = list(BAD_WORDS)[:10] if count > 10 else list(BAD_WORDS)
 
@@ -206,69 +491,240 @@ async def debug_info(message: types.Message):
                 f"• Количество слов: {count}\n" \
                 f"• Примеры слов: {', '.join(sample)}"
 
-    await message.reply(debug_text, parse_mode=ParseMode.MARKDOWN)
+    snapshot = current_snapshot()
+    cover = snapshot.cover.report()
+    debug_text += f"\n• Поиск корней: {cover['roots']} корней вместо {cover['candidates']} слов " \
+                  f"(исключено {cover['shrink']:.0%})"
 
-@dp.message_handler(commands=['check_env'])
+    if snapshot.translit is not None:
+        debug_text += f"\n• Индекс записи латиницей: {len(snapshot.translit)} вариантов"
+
+    fuzzy = snapshot.fuzzy
+    if fuzzy is not None:
+        report = fuzzy.report()
+        debug_text += f"\n• Индекс опечаток: {report['words']} слов, {report['keys']} ключей, " \
+                      f"~{report['memory_mb']} МБ из {report['budget_mb']} МБ" + \
+                      (" (заполнен не полностью)" if report['truncated'] else "")
+
+    queue_reply(message, debug_text, parse_mode=ParseMode.MARKDOWN)
+
+@message_handler(commands=['check_env'])
 async def check_environment(message: types.Message):
     """
     Проверка переменных окружения (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
     # Собираем информацию о переменных окружения
+    instance = current_instance()
     env_info = f"""
 📊 *Информация о переменных окружения:*
 
 • ENVIRONMENT: `{ENVIRONMENT}`
-• API_SOURCE: `{API_SOURCE}`
-• DATA_DIR: `{DATA_DIR}`
+• Бот: `{instance.name}` (всего в процессе: {len(instances)})
+• API_SOURCE: `{instance.api_source}`
+• DATA_DIR: `{instance.data_dir}`
 • Версия API_SOURCE в gif_service: `{os.getenv('API_SOURCE', 'не установлено')}`
     """
 
-    await message.reply(env_info, parse_mode=ParseMode.MARKDOWN)
+    queue_reply(message, env_info, parse_mode=ParseMode.MARKDOWN)
+
+# Задача текущего сеанса профилирования
+profile_task: Optional[asyncio.Task] = None
+
+@message_handler(commands=['profile'])
+async def profile_bot(message: types.Message):
+    """
+    Профилирование CPU и памяти работающего бота (только для администратора).
+    Сеанс идет в отдельной задаче и не занимает обработчик команд администратора
+    """
+    global profile_task
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    args = message.get_args().strip()
+    if args and not args.isdigit():
+        queue_reply(message, "Использование: `/profile [секунды]`", parse_mode=ParseMode.MARKDOWN)
+        return
+    seconds = min(max(int(args) if args else PROFILE_DEFAULT_SECONDS, 1), PROFILE_MAX_SECONDS)
+
+    if profiler.is_running() or (profile_task is not None and not profile_task.done()):
+        queue_reply(message, "⚠️ Профилирование уже запущено, дождитесь его завершения.")
+        return
+
+    queue_reply(message, f"⏱ Профилирую бота {seconds} сек...")
+    profile_task = asyncio.create_task(send_profile(message, seconds))
 
-@dp.message_handler(commands=['test'])
+async def send_profile(message: types.Message, seconds: int):
+    """Проводит сеанс профилирования и ставит в очередь отправки краткий отчет и полный отчет файлом"""
+    try:
+        session = await profiler.profile(seconds)
+    except Exception as e:
+        logger.error(f"Ошибка при профилировании: {e}")
+        queue_reply(message, f"❌ Ошибка при профилировании: {e}")
+        return
+
+    report = session.full_report().encode('utf-8')
+    document = types.InputFile(io.BytesIO(report), filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt")
+    queue_reply(message, session.summary())
+    current_instance().scheduler.submit(message.chat.id, lambda: message.reply_document(document),
+                                        PRIORITY_NOTIFICATION)
+
+@message_handler(commands=['trace'])
+async def show_traces(message: types.Message):
+    """
+    Самые медленные из последних трассируемых обновлений (только для администратора)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    args = message.get_args().strip()
+    limit = int(args) if args.isdigit() else TRACE_DEFAULT_LIMIT
+
+    slowest = tracing.slowest_traces(limit)
+    if not slowest:
+        queue_reply(message, f"Трасс пока нет (доля трассируемых обновлений: {tracing.TRACE_SAMPLE_RATE:.0%})")
+        return
+
+    header = f"🐢 Самые медленные обновления из {len(tracing.traces)} последних трасс:"
+    report = "\n\n".join([header] + [tracing.format_trace(trace) for trace in slowest])
+    # Ограничение Telegram на длину сообщения
+    if len(report) > 4000:
+        report = report[:4000] + "\n…"
+    queue_reply(message, report)
+
+@message_handler(commands=['top'])
+async def show_top_offenders(message: types.Message):
+    """
+    Пользователи этого чата с наибольшим количеством нарушений (только для администратора)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    args = message.get_args().strip()
+    limit = min(int(args), OFFENSE_TOP_MAX) if args.isdigit() and int(args) > 0 else OFFENSE_TOP_DEFAULT
+
+    top = current_instance().offenses.top(message.chat.id, limit)
+    if not top:
+        queue_reply(message, "В этом чате нарушений пока не было")
+        return
+
+    lines = ["🏆 Больше всего нарушений в этом чате:"]
+    for place, (user_id, record) in enumerate(top, 1):
+        last = datetime.fromtimestamp(record.last_at).strftime('%d.%m.%Y %H:%M')
+        lines.append(f"{place}. {record.name or user_id} — {record.count} (последнее {last})")
+    queue_reply(message, "\n".join(lines))
+
+@message_handler(commands=['queue'])
+async def show_queue(message: types.Message):
+    """
+    Состояние очереди обработки обновлений (только для администратора)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    instance = current_instance()
+    if not instance.dp.update_pool.running:
+        # В многопроцессном режиме обновления распределяются по воркерам без пула
+        queue_reply(message, "Пул обработки обновлений не используется в многопроцессном режиме")
+        return
+
+    report = instance.dp.update_pool.format_metrics()
+    report += f"\n📤 Очередь отправки: {instance.scheduler.queue_size} сообщений, " \
+              f"отброшено при переполнении: {instance.scheduler.dropped_count}"
+    queue_reply(message, report)
+
+@message_handler(commands=['shadow'])
+async def shadow_evaluation(message: types.Message):
+    """
+    Теневая проверка словаря-кандидата на реальных сообщениях (только для администратора)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    args = message.get_args().split()
+    if not args:
+        report = shadow.summary()
+        # Ограничение Telegram на длину сообщения
+        if len(report) > 4000:
+            report = report[:4000] + "\n…"
+        queue_reply(message, report)
+        return
+
+    if args[0] == 'stop':
+        shadow.stop()
+        queue_reply(message, "Теневая проверка остановлена, сводка доступна по команде /shadow")
+        return
+
+    if args[0] != 'start':
+        queue_reply(message, "Использование: `/shadow`, `/shadow start [файл словаря] [fuzzy|nofuzzy]`, `/shadow stop`",
+                    parse_mode=ParseMode.MARKDOWN)
+        return
+
+    options = args[1:]
+    fuzzy = None
+    if options and options[-1] in ('fuzzy', 'nofuzzy'):
+        fuzzy = options.pop() == 'fuzzy'
+    path = ' '.join(options) or None
+    try:
+        candidate = await shadow.start(path, fuzzy)
+    except (OSError, ValueError) as e:
+        queue_reply(message, f"❌ Не удалось загрузить словарь-кандидат: {e}")
+        return
+    queue_reply(message, f"👥 Теневая проверка запущена: {shadow.label}, {len(candidate.words)} слов, "
+                         f"доля сообщений {shadow.sample_rate:.0%}")
+
+@message_handler(commands=['test'])
 async def test_filter(message: types.Message):
     """
     Тестирование фильтра на конкретных словах (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
     if not message.get_args():
-        await message.reply("Использование: `/test [слово или фраза для проверки]`", parse_mode=ParseMode.MARKDOWN)
+        queue_reply(message, "Использование: `/test [слово или фраза для проверки]`", parse_mode=ParseMode.MARKDOWN)
         return
 
     test_text = message.get_args()
-    is_profane, reason = contains_profanity(test_text)
+    matches = find_profanity(test_text, current_instance().chat_dictionaries.get(message.chat.id))
 
-    if is_profane:
+    if matches:
         result = f"✅ Текст «{test_text}» содержит нецензурную лексику\n\n"
-        result += f"*Причина:* {reason}"
-        await message.reply(result, parse_mode=ParseMode.MARKDOWN)
+        result += f"*Совпадения ({len(matches)}):*\n"
+        for match in matches:
+            result += (f"• «{test_text[match.start:match.end]}» [{match.start}:{match.end}], "
+                       f"этап `{match.stage}`, нормализация `{match.normalization}`: {match.reason}\n")
+        result += f"\n*С маскировкой:* `{mask_profanity(test_text, matches)}`"
+        queue_reply(message, result, parse_mode=ParseMode.MARKDOWN)
     else:
-        await message.reply(f"❌ Текст «{test_text}» не содержит нецензурную лексику")
+        queue_reply(message, f"❌ Текст «{test_text}» не содержит нецензурную лексику")
 
-@dp.message_handler(commands=['test_yo'])
+@message_handler(commands=['test_yo'])
 async def test_yo_variations(message: types.Message):
     """
     Тестирование фильтра на слова с буквами е/ё (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
     if not message.get_args():
-        await message.reply("Использование: `/test_yo [слово с буквой е или ё]`", parse_mode=ParseMode.MARKDOWN)
+        queue_reply(message, "Использование: `/test_yo [слово с буквой е или ё]`", parse_mode=ParseMode.MARKDOWN)
         return
 
     test_word = message.get_args().strip()
 
     # Импортируем функции из модуля profanity_filter
-    from profanity_filter import generate_yo_variants, contains_profanity
+    from profanity_filter import generate_yo_variants
 
     # Получаем варианты слова с е/ё
     variants = generate_yo_variants(test_word)
@@ -276,9 +732,9 @@ async def test_yo_variations(message: types.Message):
     # Проверяем каждый вариант на нецензурность
     results = []
     for variant in variants:
-        is_profane, reason = contains_profanity(variant)
-        if is_profane:
-            status = f"✅ нецензурное ({reason})"
+        matches = find_profanity(variant)
+        if matches:
+            status = f"✅ нецензурное ({'; '.join(match.reason for match in matches)})"
         else:
             status = "❌ обычное"
         results.append(f"• `{variant}` — {status}")
@@ -287,86 +743,265 @@ async def test_yo_variations(message: types.Message):
     response = f"🔄 *Варианты слова '{test_word}' с заменой е/ё:*\n\n"
     response += "\n".join(results)
 
-    await message.reply(response, parse_mode=ParseMode.MARKDOWN)
+    queue_reply(message, response, parse_mode=ParseMode.MARKDOWN)
 
-@dp.message_handler(commands=['add_word'])
+@message_handler(commands=['add_word'])
 async def add_bad_word(message: types.Message):
     """
     Добавление слова в список нецензурной лексики (только для администратора)
     """
     if not is_admin(message.from_user.id):
-        await message.reply("⚠️ У вас нет прав администратора для выполнения этой команды.")
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
         return
 
     args = message.get_args()
     if not args:
-        await message.reply("Использование: `/add_word [слово для добавления]`", parse_mode=ParseMode.MARKDOWN)
+        queue_reply(message, "Использование: `/add_word [слово для добавления]`", parse_mode=ParseMode.MARKDOWN)
         return
 
     word = args.strip().lower()
 
-    # Импортируем необходимые функции и переменные
-    from profanity_filter import BAD_WORDS, CACHE_FILE, generate_yo_variants
-    import json
+    # Импортируем необходимые функции
+    import profanity_filter
+    from profanity_filter import generate_yo_variants
 
     # Добавляем слово и его вариации
     new_words = generate_yo_variants(word)
-    words_count_before = len(BAD_WORDS)
 
-    # Обновляем глобальный список
-    BAD_WORDS.update(new_words)
+    # Обновляем глобальный список; изменение дописывается в журнал
+    try:
+        added_count = await profanity_filter.add_words(new_words)
+
+        queue_reply(message, f"✅ Слово «{word}» и {max(added_count - 1, 0)} его вариаций успешно добавлены в список.\n"
+                             f"Всего слов в списке: {len(profanity_filter.BAD_WORDS)}")
+
+    except Exception as e:
+        queue_reply(message, f"❌ Произошла ошибка при сохранении: {e}")
+
+async def update_chat_dictionary(message: types.Message, usage: str, **changes):
+    """
+    Изменяет словарь текущего чата и сохраняет его на диск (только для администратора)
+
+    Args:
+        message: Сообщение с командой
+        usage: Подсказка по использованию команды
+        changes: Аргументы для ChatDictionaryStore.update (deny, allow или remove)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    # Слова и выражения перечисляются через запятую
+    entries = [entry.strip() for entry in message.get_args().split(',') if entry.strip()]
+    if not entries:
+        queue_reply(message, usage, parse_mode=ParseMode.MARKDOWN)
+        return
 
-    # Сохраняем обновленный список в кеш
+    chat_id = message.chat.id
+    store = current_instance().chat_dictionaries
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(list(BAD_WORDS), f, ensure_ascii=False, indent=2)
+        # Словарь в памяти заменяется только после успешной записи на диск
+        overlay = await asyncio.to_thread(store.update, chat_id, **{key: entries for key in changes})
+    except Exception as e:
+        queue_reply(message, f"❌ Произошла ошибка при сохранении словаря чата: {e}")
+        return
 
-        added_count = len(BAD_WORDS) - words_count_before
-        await message.reply(f"✅ Слово «{word}» и {added_count-1} его вариаций успешно добавлены в список.\n"
-                           f"Всего слов в списке: {len(BAD_WORDS)}")
+    queue_reply(message, f"✅ Словарь чата обновлен: {', '.join(entries)}\n"
+                         f"Запрещено в чате: {len(overlay.deny)}, разрешено: {len(overlay.allow)}")
 
+@message_handler(commands=['chat_deny'])
+async def chat_deny_words(message: types.Message):
+    """
+    Запрещает слова только в текущем чате (только для администратора)
+    """
+    await update_chat_dictionary(message, "Использование: `/chat_deny [слово, выражение, ...]`", deny=True)
+
+@message_handler(commands=['chat_allow'])
+async def chat_allow_words(message: types.Message):
+    """
+    Разрешает слова из общего словаря в текущем чате (только для администратора)
+    """
+    await update_chat_dictionary(message, "Использование: `/chat_allow [слово, выражение, ...]`", allow=True)
+
+@message_handler(commands=['chat_remove'])
+async def chat_remove_words(message: types.Message):
+    """
+    Удаляет слова из словаря текущего чата (только для администратора)
+    """
+    await update_chat_dictionary(message, "Использование: `/chat_remove [слово, выражение, ...]`", remove=True)
+
+@message_handler(commands=['chat_words'])
+async def show_chat_words(message: types.Message):
+    """
+    Показывает словарь текущего чата (только для администратора)
+    """
+    if not is_admin(message.from_user.id):
+        queue_reply(message, "⚠️ У вас нет прав администратора для выполнения этой команды.")
+        return
+
+    overlay = current_instance().chat_dictionaries.get(message.chat.id)
+    if not overlay:
+        queue_reply(message, "В этом чате используется только общий словарь")
+        return
+
+    report = (f"🚫 Запрещено в чате: {', '.join(sorted(overlay.deny)) or '—'}\n"
+              f"✅ Разрешено в чате: {', '.join(sorted(overlay.allow)) or '—'}")
+    # Ограничение Telegram на длину сообщения
+    if len(report) > 4000:
+        report = report[:4000] + "\n…"
+    queue_reply(message, report)
+
+async def send_profanity_animation(message: types.Message, gif_url: str, caption: str):
+    """
+    Отправляет GIF в ответ на сообщение с нецензурной лексикой,
+    при ошибке отправляет текстовую подпись
+    """
+    try:
+        return await message.reply_animation(
+            animation=gif_url,
+            caption=caption
+        )
+    except RetryAfter:
+        # Повторную отправку выполнит очередь после паузы
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при отправке GIF: {e}")
+        # Если не удалось отправить GIF, отправляем текстовое сообщение
+        return await message.reply(caption)
+
+async def replace_with_animation(message: types.Message, placeholder: asyncio.Future, gif_url: str, caption: str):
+    """
+    Заменяет текстовый ответ анимацией с той же подписью. Telegram не позволяет превратить
+    текстовое сообщение в сообщение с анимацией (editMessageMedia изменяет только сообщения
+    с медиа), поэтому анимация отправляется ответом на исходное сообщение, а текстовый ответ удаляется.
+    Если анимацию отправить не удалось, текстовый ответ остается.
+    """
+    # Очередь отправки выполняет задания одного чата по порядку, поэтому текстовый ответ уже отправлен
+    sent = None
+    if placeholder.done() and not placeholder.cancelled() and placeholder.exception() is None:
+        sent = placeholder.result()
+    try:
+        animation = await message.reply_animation(animation=gif_url, caption=caption)
+    except RetryAfter:
+        # Повторную отправку выполнит очередь после паузы
+        raise
     except Exception as e:
-        await message.reply(f"❌ Произошла ошибка при сохранении: {e}")
+        logger.warning(f"Не удалось заменить ответ анимацией, остается текст: {e}")
+        if sent is None:
+            return await message.reply(caption)
+        return sent
+    if sent is not None:
+        try:
+            await sent.delete()
+        except Exception as e:
+            logger.warning(f"Не удалось удалить текстовый ответ после отправки GIF: {e}")
+    return animation
+
+# Ожидающие GIF замены текстовых ответов (режим REPLY_FIRST)
+upgrade_tasks = set()
+
+def reply_then_upgrade(instance: BotInstance, message: types.Message):
+    """
+    Режим REPLY_FIRST: сразу отвечает текстовой подписью, а GIF ожидается в отдельной задаче,
+    не занимая обработчик пула. Поэтому задержка ответа определяется только проверкой сообщения.
+    """
+    caption = get_caption(instance.api_source)
+    placeholder = instance.scheduler.submit(message.chat.id, lambda: message.reply(caption), PRIORITY_PROFANITY)
+    if len(upgrade_tasks) >= REPLY_FIRST_MAX_PENDING:
+        # GIF API не успевает: оставляем текстовый ответ, не накапливая ожидающие задачи
+        logger.debug("Слишком много ожидающих замен на GIF, остается текстовый ответ")
+        return
+    task = asyncio.create_task(upgrade_reply(instance, message, placeholder, caption))
+    upgrade_tasks.add(task)
+    task.add_done_callback(upgrade_tasks.discard)
 
-@dp.message_handler(content_types=ContentType.TEXT)
+async def upgrade_reply(instance: BotInstance, message: types.Message, placeholder: asyncio.Future, caption: str):
+    """
+    Получает GIF и ставит в очередь замену текстового ответа анимацией. Если GIF не получен
+    за REPLY_FIRST_GIF_TIMEOUT секунд, остается текстовый ответ.
+    """
+    try:
+        with profiler.measure('get_gif_url'), tracing.span('gif'):
+            gif_url, _ = await asyncio.wait_for(get_gif_url(instance.api_source), REPLY_FIRST_GIF_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.info(f"GIF не получен за {REPLY_FIRST_GIF_TIMEOUT} сек., остается текстовый ответ")
+        return
+    if gif_url:
+        instance.scheduler.submit(
+            message.chat.id,
+            lambda: replace_with_animation(message, placeholder, gif_url, caption),
+            PRIORITY_PROFANITY
+        )
+
+@message_handler(content_types=ContentType.TEXT)
+@profiler.timed('process_message')
 async def process_message(message: types.Message):
     """
     Обработчик текстовых сообщений
     Реагирует только на сообщения с нецензурной лексикой
     """
     text = message.text
+    instance = current_instance()
 
     # Проверяем текст на наличие нецензурной лексики
     logger.debug(f"Проверка сообщения: {text}")
-    is_profane, reason = contains_profanity(text)
+    overlay = instance.chat_dictionaries.get(message.chat.id)
+    with profiler.measure('iter_profanity'), tracing.span('filter'):
+        if MASK_REPOST:
+            # Для маскировки нужны все совпадения, иначе достаточно первого
+            matches = find_profanity(text, overlay)
+        else:
+            first_match = first_profanity(text, overlay)
+            matches = [first_match] if first_match else []
+    # Кандидат проверяется в фоне и на ответ не влияет
+    shadow.submit(message.chat.id, text, overlay)
 
-    if is_profane:
+    if matches:
         logger.info(f"Обнаружена нецензурная лексика в сообщении: {text}")
-        logger.info(f"Причина: {reason}")
+        logger.info(f"Причина: {matches[0].reason}")
+        if message.from_user:
+            instance.offenses.record(message.chat.id, message.from_user.id, message.from_user.full_name)
+
+        if MASK_REPOST:
+            repost = MASK_REPOST_TEMPLATE.format(name=message.from_user.full_name, text=mask_profanity(text, matches))
+            # Ограничение Telegram на длину сообщения
+            if len(repost) > 4096:
+                repost = repost[:4095] + "…"
+            instance.scheduler.submit(message.chat.id, lambda: message.reply(repost), PRIORITY_PROFANITY)
+            return
+
+        if is_degraded():
+            # Очередь обработки переполнена: отвечаем текстом, не дожидаясь GIF API
+            response = random.choice(PROFANITY_RESPONSES)
+            instance.scheduler.submit(message.chat.id, lambda: message.reply(response), PRIORITY_PROFANITY)
+            return
+
+        if REPLY_FIRST:
+            reply_then_upgrade(instance, message)
+            return
 
         # Получаем URL GIF и информацию об использованном API
-        gif_url, used_api = await get_gif_url()
+        with profiler.measure('get_gif_url'), tracing.span('gif'):
+            gif_url, used_api = await get_gif_url(instance.api_source)
 
         if gif_url:
             # Выбираем подпись в зависимости от использованного API
             caption = get_caption(used_api)
-
-            try:
-                # Отправляем GIF в ответ на сообщение с нецензурной лексикой
-                await message.reply_animation(
-                    animation=gif_url,
-                    caption=caption
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке GIF: {e}")
-                # Если не удалось отправить GIF, отправляем текстовое сообщение
-                await message.reply(caption)
+            instance.scheduler.submit(
+                message.chat.id,
+                lambda: send_profanity_animation(message, gif_url, caption),
+                PRIORITY_PROFANITY
+            )
         else:
             # Если не удалось получить GIF, отправляем текстовое сообщение
-            await message.reply(random.choice(PROFANITY_RESPONSES))
+            response = random.choice(PROFANITY_RESPONSES)
+            instance.scheduler.submit(message.chat.id, lambda: message.reply(response), PRIORITY_PROFANITY)
     else:
         logger.debug("Нецензурная лексика не обнаружена")
 
+for hosted in instances:
+    register_handlers(hosted.dp)
+
 def setup_timeout_logging():
     """Настраивает фильтр логов для преобразования TimeoutError в WARNING"""
     aiogram_logger = logging.getLogger('aiogram.dispatcher.dispatcher')
@@ -384,4 +1019,23 @@ def setup_timeout_logging():
 
 if __name__ == '__main__':
     setup_timeout_logging()
-    executor.start_polling(dp, on_startup=on_startup, skip_updates=True)
\ No newline at end of file
+    if SHARD_WORKERS > 1:
+        if len(instances) > 1:
+            sys.exit("Многопроцессный режим (SHARD_WORKERS) поддерживает только одного бота")
+        from sharding import ShardedRunner
+        from profanity_filter import cache_build_id
+
+        ShardedRunner(
+            dp, API_TOKEN, SHARD_WORKERS,
+            on_receiver_startup=on_receiver_startup,
+            on_worker_startup=on_worker_startup,
+            on_worker_shutdown=on_worker_shutdown,
+            on_dictionary_change=lambda dp: initialize_bad_words(compact=False),
+            dictionary_version=cache_build_id,
+            health_file=os.path.join(DATA_DIR, "shard_health.json"),
+            is_priority=dp.update_pool.is_priority
+        ).run()
+    elif len(instances) > 1:
+        asyncio.run(run_bots(instances))
+    else:
+        executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown, skip_updates=True)
\ No newline at end of file
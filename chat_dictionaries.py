@@ -0,0 +1,137 @@
+"""
+Модуль словарей отдельных чатов.
+
+Словарь чата — небольшое дополнение к общему словарю BAD_WORDS: список запрещенных
+слов (срабатывают только в этом чате) и список разрешенных слов (не считаются
+нецензурными в этом чате). Общий словарь при этом не копируется и не изменяется,
+а проверка по словарю чата стоит O(1) на слово.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from dictionary_journal import atomic_write_json
+from profanity_filter import DATA_DIR, normalize_yo
+
+logger = logging.getLogger(__name__)
+
+# Директория с файлами словарей чатов
+CHAT_DICTIONARIES_DIR = os.path.join(DATA_DIR, "chat_dictionaries")
+
+
+def normalize_entry(word: str) -> str:
+    """Приводит слово к виду, в котором оно хранится в словаре чата"""
+    return normalize_yo(word.strip().lower())
+
+
+class ChatOverlay:
+    """
+    Словарь одного чата. Объект не изменяется после создания:
+    при редактировании создается новый, поэтому проверки не требуют блокировок.
+    """
+
+    __slots__ = ('deny', 'allow', 'deny_phrases')
+
+    def __init__(self, deny: Iterable[str] = (), allow: Iterable[str] = ()):
+        self.deny: FrozenSet[str] = frozenset(normalize_entry(w) for w in deny)
+        self.allow: FrozenSet[str] = frozenset(normalize_entry(w) for w in allow)
+        # Выражения из нескольких слов проверяются вхождением в текст
+        self.deny_phrases = tuple(w for w in self.deny if ' ' in w)
+
+    def __bool__(self) -> bool:
+        return bool(self.deny or self.allow)
+
+    def is_denied(self, word: str) -> bool:
+        """Проверяет, запрещено ли слово в этом чате"""
+        return normalize_yo(word) in self.deny
+
+    def is_allowed(self, word: str) -> bool:
+        """Проверяет, разрешено ли слово в этом чате"""
+        return normalize_yo(word) in self.allow
+
+    def to_dict(self) -> Dict[str, list]:
+        return {'deny': sorted(self.deny), 'allow': sorted(self.allow)}
+
+
+class ChatDictionaryStore:
+    """Хранилище словарей чатов: в памяти и в файлах по одному на чат"""
+
+    def __init__(self, directory: str = CHAT_DICTIONARIES_DIR):
+        self.directory = directory
+        self._overlays: Dict[int, ChatOverlay] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, chat_id: int) -> str:
+        return os.path.join(self.directory, f"{chat_id}.json")
+
+    def get(self, chat_id: int) -> Optional[ChatOverlay]:
+        """Возвращает словарь чата или None, если у чата нет своего словаря"""
+        return self._overlays.get(chat_id)
+
+    def load_all(self) -> int:
+        """
+        Загружает словари всех чатов с диска (блокирующая операция)
+
+        Returns:
+            Количество загруженных словарей
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        for filename in os.listdir(self.directory):
+            name, ext = os.path.splitext(filename)
+            if ext != '.json' or not name.lstrip('-').isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._overlays[int(name)] = ChatOverlay(data.get('deny', ()), data.get('allow', ()))
+            except Exception as e:
+                logger.error(f"Ошибка при чтении словаря чата {filename}: {e}")
+        logger.info(f"Загружено словарей чатов: {len(self._overlays)}")
+        return len(self._overlays)
+
+    def update(self, chat_id: int, deny: Iterable[str] = (), allow: Iterable[str] = (),
+               remove: Iterable[str] = ()) -> ChatOverlay:
+        """
+        Изменяет словарь чата: новый словарь сначала записывается на диск и только после
+        успешной записи заменяет прежний в памяти (блокирующая операция)
+
+        Args:
+            chat_id: ID чата
+            deny: Слова, добавляемые в запрещенные
+            allow: Слова, добавляемые в разрешенные
+            remove: Слова, удаляемые из обоих списков
+
+        Returns:
+            Новый словарь чата
+
+        Raises:
+            OSError: Если словарь не записан; словарь чата в памяти при этом не изменяется
+        """
+        # Одновременные изменения одного словаря не должны терять друг друга
+        with self._lock:
+            current = self._overlays.get(chat_id) or ChatOverlay()
+            removed = {normalize_entry(w) for w in remove}
+            denied = {normalize_entry(w) for w in deny}
+            allowed = {normalize_entry(w) for w in allow}
+            overlay = ChatOverlay(
+                (current.deny - removed - allowed) | denied,
+                (current.allow - removed - denied) | allowed
+            )
+            self._write(chat_id, overlay)
+            if overlay:
+                self._overlays[chat_id] = overlay
+            else:
+                self._overlays.pop(chat_id, None)
+        return overlay
+
+    def _write(self, chat_id: int, overlay: Optional[ChatOverlay]) -> None:
+        path = self._path(chat_id)
+        if not overlay:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        atomic_write_json(path, overlay.to_dict())
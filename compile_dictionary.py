@@ -0,0 +1,275 @@
+"""
+Сборка словаря нецензурной лексики вне работающего бота.
+
+Компилятор берет заголовки страниц категории Викисловаря (из сохраненного ранее
+файла или из сети), параллельно генерирует для них варианты е/ё и словоформы
+и записывает отсортированный словарь без повторов с версией и контрольной суммой
+SHA-256. Бот загружает такой файл напрямую как кеш словаря; журнал изменений
+применяется поверх него как обычно. После сборки выводится сравнение с предыдущей версией
+и отчет о сокращении перебора корней с проверкой, что решения фильтра не изменились.
+С --latin-words выводятся слова из списка слов другого языка (например, частотного словаря
+английского), которые поиск латиницей считает нецензурными: их стоит внести в latin_words.txt.
+С --russian-words так же проверяется частотный словарь русского языка на поиск опечаток
+(слова для russian_words.txt).
+
+Примеры запуска:
+    python compile_dictionary.py --fetch --save-titles data/category_titles.txt
+    python compile_dictionary.py --titles data/category_titles.txt --workers 8
+    python compile_dictionary.py --titles data/category_titles.txt --dry-run --latin-words english.txt
+    python compile_dictionary.py --titles data/category_titles.txt --dry-run --russian-words russian.txt
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dictionary_journal import atomic_write_bytes, atomic_write_json
+from fuzzy_index import DeletionIndex, load_common_words
+from profanity_filter import (CACHE_FILE, KNOWN_ROOTS, DictionarySnapshot, ProfanityMatch, build_dictionary_artifact,
+                              common_words, expand_title, finalize_words, find_profanity, get_category_titles,
+                              latin_words, read_dictionary_file)
+from root_cover import covered_words
+from transliteration import TransliterationIndex, load_latin_words
+
+logger = logging.getLogger(__name__)
+
+# Сколько слов из добавленных и удаленных показывать в сравнении
+DIFF_SAMPLE_SIZE = 20
+
+# Сколько расхождений показывать при проверке покрытия корней
+COVER_MISMATCH_SAMPLE = 10
+
+# Сколько совпадений со словами из проверяемого списка показывать
+WORD_LIST_HIT_SAMPLE = 50
+
+
+def read_titles(path: str) -> Set[str]:
+    """Читает сохраненные заголовки категории: по одному на строку"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip().lower() for line in f if line.strip()}
+
+
+def save_titles(path: str, titles: Set[str]) -> None:
+    """Сохраняет заголовки категории в отсортированном виде, по одному на строку"""
+    atomic_write_bytes(path, ''.join(f"{title}\n" for title in sorted(titles)).encode('utf-8'))
+
+
+def compile_words(titles: Set[str], workers: int) -> Set[str]:
+    """
+    Генерирует словоформы для заголовков в пуле процессов
+
+    Args:
+        titles: Заголовки страниц категории
+        workers: Количество процессов
+
+    Returns:
+        Множество слов с базовым набором, как в get_all_words_in_category
+    """
+    # Порядок заголовков фиксирован, хотя результат от него и не зависит
+    ordered = sorted(titles)
+    words: Set[str] = set()
+    if workers <= 1:
+        for title in ordered:
+            words.update(expand_title(title))
+    else:
+        chunksize = max(1, len(ordered) // (workers * 8))
+        with ProcessPoolExecutor(workers) as pool:
+            for forms in pool.map(expand_title, ordered, chunksize=chunksize):
+                words.update(forms)
+    return finalize_words(words)
+
+
+def load_previous(path: str) -> Optional[Dict[str, Any]]:
+    """Читает предыдущую версию словаря, если она есть"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return read_dictionary_file(path)
+    except Exception as e:
+        logger.warning(f"Предыдущая версия словаря {path} не прочитана: {e}")
+        return None
+
+
+def format_diff(previous: Optional[Dict[str, Any]], artifact: Dict[str, Any]) -> List[str]:
+    """Формирует сравнение новой версии словаря с предыдущей"""
+    lines = [f"Словарь: {artifact['count']} слов, версия {artifact['version']}, sha256 {artifact['sha256'][:12]}"]
+    if previous is None:
+        lines.append("Предыдущей версии нет")
+        return lines
+
+    old_words, new_words = set(previous['words']), set(artifact['words'])
+    added, removed = sorted(new_words - old_words), sorted(old_words - new_words)
+    old_hash = (previous.get('sha256') or 'нет')[:12]
+    lines.append(f"Предыдущая версия {previous['version']}: {len(old_words)} слов, sha256 {old_hash}")
+    if not added and not removed:
+        lines.append("Содержимое не изменилось")
+        return lines
+
+    lines.append(f"Добавлено: {len(added)}, удалено: {len(removed)}")
+    lines += [f"+ {word}" for word in added[:DIFF_SAMPLE_SIZE]]
+    if len(added) > DIFF_SAMPLE_SIZE:
+        lines.append(f"+ … еще {len(added) - DIFF_SAMPLE_SIZE}")
+    lines += [f"- {word}" for word in removed[:DIFF_SAMPLE_SIZE]]
+    if len(removed) > DIFF_SAMPLE_SIZE:
+        lines.append(f"- … еще {len(removed) - DIFF_SAMPLE_SIZE}")
+    return lines
+
+
+def cover_check_texts(words: Iterable[str]) -> List[str]:
+    """Составляет тексты для проверки покрытия: слова, исключенные из перебора, в разном окружении"""
+    texts = []
+    for word in sorted(words):
+        texts += [word, f"ну ты {word}ище", f"за{word}, вот", word.replace('е', 'ё'), word.upper()]
+    return texts
+
+
+def _cover_key(match: ProfanityMatch) -> Tuple[int, int, str, str]:
+    return match.start, match.end, match.stage, match.normalization
+
+
+def check_cover(words: Set[str]) -> Tuple[List[str], int]:
+    """
+    Сравнивает найденные фрагменты и причины фильтра с покрытием корней и с перебором всех слов словаря
+
+    Args:
+        words: Собранный словарь
+
+    Returns:
+        Кортеж (строки отчета, количество текстов с расхождениями)
+    """
+    snapshot = DictionarySnapshot.build(words, fuzzy=False)
+    reference = snapshot.without_cover()
+    report = snapshot.cover.report()
+    lines = [f"Поиск корней: {report['roots']} корней вместо {report['candidates']} слов "
+             f"(исключено {report['pruned']}, {report['shrink']:.1%})"]
+
+    texts = cover_check_texts(covered_words(snapshot.cover))
+    mismatches = []
+    for text in texts:
+        found = find_profanity(text, snapshot=snapshot)
+        expected = find_profanity(text, snapshot=reference)
+        # Сравниваются фрагменты и вид причины (этап и нормализация). Слово словаря в причине
+        # без покрытия — первое по алфавиту из найденных, поэтому оно само не сравнивается
+        if [_cover_key(match) for match in found] != [_cover_key(match) for match in expected]:
+            mismatches.append(f"  {text!r}: с покрытием {[match.reason for match in found]}, "
+                              f"без покрытия {[match.reason for match in expected]}")
+    lines.append(f"Проверено текстов: {len(texts)}")
+    lines += mismatches[:COVER_MISMATCH_SAMPLE]
+    lines.append(f"Расхождений: {len(mismatches)}")
+    return lines, len(mismatches)
+
+
+def check_latin_words(words: Set[str], path: str) -> List[str]:
+    """
+    Ищет слова из списка слов другого языка, которые поиск латиницей считает нецензурными
+
+    Args:
+        words: Собранный словарь
+        path: Файл со словами другого языка, по одному на строку
+
+    Returns:
+        Строки отчета; слова, уже внесенные в LATIN_WORDS_FILE, не выводятся
+    """
+    index = TransliterationIndex.build(words, KNOWN_ROOTS)
+    hits = []
+    for word in sorted(load_latin_words(path) - latin_words()):
+        found = index.lookup(word)
+        if found:
+            hits.append(f"  {word}: {found[0]} ({found[1]})")
+    return _format_hits(hits, path)
+
+
+def check_russian_words(words: Set[str], path: str) -> List[str]:
+    """
+    Ищет обычные слова из списка, которые поиск опечаток считает словами словаря с опечаткой
+
+    Args:
+        words: Собранный словарь
+        path: Файл с обычными словами русского языка, по одному на строку
+
+    Returns:
+        Строки отчета; слова, уже внесенные в RUSSIAN_WORDS_FILE, не выводятся
+    """
+    index = DeletionIndex.build(words)
+    hits = []
+    for word in sorted(load_common_words(path) - common_words()):
+        entry = index.lookup(word)
+        # Слова из самого словаря опечатками не считаются
+        if entry and entry != word:
+            hits.append(f"  {word}: {entry}")
+    return _format_hits(hits, path)
+
+
+def _format_hits(hits: List[str], path: str) -> List[str]:
+    lines = hits[:WORD_LIST_HIT_SAMPLE]
+    if len(hits) > WORD_LIST_HIT_SAMPLE:
+        lines.append(f"  … еще {len(hits) - WORD_LIST_HIT_SAMPLE}")
+    lines.append(f"Совпадений со словами из {os.path.basename(path)}: {len(hits)}")
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сборка словаря нецензурной лексики")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--titles', help="файл с заголовками категории, по одному на строку")
+    source.add_argument('--fetch', action='store_true', help="получить заголовки категории из Викисловаря")
+    parser.add_argument('--save-titles', help="сохранить полученные заголовки в файл")
+    parser.add_argument('--output', default=CACHE_FILE, help="файл словаря (по умолчанию кеш-файл бота)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="количество процессов")
+    parser.add_argument('--dry-run', action='store_true', help="только показать сравнение, не записывая файл")
+    parser.add_argument('--latin-words', help="файл со словами другого языка для проверки поиска латиницей")
+    parser.add_argument('--russian-words', help="файл с обычными словами русского языка для проверки поиска опечаток")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.fetch:
+        titles = asyncio.run(get_category_titles())
+        source = "wiktionary"
+    else:
+        titles = read_titles(args.titles)
+        source = os.path.basename(args.titles)
+    if not titles:
+        logger.error("Не получено ни одного заголовка, словарь не собран")
+        sys.exit(1)
+    if args.save_titles:
+        save_titles(args.save_titles, titles)
+        logger.info(f"Заголовки сохранены в {args.save_titles}")
+
+    started = time.perf_counter()
+    words = compile_words(titles, args.workers)
+    logger.info(f"Из {len(titles)} заголовков получено {len(words)} слов за {time.perf_counter() - started:.2f} сек.")
+
+    previous = load_previous(args.output)
+    artifact = build_dictionary_artifact(words, source, previous)
+    print("\n".join(format_diff(previous, artifact)))
+    cover_lines, mismatches = check_cover(words)
+    print("\n".join(cover_lines))
+    if mismatches:
+        logger.error("Покрытие корней меняет решения фильтра, словарь не записан")
+        sys.exit(1)
+    if args.latin_words:
+        print("\n".join(check_latin_words(words, args.latin_words)))
+    if args.russian_words:
+        print("\n".join(check_russian_words(words, args.russian_words)))
+
+    if args.dry_run:
+        return
+    if previous is not None and previous.get('sha256') == artifact['sha256']:
+        print(f"Файл {args.output} не изменен")
+        return
+    atomic_write_json(args.output, artifact, indent=0)
+    print(f"Словарь записан в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 Общие константы для бота OopsNoCursing
 """
 
+import os
+
 # Список сообщений для ответа на нецензурную лексику
 PROFANITY_RESPONSES = [
     "Ой-ой, кажется, ваш ротик немножко 💩 засорился!",
@@ -29,9 +31,10 @@ RETRY_COUNT = 3
 RETRY_DELAY = 2  # секунды для gif_service
 BOT_RETRY_DELAY = 5  # секунды для bot
 
-# URL API для получения случайных GIF
-YESNO_API_URL = "https://yesno.wtf/api"
-CATAAS_API_URL = "https://cataas.com/cat/gif"
+# URL API для получения случайных GIF (переопределяются переменными окружения,
+# например, для нагрузочного тестирования с локальными заглушками)
+YESNO_API_URL = os.getenv('YESNO_API_URL', "https://yesno.wtf/api")
+CATAAS_API_URL = os.getenv('CATAAS_API_URL', "https://cataas.com/cat/gif")
 
 # Принудительно получать "no" GIF для yesno API
 FORCE_NO_PARAM = "?force=no"
@@ -39,6 +42,84 @@ FORCE_NO_PARAM = "?force=no"
 # Порог ошибок для переключения API
 ERROR_THRESHOLD = 3
 
+# Лимиты Telegram на отправку сообщений
+SEND_GLOBAL_RATE = 30  # сообщений в секунду для всего бота
+SEND_PRIVATE_CHAT_RATE = 1  # сообщений в секунду в личный чат
+SEND_GROUP_CHAT_RATE = 20 / 60  # сообщений в секунду в группу (20 в минуту)
+SEND_GROUP_CHAT_BURST = 3  # допустимая пачка сообщений в группу
+SEND_MAX_RETRY_AFTER_ATTEMPTS = 3  # попыток отправки после ответа retry_after
+SEND_CHAT_BACKLOG_LIMIT = 100  # сообщений в очереди одного чата; сверх этого отбрасываются самые старые менее важные
+
+# Приоритеты исходящих сообщений (меньше — важнее)
+PRIORITY_PROFANITY = 0  # ответы на нецензурную лексику
+PRIORITY_NOTIFICATION = 1  # ответы на команды и уведомления администратору
+PRIORITY_DIGEST = 2  # сводки накопившихся уведомлений
+
+# Настройки многопроцессного режима (шардирование по chat_id)
+SHARD_QUEUE_SIZE = 1000  # максимальное число обновлений в очереди одного воркера
+SHARD_POLL_TIMEOUT = 20  # таймаут long polling в процессе-приемщике, секунды
+SHARD_HEARTBEAT_INTERVAL = 5  # период отправки heartbeat воркером, секунды
+SHARD_HEARTBEAT_TIMEOUT = 30  # воркер без heartbeat дольше этого времени перезапускается
+SHARD_STOP_TIMEOUT = 30  # время на корректное завершение воркера, секунды
+SHARD_HEALTH_LOG_INTERVAL = 60  # период записи отчета о состоянии воркеров, секунды
+
+# Настройки пула обработки обновлений
+UPDATE_POOL_WORKERS = 32  # одновременно обрабатываемых обычных обновлений
+UPDATE_QUEUE_SIZE = 1000  # максимальное число обычных обновлений в очереди
+ADMIN_LANE_WORKERS = 2  # обработчиков команд администратора
+ADMIN_QUEUE_SIZE = 100  # максимальное число команд администратора в очереди
+UPDATE_POOL_STOP_TIMEOUT = 10  # время на обработку принятых обновлений при остановке, секунды
+
+# Настройки профилирования по команде /profile
+PROFILE_DEFAULT_SECONDS = 10  # длительность сеанса по умолчанию
+PROFILE_MAX_SECONDS = 300  # максимальная длительность сеанса
+PROFILE_SAMPLE_INTERVAL = 0.005  # период снятия стека, секунды
+PROFILE_TOP_FUNCTIONS = 5  # количество функций в кратком отчете
+PROFILE_TRACEMALLOC_FRAMES = 1  # глубина стека, сохраняемая tracemalloc
+
+# Настройки трассировки обновлений
+TRACE_BUFFER_SIZE = 500  # количество последних трасс в памяти
+TRACE_DEFAULT_LIMIT = 5  # количество трасс в ответе на /trace
+
+# Режим REPLY_FIRST: сколько ждать GIF, прежде чем оставить текстовый ответ, сек.
+REPLY_FIRST_GIF_TIMEOUT = 5
+REPLY_FIRST_MAX_PENDING = 500  # ожидающих GIF замен; сверх этого ответ остается текстовым
+
+# Шаблон ответа в режиме MASK_REPOST: сообщение с замаскированной нецензурной лексикой
+MASK_REPOST_TEMPLATE = "🙊 {name}: {text}"
+
+# Поиск нецензурной лексики, написанной латиницей
+TRANSLIT_MAX_VARIANTS = 12  # вариантов записи латиницей на одно слово словаря
+TRANSLIT_MAX_TOKEN_LENGTH = 24  # более длинные слова не проверяются на наличие корней
+TRANSLIT_MIN_ROOT_LENGTH = 6  # более короткие варианты записи латиницей совпадают только с целым словом
+
+# Поиск слов с опечатками (FUZZY_MATCHING)
+FUZZY_MIN_WORD_LENGTH = 6  # более короткие слова не индексируются и не проверяются
+FUZZY_MEMORY_BUDGET_MB = 64  # ограничение памяти индекса удалений
+
+# Теневая проверка кандидата (/shadow)
+SHADOW_STORE_SIZE = 200  # количество хранимых расхождений
+SHADOW_LATENCY_WINDOW = 1000  # количество последних замеров задержки для перцентилей
+SHADOW_MAX_PENDING = 100  # сообщений в очереди теневой проверки, сверх этого сообщения пропускаются
+SHADOW_REPORT_EXAMPLES = 5  # количество расхождений в ответе на /shadow
+SHADOW_TEXT_LIMIT = 200  # длина сохраняемого текста сообщения
+
+# HTTP-сервис проверки текста (filter_service.py)
+FILTER_MAX_REQUEST_BYTES = 1024 * 1024  # максимальный размер тела запроса
+FILTER_MAX_TEXT_LENGTH = 10000  # максимальная длина одного текста, символов
+FILTER_MAX_BATCH_SIZE = 500  # максимальное количество текстов в пачке
+FILTER_RELOAD_INTERVAL = 10  # период проверки изменения файлов словаря, секунды
+FILTER_BATCH_YIELD_EVERY = 50  # через сколько текстов пачки цикл событий получает управление
+
+# Счетчики нарушений (/top)
+OFFENSE_FLUSH_INTERVAL = 10  # период записи измененных счетчиков в базу, секунды
+OFFENSE_TOP_DEFAULT = 10  # количество пользователей в ответе на /top
+OFFENSE_TOP_MAX = 50  # максимальное количество пользователей в ответе на /top
+
+# Журнал изменений словаря
+JOURNAL_COMPACT_ENTRIES = 20  # после стольких записей журнал сжимается в кеш-файл
+JOURNAL_FOLLOW_INTERVAL = 2  # период применения записей журнала других процессов (воркеры), секунды
+
 # Текст справки
 HELP_TEXT = """
 *Бот-фильтр нецензурной лексики*
@@ -56,6 +137,15 @@ HELP_TEXT = """
 • `/add_word [слово]` — добавить новое слово в список
 • `/debug` — показать информацию о текущем списке
 • `/check_env` — проверить текущие значения переменных окружения
+• `/profile [секунды]` — профилировать CPU и память бота
+• `/trace [N]` — показать самые медленные из последних обновлений
+• `/top [N]` — показать пользователей этого чата с наибольшим количеством нарушений
+• `/queue` — показать состояние очереди обработки обновлений
+• `/shadow [start [файл] [fuzzy|nofuzzy] | stop]` — теневая проверка словаря-кандидата
+• `/chat_deny [слова через запятую]` — запретить слова только в этом чате
+• `/chat_allow [слова через запятую]` — разрешить слова в этом чате
+• `/chat_remove [слова через запятую]` — убрать слова из словаря чата
+• `/chat_words` — показать словарь этого чата
 
 *Команды тестирования:*
 • `/test [текст]` — проверить текст на наличие нецензурной лексики
@@ -0,0 +1,324 @@
+"""
+Журнал изменений словаря.
+
+Изменения словаря (например, добавление слов командой /add_word) дописываются в конец
+файла журнала по одной JSON-строке и сразу сбрасываются на диск, вместо перезаписи всего
+кеш-файла. При загрузке журнал применяется поверх снимка словаря из кеша, а время от
+времени сжимается: снимок с примененными записями атомарно записывается в кеш,
+после чего журнал удаляется.
+
+Процессы, которые держат словарь в памяти, следят за журналом (DictionaryJournal.follow)
+и применяют записи, дописанные другими процессами, не перечитывая словарь целиком.
+
+Все функции модуля блокирующие и должны вызываться через asyncio.to_thread.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка действует только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Операции журнала
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+
+# umask процесса: узнать его можно, только заменив, поэтому это делается один раз при импорте,
+# пока другие потоки не создают файлы
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _fsync_directory(directory: str) -> None:
+    """Сбрасывает на диск запись каталога, чтобы переименование пережило сбой питания"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def file_id(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Возвращает идентификатор версии файла (inode, время изменения, размер) или None, если файла нет.
+    Атомарная запись заменяет файл новым, поэтому идентификатор меняется при каждой перезаписи
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _file_mode(path: str) -> int:
+    """
+    Возвращает права для записываемого файла: права заменяемого файла или, для нового файла,
+    обычные права с учетом umask. mkstemp создает файлы с правами 0600, и без этого после
+    первой перезаписи файл становился недоступен процессам других пользователей
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """
+    Атомарно записывает файл: данные пишутся во временный файл в том же каталоге,
+    сбрасываются на диск и переименовываются поверх старого файла.
+    При сбое на диске остается либо старая, либо новая версия целиком.
+    Права заменяемого файла сохраняются.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    mode = _file_mode(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), mode)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = None) -> None:
+    """
+    Атомарно записывает данные в JSON-файл
+
+    Args:
+        path: Путь к файлу
+        data: Данные
+        indent: Отступ; None — компактная запись в одну строку,
+            0 — каждый элемент на своей строке (удобно сравнивать версии)
+    """
+    separators = (',', ':') if indent is None else (',', ': ')
+    text = json.dumps(data, ensure_ascii=False, indent=indent, separators=separators)
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+class JournalPosition:
+    """
+    Положение словаря процесса относительно файлов на диске: версия файла снимка,
+    из которой загружен словарь, смещение в журнале после последней примененной записи
+    и количество записей журнала, примененных поверх снимка
+    """
+
+    __slots__ = ('snapshot_path', 'snapshot_id', 'offset', 'entries')
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        self.snapshot_id: Optional[Tuple[int, int, int]] = None
+        self.offset = 0
+        self.entries = 0
+
+
+class DictionaryJournal:
+    """Журнал изменений словаря в формате JSON Lines"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Блокирует журнал на время операции. Блокировка через отдельный файл действует
+        и между процессами, поэтому воркеры многопроцессного режима не мешают друг другу.
+        """
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, op: str, words: Iterable[str]) -> None:
+        """
+        Дописывает запись в журнал и дожидается ее сброса на диск
+
+        Args:
+            op: Операция (OP_ADD или OP_REMOVE)
+            words: Слова, к которым применяется операция
+        """
+        entry = {'op': op, 'words': sorted(words), 'ts': round(time.time(), 3)}
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self.locked():
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def replay(self, words: Set[str], position: Optional[JournalPosition] = None) -> Tuple[Set[str], int]:
+        """
+        Применяет записи журнала к снимку словаря
+
+        Args:
+            words: Снимок словаря (не изменяется)
+            position: Положение, которое запоминает версию снимка и конец примененных записей
+                для последующего вызова follow
+
+        Returns:
+            Кортеж (словарь с примененными записями, количество примененных записей)
+        """
+        with self.locked():
+            result, entries, offset = self._replay(words)
+            if position is not None:
+                position.snapshot_id = file_id(position.snapshot_path)
+                position.offset, position.entries = offset, entries
+            return result, entries
+
+    def follow(self, words: Set[str], position: JournalPosition,
+               load_snapshot: Callable[[], Optional[Set[str]]]) -> Optional[Set[str]]:
+        """
+        Применяет к словарю процесса изменения, сделанные другими процессами после position.
+        Если файл снимка не перезаписывался, применяются только записи, дописанные в журнал
+        после position. Если снимок перезаписан (журнал сжат), словарь заново собирается
+        из снимка и журнала.
+
+        Args:
+            words: Словарь процесса (не изменяется)
+            position: Положение словаря процесса; передвигается к концу журнала
+            load_snapshot: Чтение перезаписанного снимка; None, если снимок нельзя применить
+                на месте (например, словарь собран заново и процесс будет перезапущен) —
+                тогда словарь процесса не меняется
+
+        Returns:
+            Новый словарь или None, если словарь не изменился
+        """
+        with self.locked():
+            snapshot_id = file_id(position.snapshot_path)
+            if snapshot_id == position.snapshot_id:
+                if position.offset > self._end_offset():
+                    # Журнал удален без перезаписи снимка (сжатие без новых записей): читаем его с начала
+                    position.offset = position.entries = 0
+                result, entries, position.offset = self._replay(words, position.offset)
+                position.entries += entries
+            else:
+                position.snapshot_id = snapshot_id
+                snapshot = load_snapshot() if snapshot_id is not None else None
+                if snapshot is None:
+                    position.offset, position.entries = self._end_offset(), 0
+                    return None
+                result, position.entries, position.offset = self._replay(snapshot)
+            return result if result is not words and result != words else None
+
+    def _end_offset(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _read_complete(self, offset: int) -> Tuple[bytes, int]:
+        """Читает полные записи журнала начиная с offset; возвращает их и смещение их конца"""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+
+        complete_size = data.rfind(b'\n') + 1
+        if complete_size < len(data):
+            # Последняя запись оборвана сбоем: отбрасываем ее, чтобы следующая
+            # запись не склеилась с ней в одну поврежденную строку
+            logger.warning(f"Журнал словаря {self.path}: отброшена неполная запись "
+                           f"({len(data) - complete_size} байт)")
+            os.truncate(self.path, offset + complete_size)
+        return data[:complete_size], offset + complete_size
+
+    def _parse(self, data: bytes) -> List[Tuple[str, List[str]]]:
+        """Разбирает записи журнала, пропуская поврежденные"""
+        parsed = []
+        for number, line in enumerate(data.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                op, entry_words = entry['op'], entry['words']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Журнал словаря {self.path}: поврежденная запись в строке {number}: {e}")
+                continue
+            if op not in (OP_ADD, OP_REMOVE):
+                logger.error(f"Журнал словаря {self.path}: неизвестная операция '{op}' в строке {number}")
+                continue
+            parsed.append((op, entry_words))
+        return parsed
+
+    def _replay(self, words: Set[str], offset: int = 0) -> Tuple[Set[str], int, int]:
+        """
+        Применяет к словарю записи журнала начиная с offset
+
+        Returns:
+            Кортеж (словарь с примененными записями, количество записей, смещение конца журнала)
+        """
+        if not os.path.exists(self.path):
+            return words, 0, 0
+        data, end = self._read_complete(offset)
+        if not data:
+            return words, 0, end
+
+        result = set(words)
+        entries = self._parse(data)
+        for op, entry_words in entries:
+            if op == OP_ADD:
+                result.update(entry_words)
+            else:
+                result.difference_update(entry_words)
+        return result, len(entries), end
+
+    def compact(self, load_snapshot: Callable[[], Optional[Set[str]]],
+                save_snapshot: Callable[[Set[str]], None]) -> int:
+        """
+        Сжимает журнал: записывает снимок словаря с примененными записями и удаляет журнал.
+        Снимок читается с диска заново, поэтому сжатие не зависит от словаря в памяти
+        процесса и не теряет записи, добавленные другими процессами.
+
+        Args:
+            load_snapshot: Чтение снимка словаря (None, если снимка нет)
+            save_snapshot: Атомарная запись снимка словаря
+
+        Returns:
+            Количество записей, перенесенных в снимок
+        """
+        with self.locked():
+            if not os.path.exists(self.path):
+                return 0
+            snapshot = load_snapshot()
+            if snapshot is None:
+                # Без снимка сжимать некуда: журнал применится к словарю после его загрузки
+                return 0
+            words, entries, _ = self._replay(snapshot)
+            if entries:
+                save_snapshot(words)
+            self.clear()
+            return entries
+
+    def clear(self) -> None:
+        """Удаляет журнал (вызывается под блокировкой, после записи снимка)"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            _fsync_directory(os.path.dirname(self.path) or '.')
@@ -0,0 +1,411 @@
+"""
+Дифференциальная проверка реализаций фильтра против эталона.
+
+Эталон — замороженная пятиэтапная проверка из reference_filter.py, включая
+нормализацию ё/е и жестко заданные корни этапа 5. Кандидат — любая реализация
+с тем же интерфейсом, что у contains_profanity: функция, которая принимает текст
+и возвращает (результат, причина). Корпус состоит из сгенерированных вариантов
+слов словаря (регистр, ё/е, приставки и окончания, слова внутри предложений),
+случайных сообщений и, при необходимости, записанных сообщений из файлов.
+Тексты проверяются в пуле процессов, по одному процессу на ядро.
+
+Расхождением считается разный результат или разный вид причины (этап и
+нормализация, то есть текст причины до двоеточия). Найденные слова в причине
+по умолчанию не сравниваются: эталон перебирает множества, и при нескольких
+совпадениях выбор слова зависит от порядка обхода. Каждое расхождение
+сокращается до кратчайшего текста, на котором воспроизводится то же
+расхождение: сначала удаляются слова, затем отдельные символы.
+
+Встроенные кандидаты:
+    current   — текущий profanity_filter с индексами, как в боте (латиница по TRANSLIT_MATCHING,
+                опечатки по FUZZY_MATCHING)
+    cyrillic  — текущий profanity_filter без поиска латиницей и опечаток; должен совпадать с эталоном
+                без единого расхождения (код завершения 0)
+Свой кандидат задается как module:factory, где factory(words) возвращает функцию проверки.
+
+Пример запуска:
+    python differential_check.py --engine cyrillic --corpus history.txt --output mismatches.jsonl
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import AbstractSet, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import reference_filter
+from load_test import CLEAN_WORDS, make_text
+from profanity_filter import KNOWN_ROOTS, DictionarySnapshot, first_profanity, read_dictionary_file
+from scan_export import iter_export_messages, load_dictionary, message_text
+
+logger = logging.getLogger(__name__)
+
+# Результат проверки: (результат, причина)
+Verdict = Tuple[bool, Optional[str]]
+# Функция проверки текста
+Checker = Callable[[str], Verdict]
+# Расхождение без текста: ('verdict' или 'reason', эталон, кандидат); None — расхождения нет
+Signature = Optional[Tuple[str, Any, Any]]
+
+# Приставки и окончания для вариантов слов словаря
+PREFIXES = ("по", "за", "на", "вы", "рас", "недо")
+SUFFIXES = ("ый", "ами", "ся", "ть", "-то", "ище")
+# Знаки препинания вокруг слов
+PUNCTUATION = ("!", ",", "?!", "...", "\"", ")")
+
+# Тексты, на которых причины уже расходились с эталоном; проверяются при любой выборке слов
+REGRESSION_TEXTS = ("дать по ёбалу", "мудоёбе", "адебилоёб", "хуёсосе", "ну ты говноёбище",
+                    "а поебаться тёбе не завернуть?")
+
+# Сколько раз вызывать проверку при сокращении одного расхождения, не больше
+MINIMIZE_BUDGET = 2000
+
+
+def checker_current(words: Set[str]) -> Checker:
+    """Текущий фильтр с индексами, как в боте"""
+    return _snapshot_checker(DictionarySnapshot.build(words))
+
+
+def checker_cyrillic(words: Set[str]) -> Checker:
+    """Текущий фильтр без поиска латиницей и слов с опечатками"""
+    return _snapshot_checker(DictionarySnapshot(words))
+
+
+def _snapshot_checker(snapshot: DictionarySnapshot) -> Checker:
+    def check(text: str) -> Verdict:
+        match = first_profanity(text, None, snapshot)
+        if match is None:
+            return False, None
+        return True, match.reason
+    return check
+
+
+ENGINES: Dict[str, Callable[[Set[str]], Checker]] = {
+    'current': checker_current,
+    'cyrillic': checker_cyrillic
+}
+
+
+def resolve_engine(spec: str) -> Callable[[Set[str]], Checker]:
+    """
+    Находит фабрику кандидата по имени встроенного кандидата или пути module:factory
+
+    Raises:
+        ValueError: Если кандидат не найден
+    """
+    if spec in ENGINES:
+        return ENGINES[spec]
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise ValueError(f"Неизвестный кандидат '{spec}': ожидается {', '.join(ENGINES)} или module:factory")
+    try:
+        return getattr(importlib.import_module(module_name), attr)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Кандидат '{spec}' не найден: {e}") from e
+
+
+def reason_kind(reason: Optional[str]) -> Optional[str]:
+    """Возвращает вид причины: текст до двоеточия (этап проверки и нормализация)"""
+    if reason is None:
+        return None
+    return reason.split(':', 1)[0]
+
+
+# Состояние процесса пула: эталон, кандидат и режим сравнения причин
+_oracle_words: AbstractSet[str] = frozenset()
+_candidate: Optional[Checker] = None
+_strict_reasons = False
+
+
+def _init_worker(words: Set[str], engine: str, strict_reasons: bool) -> None:
+    """Инициализирует процесс пула: кандидат строится один раз при запуске процесса"""
+    global _oracle_words, _candidate, _strict_reasons
+    # Словарь с порядком вставки: обход эталона одинаков во всех процессах и запусках
+    _oracle_words = dict.fromkeys(sorted(words)).keys()
+    _candidate = resolve_engine(engine)(words)
+    _strict_reasons = strict_reasons
+
+
+def _compare(text: str) -> Tuple[Signature, Verdict, Verdict]:
+    expected = reference_filter.contains_profanity(text, _oracle_words)
+    actual = _candidate(text)
+    if expected[0] != actual[0]:
+        return ('verdict', expected[0], actual[0]), expected, actual
+    if _strict_reasons:
+        if expected[1] != actual[1]:
+            return ('reason', expected[1], actual[1]), expected, actual
+    elif reason_kind(expected[1]) != reason_kind(actual[1]):
+        return ('reason', reason_kind(expected[1]), reason_kind(actual[1])), expected, actual
+    return None, expected, actual
+
+
+def ddmin(units: List[str], separator: str, reproduces: Callable[[str], bool]) -> List[str]:
+    """
+    Сокращает последовательность частей текста, пока расхождение воспроизводится (алгоритм ddmin)
+
+    Args:
+        units: Части текста (слова или символы)
+        separator: Строка, которой соединяются части
+        reproduces: Проверяет, воспроизводится ли расхождение на тексте
+
+    Returns:
+        Части, из которых нельзя удалить ни одной группы без потери расхождения
+    """
+    granularity = 2
+    while len(units) >= 2:
+        size = -(-len(units) // granularity)
+        reduced = False
+        for start in range(0, len(units), size):
+            subset = units[start:start + size]
+            complement = units[:start] + units[start + size:]
+            if reproduces(separator.join(subset)):
+                units, granularity, reduced = subset, 2, True
+                break
+            if granularity > 2 and reproduces(separator.join(complement)):
+                units, granularity, reduced = complement, max(granularity - 1, 2), True
+                break
+        if not reduced:
+            if granularity >= len(units):
+                break
+            granularity = min(len(units), granularity * 2)
+    return units
+
+
+def minimize(text: str, signature: Signature) -> str:
+    """Находит кратчайший текст, на котором воспроизводится то же расхождение"""
+    cache: Dict[str, bool] = {}
+
+    def reproduces(candidate: str) -> bool:
+        if candidate not in cache:
+            if len(cache) >= MINIMIZE_BUDGET:
+                return False
+            cache[candidate] = _compare(candidate)[0] == signature
+        return cache[candidate]
+
+    words = ddmin(text.split(), ' ', reproduces)
+    if not reproduces(' '.join(words)):
+        # Расхождение зависит от пробелов между словами: сокращаем исходный текст посимвольно
+        words = [text]
+    return ''.join(ddmin(list(' '.join(words)), '', reproduces))
+
+
+def check_batch(batch: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Проверяет пачку текстов в процессе пула и возвращает сокращенные расхождения"""
+    results = []
+    for source, text in batch:
+        signature, expected, actual = _compare(text)
+        if signature is None:
+            continue
+        minimized = minimize(text, signature)
+        _, minimized_expected, minimized_actual = _compare(minimized)
+        results.append({
+            'type': signature[0],
+            'source': source,
+            'text': text,
+            'minimized': minimized,
+            'reference': list(expected),
+            'candidate': list(actual),
+            'minimized_reference': list(minimized_expected),
+            'minimized_candidate': list(minimized_actual)
+        })
+    return results
+
+
+def word_variants(word: str, rng: random.Random) -> Iterator[str]:
+    """Варианты написания слова словаря и его окружения"""
+    yield word
+    yield word.upper()
+    yield word.capitalize()
+    if 'е' in word:
+        yield word.replace('е', 'ё')
+    if 'ё' in word:
+        yield word.replace('ё', 'е')
+    yield rng.choice(PREFIXES) + word
+    yield word + rng.choice(SUFFIXES)
+    yield word + rng.choice(PUNCTUATION)
+    if len(word) > 4:
+        # Почти совпадающие слова: без последней буквы и с удвоенной буквой
+        yield word[:-1]
+        position = rng.randrange(len(word))
+        yield word[:position] + word[position] + word[position:]
+    clean = rng.choices(CLEAN_WORDS, k=rng.randint(2, 8))
+    clean.insert(rng.randint(0, len(clean)), word)
+    yield ' '.join(clean)
+
+
+def generate_corpus(words: Set[str], sample: int, messages: int, seed: int) -> Iterator[Tuple[str, str]]:
+    """
+    Генерирует корпус: варианты слов словаря, прежние расхождения, слова с основными корнями
+    и случайные сообщения
+
+    Args:
+        words: Слова словаря
+        sample: Сколько слов словаря взять для вариантов (0 — все)
+        messages: Сколько случайных сообщений сгенерировать
+        seed: Начальное значение генератора случайных чисел
+
+    Yields:
+        Пары (источник, текст)
+    """
+    rng = random.Random(seed)
+    ordered = sorted(words)
+    chosen = ordered if not sample or sample >= len(ordered) else rng.sample(ordered, sample)
+    for word in chosen:
+        for text in word_variants(word, rng):
+            yield 'generated', text
+
+    for text in REGRESSION_TEXTS:
+        yield 'regression', text
+
+    for root in KNOWN_ROOTS:
+        for prefix in ('',) + PREFIXES:
+            for suffix in ('',) + SUFFIXES:
+                yield 'generated', prefix + root + suffix
+
+    # make_text использует модуль random, поэтому его состояние тоже задается явно
+    random.seed(seed)
+    single = [word for word in ordered if ' ' not in word] or ordered
+    for _ in range(messages):
+        yield 'generated', make_text(single, random.random() < 0.3)
+
+
+def read_corpus(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Читает записанные сообщения: экспорт Telegram Desktop (.json),
+    JSON Lines с полем text (.jsonl) или текст, по сообщению в строке
+
+    Yields:
+        Пары (источник, текст)
+    """
+    if path.endswith('.json'):
+        for _, message in iter_export_messages(path):
+            if message.get('type') == 'message':
+                text = message_text(message)
+                if text:
+                    yield path, text
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if path.endswith('.jsonl'):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = record if isinstance(record, str) else record.get('text', '')
+            else:
+                text = line.rstrip('\r\n')
+            if text:
+                yield path, text
+
+
+def describe(verdict: List[Any]) -> str:
+    """Описывает результат проверки для отчета"""
+    found, reason = verdict
+    if not found:
+        return "не найдено"
+    return reason or "найдено (без причины)"
+
+
+def batches(items: Iterator[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_corpus(args: argparse.Namespace, words: Set[str]) -> Iterator[Tuple[str, str]]:
+    if not args.no_generated:
+        yield from generate_corpus(words, args.sample, args.messages, args.seed)
+    for path in args.corpus:
+        yield from read_corpus(path)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Дифференциальная проверка фильтра против эталонной реализации")
+    parser.add_argument('--engine', default='cyrillic',
+                        help=f"кандидат: {', '.join(ENGINES)} или module:factory")
+    parser.add_argument('--dictionary', help="файл словаря (по умолчанию — кеш бота с журналом изменений)")
+    parser.add_argument('--corpus', action='append', default=[],
+                        help="записанные сообщения: result.json, .jsonl или текст по строке (можно несколько)")
+    parser.add_argument('--no-generated', action='store_true', help="не генерировать корпус")
+    parser.add_argument('--sample', type=int, default=2000,
+                        help="сколько слов словаря взять для вариантов (0 — все)")
+    parser.add_argument('--messages', type=int, default=5000, help="сколько случайных сообщений сгенерировать")
+    parser.add_argument('--seed', type=int, default=1, help="начальное значение генератора")
+    parser.add_argument('--strict-reasons', action='store_true',
+                        help="сравнивать причины целиком, включая найденные слова")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="количество процессов")
+    parser.add_argument('--batch-size', type=int, default=200, help="текстов в одной пачке")
+    parser.add_argument('--output', help="файл JSON Lines для всех расхождений")
+    parser.add_argument('--show', type=int, default=20, help="сколько сокращенных расхождений вывести")
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        resolve_engine(args.engine)
+        words = set(read_dictionary_file(args.dictionary)['words']) if args.dictionary else load_dictionary()
+    except (OSError, ValueError) as e:
+        logger.error(f"{e}")
+        sys.exit(2)
+    print(f"Словарь: {len(words)} слов, кандидат: {args.engine}, процессов: {args.workers}")
+
+    checked = 0
+    mismatches: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                 initargs=(words, args.engine, args.strict_reasons)) as pool:
+            futures = []
+            for batch in batches(iter_corpus(args, words), args.batch_size):
+                checked += len(batch)
+                futures.append(pool.submit(check_batch, batch))
+            for future in futures:
+                for record in future.result():
+                    mismatches.append(record)
+                    if output is not None:
+                        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка при чтении корпуса: {e}")
+        sys.exit(2)
+    finally:
+        if output is not None:
+            output.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"Проверено текстов: {checked} за {elapsed:.1f} сек.")
+    verdicts = sum(1 for record in mismatches if record['type'] == 'verdict')
+    print(f"Расхождений: {len(mismatches)} (результат: {verdicts}, причина: {len(mismatches) - verdicts})")
+    if not mismatches:
+        return
+
+    # Разные тексты часто сокращаются до одного и того же: выводим каждый сокращенный текст один раз
+    unique = Counter((record['type'], record['minimized']) for record in mismatches)
+    examples = {(record['type'], record['minimized']): record for record in mismatches}
+    print(f"Различных сокращенных расхождений: {len(unique)}")
+    for key, count in unique.most_common(args.show):
+        record = examples[key]
+        print(f"• [{record['type']}, {count} шт.] {record['minimized']!r}\n"
+              f"  эталон:   {describe(record['minimized_reference'])}\n"
+              f"  кандидат: {describe(record['minimized_candidate'])}")
+    if args.output:
+        print(f"Все расхождения записаны в {args.output}")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
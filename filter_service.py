@@ -0,0 +1,380 @@
+"""
+HTTP-сервис проверки текста на нецензурную лексику.
+
+Сервис дает другим приложениям те же решения, что и бот: он загружает тот же словарь
+(кеш-файл с журналом изменений и словари чатов из директории данных) один раз при
+запуске и подменяет его целиком, когда файлы словаря изменяются, или по запросу /reload.
+Каждый запрос проверяется одним снимком словаря, поэтому подмена словаря во время
+проверки пачки не смешивает старые и новые решения.
+
+Эндпоинты:
+    POST /check        {"text": "...", "chat_id": 123, "all": true}
+    POST /check/batch  {"texts": ["...", "..."], "chat_id": 123, "all": true}
+    GET  /health       состояние сервиса и словаря
+    POST /reload       перезагрузить словарь (при FILTER_SERVICE_TOKEN — с заголовком
+                       Authorization: Bearer <токен>)
+
+Примеры запуска:
+    python filter_service.py --port 8080
+    python filter_service.py --benchmark --requests 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+import profanity_filter
+from profanity_filter import (CACHE_FILE, JOURNAL_FILE, DictionarySnapshot, current_snapshot, find_profanity,
+                              first_profanity, initialize_bad_words)
+from chat_dictionaries import ChatDictionaryStore, ChatOverlay
+from constants import (FILTER_MAX_REQUEST_BYTES, FILTER_MAX_TEXT_LENGTH, FILTER_MAX_BATCH_SIZE,
+                       FILTER_RELOAD_INTERVAL, FILTER_BATCH_YIELD_EVERY)
+
+# Загрузка переменных окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FILTER_SERVICE_HOST = os.getenv('FILTER_SERVICE_HOST', '127.0.0.1')
+FILTER_SERVICE_PORT = int(os.getenv('FILTER_SERVICE_PORT', '8080') or 8080)
+# Токен для /reload; без него перезагрузка доступна всем, кто может обратиться к сервису
+FILTER_SERVICE_TOKEN = os.getenv('FILTER_SERVICE_TOKEN')
+
+
+class RequestError(Exception):
+    """Ошибка в запросе клиента: возвращается с указанным HTTP-статусом"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# Ответы в JSON без экранирования кириллицы
+_dumps = functools.partial(json.dumps, ensure_ascii=False)
+
+
+def _json_response(data: Dict[str, Any], status: int = 200) -> web.Response:
+    return web.json_response(data, status=status, dumps=_dumps)
+
+
+def _json_error(message: str, status: int) -> web.Response:
+    return _json_response({'error': message}, status)
+
+
+class FilterService:
+    """Сервис проверки текста: словарь, словари чатов и обработчики запросов"""
+
+    def __init__(self, max_text_length: int = FILTER_MAX_TEXT_LENGTH, max_batch_size: int = FILTER_MAX_BATCH_SIZE,
+                 token: Optional[str] = FILTER_SERVICE_TOKEN):
+        self.max_text_length = max_text_length
+        self.max_batch_size = max_batch_size
+        self.token = token
+        self.overlays = ChatDictionaryStore()
+        self.chat_dictionaries = 0
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self.requests = 0
+        self.texts = 0
+        self._reload_lock = asyncio.Lock()
+        self._watch_mtimes: Tuple[Optional[float], ...] = ()
+        self._watcher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _mtimes() -> Tuple[Optional[float], ...]:
+        mtimes = []
+        for path in (CACHE_FILE, JOURNAL_FILE):
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    async def reload(self) -> None:
+        """Загружает словарь и словари чатов заново и подменяет их целиком"""
+        async with self._reload_lock:
+            # Время изменения запоминается до чтения: запись во время загрузки вызовет еще одну перезагрузку
+            mtimes = self._mtimes()
+            started = time.perf_counter()
+            await initialize_bad_words()
+            overlays = ChatDictionaryStore()
+            self.chat_dictionaries = await asyncio.to_thread(overlays.load_all)
+            self.overlays = overlays
+            self._watch_mtimes = mtimes
+            self.loaded_at = time.time()
+            if self.reloads:
+                logger.info(f"Словарь перезагружен за {time.perf_counter() - started:.2f} сек.")
+            self.reloads += 1
+
+    async def _watch(self) -> None:
+        """Перезагружает словарь, когда изменяются кеш-файл или журнал изменений"""
+        while True:
+            await asyncio.sleep(FILTER_RELOAD_INTERVAL)
+            mtimes = self._mtimes()
+            # Удаленный кеш (принудительное обновление в боте) не перечитываем: ждем новый файл
+            if mtimes != self._watch_mtimes and mtimes[0] is not None:
+                logger.info("Файлы словаря изменились, перезагружаем словарь")
+                try:
+                    await self.reload()
+                except Exception as e:
+                    logger.error(f"Ошибка при перезагрузке словаря: {e}")
+
+    def _parse_text(self, text: Any) -> str:
+        if not isinstance(text, str):
+            raise RequestError("поле text должно быть строкой")
+        if len(text) > self.max_text_length:
+            raise RequestError(f"текст длиннее {self.max_text_length} символов", 413)
+        return text
+
+    @staticmethod
+    def _parse_chat_id(data: Dict[str, Any]) -> Optional[int]:
+        chat_id = data.get('chat_id')
+        if chat_id is not None and (not isinstance(chat_id, int) or isinstance(chat_id, bool)):
+            raise RequestError("поле chat_id должно быть целым числом")
+        return chat_id
+
+    @staticmethod
+    async def _read_json(request: web.Request) -> Dict[str, Any]:
+        try:
+            data = await request.json()
+        except ValueError as e:
+            raise RequestError(f"некорректный JSON: {e}")
+        if not isinstance(data, dict):
+            raise RequestError("тело запроса должно быть JSON-объектом")
+        return data
+
+    @staticmethod
+    def check(text: str, overlay: Optional[ChatOverlay], snapshot: DictionarySnapshot,
+              all_matches: bool = True) -> Dict[str, Any]:
+        """
+        Проверяет один текст
+
+        Args:
+            text: Текст
+            overlay: Словарь чата
+            snapshot: Снимок словаря, общий для всего запроса
+            all_matches: Вернуть все найденные фрагменты, а не только первый
+
+        Returns:
+            Решение: profane, reason и matches
+        """
+        if all_matches:
+            matches = find_profanity(text, overlay, snapshot)
+        else:
+            match = first_profanity(text, overlay, snapshot)
+            matches = [match] if match else []
+        return {
+            'profane': bool(matches),
+            'reason': matches[0].reason if matches else None,
+            'matches': [match.to_dict(text) for match in matches]
+        }
+
+    async def handle_check(self, request: web.Request) -> web.Response:
+        try:
+            data = await self._read_json(request)
+            text = self._parse_text(data.get('text'))
+            chat_id = self._parse_chat_id(data)
+        except RequestError as e:
+            return _json_error(str(e), e.status)
+
+        overlay = self.overlays.get(chat_id) if chat_id is not None else None
+        self.requests += 1
+        self.texts += 1
+        return _json_response(self.check(text, overlay, current_snapshot(), bool(data.get('all', True))))
+
+    async def handle_batch(self, request: web.Request) -> web.Response:
+        try:
+            data = await self._read_json(request)
+            texts = data.get('texts')
+            if not isinstance(texts, list):
+                raise RequestError("поле texts должно быть списком строк")
+            if len(texts) > self.max_batch_size:
+                raise RequestError(f"в пачке больше {self.max_batch_size} текстов", 413)
+            texts = [self._parse_text(text) for text in texts]
+            chat_id = self._parse_chat_id(data)
+        except RequestError as e:
+            return _json_error(str(e), e.status)
+
+        overlay = self.overlays.get(chat_id) if chat_id is not None else None
+        snapshot = current_snapshot()
+        all_matches = bool(data.get('all', True))
+        results = []
+        for index, text in enumerate(texts, 1):
+            results.append(self.check(text, overlay, snapshot, all_matches))
+            # Большая пачка не должна надолго занимать цикл событий
+            if index % FILTER_BATCH_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        self.requests += 1
+        self.texts += len(texts)
+        return _json_response({'results': results})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        snapshot = current_snapshot()
+        loaded_at = datetime.fromtimestamp(self.loaded_at, timezone.utc).isoformat() if self.loaded_at else None
+        return _json_response({
+            'status': 'ok' if self.loaded_at else 'loading',
+            'words': len(snapshot.words),
+            'translit': snapshot.translit is not None,
+            'fuzzy': snapshot.fuzzy is not None,
+            'chat_dictionaries': self.chat_dictionaries,
+            'loaded_at': loaded_at,
+            'reloads': max(self.reloads - 1, 0),
+            'requests': self.requests,
+            'texts': self.texts
+        })
+
+    async def handle_reload(self, request: web.Request) -> web.Response:
+        if self.token and request.headers.get('Authorization') != f"Bearer {self.token}":
+            return _json_error("требуется токен", 401)
+        try:
+            await self.reload()
+        except Exception as e:
+            logger.error(f"Ошибка при перезагрузке словаря: {e}")
+            return _json_error(f"ошибка при перезагрузке словаря: {e}", 500)
+        return _json_response({'status': 'ok', 'words': len(profanity_filter.BAD_WORDS)})
+
+    async def _on_startup(self, app: web.Application) -> None:
+        await self.reload()
+        self._watcher = asyncio.create_task(self._watch())
+        logger.info(f"Сервис готов: {len(profanity_filter.BAD_WORDS)} слов, словарей чатов: {self.chat_dictionaries}")
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+    def app(self) -> web.Application:
+        """Создает приложение aiohttp; размер тела запроса ограничен FILTER_MAX_REQUEST_BYTES"""
+        app = web.Application(client_max_size=FILTER_MAX_REQUEST_BYTES)
+        app.router.add_post('/check', self.handle_check)
+        app.router.add_post('/check/batch', self.handle_batch)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_post('/reload', self.handle_reload)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(session, url: str, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/health") as response:
+                if (await response.json()).get('status') == 'ok':
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"сервис {url} не запустился за {timeout:.0f} сек.")
+
+
+async def _run_load(session, url: str, payloads: List[Dict[str, Any]], concurrency: int) -> Tuple[float, List[float]]:
+    """Отправляет запросы с заданным числом одновременных клиентов; возвращает время и задержки"""
+    latencies: List[float] = []
+    queue = iter(payloads)
+
+    async def client() -> None:
+        for payload in queue:
+            started = time.perf_counter()
+            async with session.post(url, json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"ответ {response.status} на {url}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+async def benchmark(args: argparse.Namespace) -> None:
+    """Измеряет запросы в секунду для /check и тексты в секунду для /check/batch"""
+    import random
+    import aiohttp
+    from load_test import make_text, percentile
+
+    random.seed(args.seed)
+    server = None
+    url = args.url
+    if url is None:
+        # Сервис запускается отдельным процессом, чтобы клиент не делил с ним процессор
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--host', '127.0.0.1',
+                                   '--port', str(port), '--log-level', 'WARNING'])
+    url = url.rstrip('/')
+
+    words = profanity_filter.load_cached_bad_words() or profanity_filter.FALLBACK_BAD_WORDS
+    bad_words = sorted(w for w in words if ' ' not in w)
+    texts = [make_text(bad_words, random.random() < args.profanity_ratio) for _ in range(args.requests)]
+
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await _wait_ready(session, url)
+
+            elapsed, latencies = await _run_load(session, f"{url}/check", [{'text': t} for t in texts],
+                                                 args.concurrency)
+            print("=== /check ===")
+            print(f"Запросов: {len(texts)} за {elapsed:.2f} сек. ({len(texts) / elapsed:.0f} запр./сек.), "
+                  f"клиентов: {args.concurrency}")
+            print(f"Задержка, мс: p50={percentile(latencies, 50) * 1000:.2f} "
+                  f"p90={percentile(latencies, 90) * 1000:.2f} p99={percentile(latencies, 99) * 1000:.2f}")
+
+            batches = [{'texts': texts[i:i + args.batch_size]} for i in range(0, len(texts), args.batch_size)]
+            elapsed, latencies = await _run_load(session, f"{url}/check/batch", batches,
+                                                 max(1, min(args.concurrency, len(batches))))
+            print(f"=== /check/batch (по {args.batch_size} текстов) ===")
+            print(f"Пачек: {len(batches)} за {elapsed:.2f} сек. ({len(batches) / elapsed:.1f} пачек/сек., "
+                  f"{len(texts) / elapsed:.0f} текстов/сек.)")
+            print(f"Задержка пачки, мс: p50={percentile(latencies, 50) * 1000:.2f} "
+                  f"p99={percentile(latencies, 99) * 1000:.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HTTP-сервис проверки текста на нецензурную лексику")
+    parser.add_argument('--host', default=FILTER_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=FILTER_SERVICE_PORT)
+    parser.add_argument('--benchmark', action='store_true', help="измерить производительность сервиса")
+    parser.add_argument('--url', help="адрес уже запущенного сервиса для --benchmark "
+                                      "(по умолчанию сервис запускается отдельным процессом)")
+    parser.add_argument('--requests', type=int, default=5000, help="количество текстов в тесте")
+    parser.add_argument('--concurrency', type=int, default=50, help="одновременных клиентов")
+    parser.add_argument('--batch-size', type=int, default=100, help="текстов в одной пачке")
+    parser.add_argument('--profanity-ratio', type=float, default=0.2, help="доля текстов с матом")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.benchmark:
+        asyncio.run(benchmark(args))
+        return
+    web.run_app(FilterService().app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
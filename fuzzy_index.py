@@ -0,0 +1,214 @@
+"""
+Индекс удалений для поиска нецензурных слов с опечатками (расстояние редактирования 1).
+
+Как в алгоритме SymSpell, для каждого слова словаря один раз, при загрузке словаря,
+в индекс записываются само слово и все варианты с одной удаленной буквой. Слово
+сообщения находится на расстоянии 1 от слова словаря (замена, вставка, удаление
+или перестановка соседних букв), только если у них есть общий вариант из этого
+набора, поэтому проверка слова стоит len(слово) + 1 обращений к словарю Python,
+а не сравнения со всеми словами словаря. Найденные кандидаты перепроверяются
+точным сравнением.
+
+Короткие слова не индексируются и не проверяются: у слов из пяти букв и короче
+слишком много безобидных соседей ("сука" — "скука", "сучка" — "сушка", "шлюха" — "шлюпа").
+Опечатка не должна менять согласные слова словаря ("херой" — "херной"), а слова из
+списка обычных слов русского языка (RUSSIAN_WORDS_FILE в profanity_filter.py) не
+проверяются вовсе.
+В ключах индекса хранятся хеши вариантов, а не строки, что в несколько раз
+уменьшает расход памяти; совпадение хешей перепроверяется тем же точным сравнением.
+"""
+
+import logging
+import re
+import sys
+from typing import AbstractSet, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple, Union
+
+from constants import FUZZY_MIN_WORD_LENGTH, FUZZY_MEMORY_BUDGET_MB
+
+logger = logging.getLogger(__name__)
+
+# Обычные слова, отличающиеся от нецензурных одной буквой
+FUZZY_STOPWORDS = frozenset({
+    "мужак", "мужака", "мужаки", "дебит", "дебита", "дебиты", "спать", "спали", "спала",
+    "мандат", "манна", "манга", "пицца", "сраться", "шлюза"
+})
+
+_CYRILLIC_WORD = re.compile('[а-я]+')
+
+# Гласные и знаки, не входящие в согласный остов слова
+_NOT_SKELETON = str.maketrans('', '', 'аеиоуыэюяйьъ')
+
+# Примерный расход памяти на элемент словаря Python: ячейка хеш-таблицы и ключ int
+_ENTRY_OVERHEAD = 80
+
+
+def _deletions(word: str) -> Iterator[str]:
+    """Варианты слова с одной удаленной буквой"""
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1:]
+
+
+def consonant_skeleton(word: str) -> str:
+    """Возвращает согласные слова в исходном порядке ("шлюха" -> "шлх")"""
+    return word.translate(_NOT_SKELETON)
+
+
+def load_common_words(path: str) -> FrozenSet[str]:
+    """
+    Читает список обычных слов: по одному на строку, строки с '#' пропускаются
+
+    Args:
+        path: Путь к файлу списка
+
+    Returns:
+        Слова в нижнем регистре с нормализованной 'ё' вместе с FUZZY_STOPWORDS;
+        без файла — только FUZZY_STOPWORDS
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            words = {line.strip().lower().replace('ё', 'е') for line in f
+                     if line.strip() and not line.startswith('#')}
+    except OSError as e:
+        logger.warning(f"Список обычных слов {path} не прочитан: {e}")
+        return FUZZY_STOPWORDS
+    return FUZZY_STOPWORDS | words
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """
+    Проверяет, что строки отличаются не больше чем на одну замену, вставку,
+    удаление или перестановку соседних букв (расстояние Дамерау — Левенштейна ≤ 1)
+    """
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    # Общее начало
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la < lb:
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+
+
+class DeletionIndex:
+    """
+    Индекс удалений: хеш варианта -> слово словаря (или кортеж слов при совпадении вариантов).
+    Объект не изменяется после создания: при добавлении слов создается новый.
+    """
+
+    __slots__ = ('keys', 'words', 'memory', 'truncated', 'common_words')
+
+    def __init__(self, keys: Dict[int, Union[str, Tuple[str, ...]]],
+                 common_words: AbstractSet[str] = FUZZY_STOPWORDS):
+        self.keys = keys
+        # Количество проиндексированных слов словаря
+        self.words = 0
+        # Оценка расхода памяти в байтах
+        self.memory = 0
+        # Слова не поместились в бюджет памяти и проиндексированы не все
+        self.truncated = False
+        # Обычные слова: слово сообщения из этого списка не проверяется
+        self.common_words = common_words
+
+    @classmethod
+    def build(cls, dictionary: Iterable[str],
+              common_words: AbstractSet[str] = FUZZY_STOPWORDS) -> 'DeletionIndex':
+        """
+        Строит индекс для слов словаря (блокирующая операция)
+
+        Args:
+            dictionary: Слова словаря
+            common_words: Обычные слова, которые не проверяются
+        """
+        index = cls({}, common_words)
+        index._add(dictionary)
+        index.log_report()
+        return index
+
+    def with_words(self, words: Iterable[str]) -> 'DeletionIndex':
+        """Возвращает новый индекс с добавленными словами"""
+        index = DeletionIndex(dict(self.keys), self.common_words)
+        index.words, index.memory, index.truncated = self.words, self.memory, self.truncated
+        index._add(words)
+        return index
+
+    def _add(self, dictionary: Iterable[str]) -> None:
+        budget = FUZZY_MEMORY_BUDGET_MB * 1024 * 1024
+        keys = self.keys
+        # Короткие слова индексируются первыми: у них меньше вариантов, а поиск по корню их не заменяет
+        candidates = sorted({word.replace('ё', 'е') for word in dictionary}, key=lambda word: (len(word), word))
+        for word in candidates:
+            if len(word) < FUZZY_MIN_WORD_LENGTH or not _CYRILLIC_WORD.fullmatch(word):
+                continue
+            if self.memory >= budget:
+                self.truncated = True
+                break
+            self.words += 1
+            self.memory += sys.getsizeof(word)
+            for variant in (word, *_deletions(word)):
+                key = hash(variant)
+                current = keys.get(key)
+                if current is None:
+                    keys[key] = word
+                    self.memory += _ENTRY_OVERHEAD
+                elif current != word and (isinstance(current, str) or word not in current):
+                    keys[key] = (current, word) if isinstance(current, str) else current + (word,)
+                    self.memory += sys.getsizeof(keys[key])
+
+    def log_report(self) -> None:
+        """Пишет в лог размер индекса и его долю от бюджета памяти"""
+        used_mb = self.memory / (1024 * 1024)
+        logger.info(f"Индекс опечаток: {self.words} слов, {len(self.keys)} ключей, "
+                    f"~{used_mb:.1f} МБ из {FUZZY_MEMORY_BUDGET_MB} МБ")
+        if self.truncated:
+            logger.warning("Индекс опечаток не поместился в бюджет памяти: длинные слова не проиндексированы")
+
+    def report(self) -> Dict[str, Union[int, float, bool]]:
+        """Возвращает показатели индекса для отчетов"""
+        return {
+            'words': self.words,
+            'keys': len(self.keys),
+            'memory_mb': round(self.memory / (1024 * 1024), 2),
+            'budget_mb': FUZZY_MEMORY_BUDGET_MB,
+            'truncated': self.truncated
+        }
+
+    def lookup(self, token: str) -> Optional[str]:
+        """
+        Ищет слово словаря на расстоянии редактирования 1 от слова сообщения
+
+        Args:
+            token: Слово кириллицей в нижнем регистре с нормализованной буквой 'ё'
+
+        Returns:
+            Слово словаря или None
+        """
+        if len(token) < FUZZY_MIN_WORD_LENGTH or token in self.common_words:
+            return None
+        keys = self.keys
+        skeleton = None
+        for variant in (token, *_deletions(token)):
+            found = keys.get(hash(variant))
+            if found is None:
+                continue
+            for entry in ((found,) if isinstance(found, str) else found):
+                # Первая буква опечаткой почти не бывает, а ее замена дает много обычных слов
+                if entry[0] != token[0] or not within_one_edit(token, entry):
+                    continue
+                # Замена, вставка или удаление согласной чаще дает другое слово, чем опечатку
+                # ("сушка", "херной"), поэтому согласные кандидата должны совпадать с согласными слова
+                if skeleton is None:
+                    skeleton = consonant_skeleton(token)
+                if consonant_skeleton(entry) == skeleton:
+                    return entry
+        return None
+
+    def __len__(self) -> int:
+        return len(self.keys)
@@ -1,12 +1,12 @@
 """
-Модуль для работы с различными API для получения GIF-изображений
+Модуль для работы с различными API для получения GIF-изображений.
+Запросы всех ботов процесса идут через одну HTTP-сессию с общим пулом соединений.
 """
 
 import os
-import aiohttp
 import logging
 import random
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
 from dotenv import load_dotenv
 
 from constants import (
@@ -14,6 +14,10 @@ from constants import (
     FORCE_NO_PARAM, ERROR_THRESHOLD
 )
 from utils import retry_on_timeout_gif
+import tracing
+
+if TYPE_CHECKING:
+    import aiohttp
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -27,15 +31,44 @@ api_error_count = {
     'cataas': 0
 }
 
-async def get_gif_url() -> Tuple[Optional[str], str]:
+# Общая HTTP-сессия для запросов к GIF API, создается при первом запросе
+_session: Optional['aiohttp.ClientSession'] = None
+
+def get_session() -> 'aiohttp.ClientSession':
+    """
+    Возвращает общую HTTP-сессию: соединения с GIF API переиспользуются
+    всеми ботами процесса, а не открываются заново на каждый запрос
+    """
+    global _session
+    # aiohttp импортируется при первом запросе GIF, а не при запуске
+    import aiohttp
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    return _session
+
+async def close_session() -> None:
+    """Закрывает общую HTTP-сессию при остановке"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def get_gif_url(api_source: Optional[str] = None) -> Tuple[Optional[str], str]:
     """
     Получает URL GIF-изображения с выбранного API
 
+    Args:
+        api_source: Предпочтительный API бота (по умолчанию — из переменной окружения API_SOURCE)
+
     Returns:
         Tuple[Optional[str], str]: (URL GIF-изображения или None в случае ошибки, название использованного API)
     """
-    # Повторно считываем переменную окружения для уверенности
-    api_source = os.getenv('API_SOURCE', 'yesno').lower()
+    if api_source is None:
+        # Повторно считываем переменную окружения для уверенности
+        api_source = os.getenv('API_SOURCE', 'yesno').lower()
+    if api_source not in api_error_count:
+        api_source = 'yesno'
 
     # Проверяем счетчик ошибок и переключаем API если нужно
     if api_error_count[api_source] >= ERROR_THRESHOLD:
@@ -74,16 +107,16 @@ async def get_yesno_gif() -> Optional[str]:
         URL GIF-изображения или None в случае ошибки
     """
     async def _get_gif():
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            async with session.get(YESNO_API_URL + FORCE_NO_PARAM) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('image')
-                else:
-                    logging.error(f"yesno API вернул статус: {response.status}")
-                    return None
-
-    return await retry_on_timeout_gif(_get_gif)
+        async with get_session().get(YESNO_API_URL + FORCE_NO_PARAM) as response:
+            if response.status == 200:
+                data = await response.json()
+                return data.get('image')
+            else:
+                logging.error(f"yesno API вернул статус: {response.status}")
+                return None
+
+    with tracing.span('gif.yesno'):
+        return await retry_on_timeout_gif(_get_gif)
 
 async def get_cat_gif() -> Optional[str]:
     """
@@ -101,14 +134,14 @@ async def get_cat_gif() -> Optional[str]:
         url = url + random_param
 
         async def _get_gif():
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        return url
-                    logging.error(f"cataas API вернул статус: {response.status}")
-                    return None
+            async with get_session().get(url) as response:
+                if response.status == 200:
+                    return url
+                logging.error(f"cataas API вернул статус: {response.status}")
+                return None
 
-        return await retry_on_timeout_gif(_get_gif)
+        with tracing.span('gif.cataas'):
+            return await retry_on_timeout_gif(_get_gif)
 
     except Exception as e:
         logging.error(f"Ошибка при подготовке URL для cataas API: {e}")
@@ -0,0 +1,370 @@
+"""
+Нагрузочное тестирование бота с локальными заглушками Telegram Bot API и GIF API.
+
+Скрипт поднимает локальный HTTP-сервер, который изображает Bot API
+(getUpdates/sendAnimation/sendMessage), yesno.wtf и cataas.com с настраиваемыми
+задержками и долей ошибок, подключает к нему неизмененный диспетчер `dp` из bot.py
+и проигрывает синтетический поток сообщений из нескольких чатов.
+
+Пример запуска:
+    python load_test.py --chats 50 --messages 5000 --rate 500 --gif-latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+FAKE_TOKEN = "123456789:LOADTEST"
+
+# Слова для составления сообщений без нецензурной лексики
+CLEAN_WORDS = [
+    "привет", "как", "дела", "сегодня", "погода", "хорошая", "встреча", "завтра",
+    "работа", "проект", "отчет", "код", "ревью", "обед", "кофе", "отлично", "спасибо"
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Возвращает перцентиль q (0..100) для отсортированного списка"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class FakeServer:
+    """Заглушка Telegram Bot API и API GIF-изображений"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.updates: List[Dict[str, Any]] = []
+        self.new_updates = asyncio.Condition()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.base_url = ""
+        # (chat_id, message_id) -> момент отправки сообщения в поток обновлений
+        self.sent_at: Dict[Tuple[int, int], float] = {}
+        self.latencies: List[float] = []
+        self.replies = 0
+        self.unexpected_replies = 0
+        self.replied = set()
+        # Режим REPLY_FIRST: текстовые ответы, замененные GIF
+        self.upgraded = 0
+        self.deleted = 0
+        self.acknowledged = 0
+        self.last_ack_time = 0.0
+        self.telegram_errors = {'429': 0, '500': 0}
+        self.gif_errors = {'yesno': 0, 'cataas': 0}
+        self.gif_requests = {'yesno': 0, 'cataas': 0}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_bot_api)
+        app.router.add_get('/api', self.handle_yesno)
+        app.router.add_get('/cat/gif', self.handle_cataas)
+        app.router.add_get('/gif/{name}', self.handle_gif)
+        return app
+
+    async def push_message(self, chat_id: int, user_id: int, text: str) -> int:
+        """Добавляет сообщение в поток обновлений и возвращает его message_id"""
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        update = {
+            'update_id': self.next_update_id,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'supergroup', 'title': f"Чат {chat_id}"},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"Пользователь {user_id}"},
+                'text': text
+            }
+        }
+        self.next_update_id += 1
+        self.sent_at[(chat_id, message_id)] = time.perf_counter()
+        async with self.new_updates:
+            self.updates.append(update)
+            self.new_updates.notify_all()
+        return message_id
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        params = dict(request.query)
+        if request.method == 'POST':
+            if request.content_type == 'application/json':
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_bot_api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await self._params(request)
+
+        if method == 'getUpdates':
+            return self._ok(await self._get_updates(params))
+        if method == 'getMe':
+            return self._ok({'id': 123456789, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'})
+        if method in ('deleteWebhook', 'setWebhook'):
+            return self._ok(True)
+        if method in ('sendAnimation', 'sendMessage'):
+            return await self._send(method, params)
+        if method == 'deleteMessage':
+            self.deleted += 1
+            return self._ok(True)
+        return web.json_response({'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404)
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # Подтвержденные обновления (id меньше offset) удаляем
+        before = len(self.updates)
+        if offset > 0:
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+        if len(self.updates) != before:
+            self.acknowledged += before - len(self.updates)
+            self.last_ack_time = time.perf_counter()
+
+        async with self.new_updates:
+            if not self.updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(self.new_updates.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.updates[:limit]
+
+    async def _send(self, method: str, params: Dict[str, Any]) -> web.Response:
+        if self.args.telegram_latency:
+            await asyncio.sleep(self.args.telegram_latency)
+
+        if random.random() < self.args.telegram_error_rate:
+            if random.random() < 0.5:
+                self.telegram_errors['429'] += 1
+                return web.json_response({
+                    'ok': False, 'error_code': 429,
+                    'description': 'Too Many Requests: retry after 1',
+                    'parameters': {'retry_after': 1}
+                }, status=429)
+            self.telegram_errors['500'] += 1
+            return web.json_response({'ok': False, 'error_code': 500, 'description': 'Internal Server Error'},
+                                     status=500)
+
+        chat_id = int(params['chat_id'])
+        reply_to = params.get('reply_to_message_id')
+        key = (chat_id, int(reply_to)) if reply_to else None
+        started = self.sent_at.get(key) if key else None
+        if started is not None and key not in self.replied:
+            self.replied.add(key)
+            self.replies += 1
+            self.latencies.append(time.perf_counter() - started)
+        elif self.args.reply_first and key in self.replied and method == 'sendAnimation':
+            # Задержка считается по первому, текстовому ответу
+            self.upgraded += 1
+        else:
+            self.unexpected_replies += 1
+
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        result = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': f"Чат {chat_id}"},
+            'from': {'id': 123456789, 'is_bot': True, 'first_name': 'LoadTest'}
+        }
+        if method == 'sendMessage':
+            result['text'] = params.get('text', '')
+        else:
+            result['animation'] = {'file_id': 'fake', 'file_unique_id': 'fake', 'width': 1, 'height': 1, 'duration': 1}
+            result['caption'] = params.get('caption', '')
+        return self._ok(result)
+
+    async def _gif_api(self, name: str) -> Optional[web.Response]:
+        self.gif_requests[name] += 1
+        if self.args.gif_latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.args.gif_latency)
+        if random.random() < self.args.gif_error_rate:
+            self.gif_errors[name] += 1
+            return web.Response(status=500)
+        return None
+
+    async def handle_yesno(self, request: web.Request) -> web.Response:
+        error = await self._gif_api('yesno')
+        if error is not None:
+            return error
+        return web.json_response({'answer': 'no', 'forced': True, 'image': f"{self.base_url}/gif/no.gif"})
+
+    async def handle_cataas(self, request: web.Request) -> web.Response:
+        error = await self._gif_api('cataas')
+        if error is not None:
+            return error
+        return web.Response(body=b'GIF89a', content_type='image/gif')
+
+    async def handle_gif(self, request: web.Request) -> web.Response:
+        return web.Response(body=b'GIF89a', content_type='image/gif')
+
+
+def make_text(bad_words: List[str], profane: bool) -> str:
+    """Составляет синтетическое сообщение"""
+    words = random.choices(CLEAN_WORDS, k=random.randint(3, 12))
+    if profane:
+        words.insert(random.randint(0, len(words)), random.choice(bad_words))
+    return " ".join(words)
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    server = FakeServer(args)
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+    port = runner.addresses[0][1]
+    server.base_url = f"http://127.0.0.1:{port}"
+
+    # Бот должен обращаться к заглушкам, поэтому окружение задается до импорта bot.py
+    os.environ.update({
+        'BOT_TOKEN': FAKE_TOKEN,
+        'ENVIRONMENT': 'development',
+        'API_SOURCE': args.api_source,
+        'TELEGRAM_API_URL': server.base_url,
+        'YESNO_API_URL': f"{server.base_url}/api",
+        'CATAAS_API_URL': f"{server.base_url}/cat/gif",
+        'SHARD_WORKERS': '0',
+        'OVERFLOW_POLICY': args.overflow_policy,
+        'REPLY_FIRST': 'true' if args.reply_first else 'false'
+    })
+    os.environ.pop('ADMIN_ID', None)
+    os.makedirs('data', exist_ok=True)
+
+    import logging
+    import bot as bot_module
+    import profanity_filter
+    from send_queue import send_scheduler
+    from gif_service import close_session
+
+    # bot.py регистрирует обработчики сигналов для рабочего режима, здесь они не нужны
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+
+    if args.dictionary == 'cache':
+        words = profanity_filter.load_cached_bad_words()
+        if words is None:
+            print("Кеш словаря не найден, используется базовый набор слов")
+        else:
+            profanity_filter.set_bad_words(words)
+    bad_words = sorted(w for w in profanity_filter.BAD_WORDS if ' ' not in w)
+
+    if args.no_rate_limit:
+        send_scheduler.set_global_rate(1_000_000)
+        send_scheduler.private_chat_rate = 1_000_000
+        send_scheduler.group_chat_rate = 1_000_000
+    send_scheduler.start()
+
+    dp = bot_module.dp
+    dp.update_pool.start(dp)
+    polling = asyncio.create_task(dp.start_polling(timeout=1, relax=0))
+
+    chats = [-1000000000000 - i for i in range(args.chats)]
+    expected = 0
+    interval = 1 / args.rate if args.rate > 0 else 0
+    started = time.perf_counter()
+    for i in range(args.messages):
+        profane = random.random() < args.profanity_ratio
+        text = make_text(bad_words, profane)
+        # Ответ ожидается только если фильтр действительно считает текст нецензурным
+        if profanity_filter.contains_profanity(text)[0]:
+            expected += 1
+        await server.push_message(random.choice(chats), random.randint(1, args.users), text)
+        if interval:
+            next_at = started + (i + 1) * interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    injected_in = time.perf_counter() - started
+
+    # Ждем, пока бот обработает все обновления и отправит ответы
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        if server.acknowledged >= args.messages and server.replies >= expected:
+            # В режиме REPLY_FIRST ждем и замены ответов на GIF, пока бот еще что-то обрабатывает
+            busy = dp.update_pool.default.busy or send_scheduler.queue_size or bot_module.upgrade_tasks
+            if not args.reply_first or server.upgraded >= expected or not busy:
+                break
+        await asyncio.sleep(0.05)
+    finished = time.perf_counter()
+
+    dp.stop_polling()
+    await dp.wait_closed()
+    polling.cancel()
+    await dp.update_pool.stop(timeout=1)
+    await send_scheduler.stop(timeout=1)
+    await dp.bot.close()
+    await close_session()
+    await runner.cleanup()
+
+    latencies = sorted(server.latencies)
+    processed_in = (server.last_ack_time or finished) - started
+    print()
+    print("=== Результаты нагрузочного теста ===")
+    print(f"Сообщений отправлено: {args.messages} за {injected_in:.2f} сек. "
+          f"({args.messages / injected_in:.1f} сообщ./сек.)")
+    if processed_in > 0:
+        print(f"Обновлений получено ботом: {server.acknowledged} за {processed_in:.2f} сек. "
+              f"({server.acknowledged / processed_in:.1f} сообщ./сек.)")
+    print(f"Ожидалось ответов: {expected}, получено: {server.replies}, "
+          f"без ответа: {max(0, expected - server.replies)}, лишних: {server.unexpected_replies}")
+    if latencies:
+        print(f"Задержка ответа, сек.: p50={percentile(latencies, 50):.3f} p90={percentile(latencies, 90):.3f} "
+              f"p99={percentile(latencies, 99):.3f} max={latencies[-1]:.3f}")
+    if args.reply_first:
+        print(f"Ответов, замененных GIF: {server.upgraded}, удалено текстовых ответов: {server.deleted}")
+    print(f"Ошибки Bot API (внедренные): 429={server.telegram_errors['429']} 500={server.telegram_errors['500']}")
+    print(f"Запросы GIF API: yesno={server.gif_requests['yesno']} cataas={server.gif_requests['cataas']}, "
+          f"ошибки: yesno={server.gif_errors['yesno']} cataas={server.gif_errors['cataas']}")
+    print(f"Очередь отправки: отправлено {send_scheduler.sent_count}, ошибок {send_scheduler.failed_count}, "
+          f"retry_after {send_scheduler.retry_after_count}, отброшено {send_scheduler.dropped_count}, "
+          f"осталось в очереди {send_scheduler.queue_size}")
+    print(dp.update_pool.format_metrics())
+    print(f"Общее время теста: {finished - started:.2f} сек.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальными заглушками API")
+    parser.add_argument('--chats', type=int, default=20, help="количество чатов")
+    parser.add_argument('--users', type=int, default=100, help="количество пользователей")
+    parser.add_argument('--messages', type=int, default=1000, help="количество сообщений")
+    parser.add_argument('--rate', type=float, default=200, help="сообщений в секунду (0 — без ограничения)")
+    parser.add_argument('--profanity-ratio', type=float, default=0.2, help="доля сообщений с матом")
+    parser.add_argument('--gif-latency', type=float, default=0.1, help="средняя задержка GIF API, сек.")
+    parser.add_argument('--gif-error-rate', type=float, default=0.0, help="доля ошибок GIF API")
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help="задержка отправки сообщений, сек.")
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help="доля ошибок 429/500 при отправке")
+    parser.add_argument('--api-source', choices=['yesno', 'cataas'], default='yesno')
+    parser.add_argument('--dictionary', choices=['fallback', 'cache'], default='fallback',
+                        help="базовый набор слов или кеш из директории данных")
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help="снять лимиты Telegram в очереди отправки")
+    parser.add_argument('--overflow-policy', choices=['drop_oldest', 'degrade'], default='drop_oldest',
+                        help="политика переполнения очереди обработки обновлений")
+    parser.add_argument('--reply-first', action='store_true',
+                        help="сразу отвечать текстом и заменять ответ GIF (REPLY_FIRST)")
+    parser.add_argument('--drain-timeout', type=float, default=30, help="время ожидания ответов после отправки")
+    parser.add_argument('--port', type=int, default=0, help="порт заглушки (0 — любой свободный)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
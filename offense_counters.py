@@ -0,0 +1,214 @@
+"""
+Модуль счетчиков нарушений: сколько раз каждый пользователь ругался в каждом чате.
+
+Счетчики хранятся в памяти, и учет нарушения в process_message не обращается
+к диску. Измененные записи периодически, пачкой, записываются в локальную базу
+SQLite в режиме WAL; запись выполняется в отдельном потоке, не блокируя цикл
+событий. В базу пишутся итоговые значения счетчиков, а не приращения, поэтому
+повторная запись той же пачки после ошибки ничего не искажает. При запуске
+счетчики восстанавливаются из базы.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from constants import OFFENSE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS offenses (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    last_at INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (chat_id, user_id)
+) WITHOUT ROWID
+"""
+
+_UPSERT = """
+INSERT INTO offenses (chat_id, user_id, count, last_at, name) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (chat_id, user_id) DO UPDATE SET
+    count = excluded.count, last_at = excluded.last_at, name = excluded.name
+"""
+
+
+class OffenseRecord:
+    """Счетчик нарушений одного пользователя в одном чате"""
+
+    __slots__ = ('count', 'last_at', 'name')
+
+    def __init__(self, count: int = 0, last_at: int = 0, name: str = ''):
+        self.count = count
+        # Время последнего нарушения (Unix time, секунды)
+        self.last_at = last_at
+        # Имя пользователя на момент последнего нарушения (для таблицы лидеров)
+        self.name = name
+
+
+class OffenseCounters:
+    """Счетчики нарушений в памяти с периодической записью в SQLite"""
+
+    def __init__(self, path: str, flush_interval: float = OFFENSE_FLUSH_INTERVAL):
+        """
+        Args:
+            path: Файл базы SQLite
+            flush_interval: Период записи измененных счетчиков, секунды
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        # ID чата -> ID пользователя -> счетчик
+        self._chats: Dict[int, Dict[int, OffenseRecord]] = {}
+        # Записи, измененные после последней записи в базу
+        self._dirty: Dict[Tuple[int, int], OffenseRecord] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_rows = 0
+        self.flush_errors = 0
+
+    def record(self, chat_id: int, user_id: int, name: str = '') -> int:
+        """
+        Учитывает нарушение (без обращения к диску)
+
+        Returns:
+            Количество нарушений пользователя в чате с учетом этого
+        """
+        users = self._chats.get(chat_id)
+        if users is None:
+            users = self._chats[chat_id] = {}
+        record = users.get(user_id)
+        if record is None:
+            record = users[user_id] = OffenseRecord()
+        record.count += 1
+        record.last_at = int(time.time())
+        if name:
+            record.name = name
+        self._dirty[(chat_id, user_id)] = record
+        return record.count
+
+    def count(self, chat_id: int, user_id: int) -> int:
+        """Возвращает количество нарушений пользователя в чате"""
+        record = self._chats.get(chat_id, {}).get(user_id)
+        return record.count if record is not None else 0
+
+    def top(self, chat_id: int, limit: int) -> List[Tuple[int, OffenseRecord]]:
+        """
+        Возвращает пользователей чата с наибольшим количеством нарушений
+
+        Returns:
+            Список пар (ID пользователя, счетчик) по убыванию количества нарушений
+        """
+        users = self._chats.get(chat_id)
+        if not users:
+            return []
+        return heapq.nlargest(limit, users.items(), key=lambda item: (item[1].count, -item[1].last_at))
+
+    @property
+    def pending(self) -> int:
+        """Количество записей, ожидающих записи в базу"""
+        return len(self._dirty)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Соединение используется из потоков to_thread, но всегда одним потоком за раз
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(_SCHEMA)
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _read(self) -> List[Tuple[int, int, int, int, str]]:
+        return self._connect().execute("SELECT chat_id, user_id, count, last_at, name FROM offenses").fetchall()
+
+    async def load(self) -> int:
+        """
+        Восстанавливает счетчики из базы; чтение выполняется в отдельном потоке
+
+        Returns:
+            Количество загруженных записей
+        """
+        rows = await asyncio.to_thread(self._read)
+        chats: Dict[int, Dict[int, OffenseRecord]] = {}
+        for chat_id, user_id, count, last_at, name in rows:
+            chats.setdefault(chat_id, {})[user_id] = OffenseRecord(count, last_at, name)
+        # Нарушения, учтенные до загрузки, прибавляются к сохраненным
+        for (chat_id, user_id), record in self._dirty.items():
+            stored = chats.setdefault(chat_id, {}).get(user_id)
+            if stored is not None:
+                record.count += stored.count
+            chats[chat_id][user_id] = record
+        self._chats = chats
+        logger.info(f"Загружено счетчиков нарушений: {len(rows)} в {len(chats)} чатах")
+        return len(rows)
+
+    def _write(self, rows: List[Tuple[int, int, int, int, str]]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany(_UPSERT, rows)
+
+    async def flush(self) -> int:
+        """
+        Записывает измененные счетчики в базу одной транзакцией в отдельном потоке
+
+        Returns:
+            Количество записанных записей
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            batch, self._dirty = self._dirty, {}
+            # Значения снимаются в цикле событий, чтобы поток записи не видел промежуточных изменений
+            rows = [(chat_id, user_id, record.count, record.last_at, record.name)
+                    for (chat_id, user_id), record in batch.items()]
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Ошибка при записи счетчиков нарушений: {e}")
+                # Записи возвращаются в очередь на следующую попытку
+                for key, record in batch.items():
+                    self._dirty.setdefault(key, record)
+                return 0
+            self.flushed_rows += len(rows)
+            return len(rows)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Восстанавливает счетчики из базы и запускает периодическую запись"""
+        if self._task is not None:
+            return
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке счетчиков нарушений из {self.path}: {e}")
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """Останавливает периодическую запись и записывает оставшиеся изменения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await asyncio.to_thread(connection.close)
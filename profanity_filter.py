@@ -4,12 +4,27 @@
 
 import os
 import json
+import hashlib
 import logging
 import re
-import aiohttp
-from typing import Set, List, Optional, Dict, Any, Union
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Set, FrozenSet, List, Optional, Dict, Any, Union, Iterable, Iterator, TYPE_CHECKING
 from dotenv import load_dotenv
 
+from constants import JOURNAL_COMPACT_ENTRIES, JOURNAL_FOLLOW_INTERVAL
+from dictionary_journal import DictionaryJournal, JournalPosition, OP_ADD, atomic_write_json, file_id
+from transliteration import TransliterationIndex, has_latin, load_latin_words
+from fuzzy_index import DeletionIndex, load_common_words
+from root_cover import RootCover
+
+# aiohttp нужен только для загрузки словаря из Викисловаря, поэтому импортируется
+# внутри функций загрузки и не замедляет запуск бота
+if TYPE_CHECKING:
+    import aiohttp
+    from chat_dictionaries import ChatOverlay
+
 # Загрузка переменных окружения
 load_dotenv()
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
@@ -20,9 +35,30 @@ if ENVIRONMENT.lower() == 'production':
 else:
     DATA_DIR = 'data'
 
+# Поиск нецензурных слов с одной опечаткой (индекс удалений строится при загрузке словаря)
+FUZZY_MATCHING = os.getenv('FUZZY_MATCHING', 'false').lower() in ('1', 'true', 'yes')
+
+# Поиск нецензурных слов, написанных латиницей (индекс транслитерации строится при загрузке словаря)
+TRANSLIT_MATCHING = os.getenv('TRANSLIT_MATCHING', 'false').lower() in ('1', 'true', 'yes')
+
+# Список слов других языков, которые не считаются записью слов словаря латиницей
+LATIN_WORDS_FILE = os.getenv('LATIN_WORDS_FILE',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'latin_words.txt'))
+
+# Список обычных слов русского языка, которые не считаются словами словаря с опечаткой
+RUSSIAN_WORDS_FILE = os.getenv('RUSSIAN_WORDS_FILE',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'russian_words.txt'))
+
 # Путь к файлу с кешированным списком нецензурных слов
 CACHE_FILE = os.path.join(DATA_DIR, "bad_words_cache.json")
 
+# Формат файла словаря (кеш-файл собирается ботом или compile_dictionary.py)
+DICTIONARY_FORMAT = "oopsnocursing-dictionary"
+DICTIONARY_FORMAT_VERSION = 1
+
+# Путь к журналу изменений словаря, применяемому поверх кеша
+JOURNAL_FILE = os.path.join(DATA_DIR, "bad_words_journal.jsonl")
+
 # URL API MediaWiki Викисловаря
 MEDIAWIKI_API_URL = "https://ru.wiktionary.org/w/api.php"
 
@@ -52,6 +88,9 @@ ADDITIONAL_WORD_FORMS = {
     "залуп": ["залупа", "залупой", "залупиться"]
 }
 
+# Основные корни, проверяемые в словах длиной от 4 букв на этапе поиска основных корней
+KNOWN_ROOTS = ("хуй", "пизд", "залуп")
+
 def normalize_yo(text: str) -> str:
     """
     Заменяет букву 'ё' на 'е' для нормализации текста
@@ -105,8 +144,29 @@ async def get_all_words_in_category() -> Set[str]:
     и прямой парсинг HTML страниц
 
     Returns:
-        Set[str]: Множество слов из категории
+        Set[str]: Множество слов из категории и их форм
     """
+    titles = await get_category_titles()
+    words = expand_titles(titles)
+
+    logging.info(f"Всего получено {len(words)} уникальных нецензурных слов и их форм")
+
+    # Логируем несколько примеров слов для проверки
+    sample = list(words)[:20] if len(words) > 20 else list(words)
+    logging.info(f"Примеры слов: {', '.join(sample)}")
+
+    return words
+
+async def get_category_titles() -> Set[str]:
+    """
+    Получить заголовки всех страниц категории "Матерные выражения/ru" (в нижнем регистре)
+    без генерации словоформ
+
+    Returns:
+        Set[str]: Множество заголовков
+    """
+    import aiohttp
+
     logging.info("Начинаю получение слов из категории...")
     words = set()
     processed_urls = set()  # Для отслеживания уже обработанных URL
@@ -182,32 +242,69 @@ async def get_all_words_in_category() -> Set[str]:
     except Exception as e:
         logging.error(f"Ошибка при получении слов через API MediaWiki: {e}")
 
+    return words
+
+def expand_title(title: str) -> Set[str]:
+    """
+    Генерирует все слова для одного заголовка категории: сам заголовок, вариант
+    без знаков препинания, варианты с е/ё и словоформы каждого из них
+
+    Args:
+        title: Заголовок страницы категории в нижнем регистре
+
+    Returns:
+        Множество слов
+    """
+    words = {title}
+
+    # Добавляем вариации с ё/е
+    words.update(generate_yo_variants(title))
+
+    # Добавляем вариацию без знаков препинания
+    clean_word = re.sub(r'[^\w\s]', '', title)
+    if clean_word:
+        words.add(clean_word)
+        words.update(generate_yo_variants(clean_word))
+
     # Добавляем словоформы для лучшего обнаружения
     word_forms = set()
     for word in words:
         word_forms.update(generate_word_forms(word))
 
     words.update(word_forms)
+    return words
+
+def expand_titles(titles: Iterable[str]) -> Set[str]:
+    """
+    Строит словарь из заголовков категории
+
+    Args:
+        titles: Заголовки страниц категории в нижнем регистре
+
+    Returns:
+        Множество слов и их форм вместе с базовым набором
+    """
+    words = set()
+    for title in titles:
+        words.update(expand_title(title))
+    return finalize_words(words)
 
+def finalize_words(words: Set[str]) -> Set[str]:
+    """
+    Добавляет к словарю базовый набор, а пустой словарь заменяет базовым набором
+    """
     # Если не удалось получить ни одного слова, возвращаем базовый набор
     if not words:
         logging.warning("Не удалось получить список слов, возвращаю базовый набор")
-        words = FALLBACK_BAD_WORDS
-    else:
-        # Всегда добавляем базовый набор для надежности
-        words.update(FALLBACK_BAD_WORDS)
-
-    logging.info(f"Всего получено {len(words)} уникальных нецензурных слов и их форм")
-
-    # Логируем несколько примеров слов для проверки
-    sample = list(words)[:20] if len(words) > 20 else list(words)
-    logging.info(f"Примеры слов: {', '.join(sample)}")
+        return set(FALLBACK_BAD_WORDS)
 
+    # Всегда добавляем базовый набор для надежности
+    words.update(FALLBACK_BAD_WORDS)
     return words
 
-async def process_category_page(session: aiohttp.ClientSession, url: str, words: Set[str]) -> None:
+async def process_category_page(session: 'aiohttp.ClientSession', url: str, words: Set[str]) -> None:
     """
-    Извлекает слова из страницы категории
+    Извлекает заголовки страниц (в нижнем регистре) из страницы категории
     """
     logging.info(f"Обрабатываю страницу категории: {url}")
     async with session.get(url) as response:
@@ -230,22 +327,12 @@ async def process_category_page(session: aiohttp.ClientSession, url: str, words:
             for match in link_pattern.finditer(pages_content):
                 title = match.group(1)
                 if ":" not in title and "Категория:" not in title:  # Пропускаем подкатегории
-                    # Добавляем оригинальное слово
-                    word = title.lower()
-                    words.add(word)
-
-                    # Добавляем вариации с ё/е
-                    words.update(generate_yo_variants(word))
-
-                    # Добавляем вариацию без знаков препинания
-                    clean_word = re.sub(r'[^\w\s]', '', word)
-                    if clean_word:
-                        words.add(clean_word)
-                        words.update(generate_yo_variants(clean_word))
+                    # Формы слова генерирует expand_title
+                    words.add(title.lower())
 
             logging.info(f"Найдено {len(words)} слов на данный момент")
 
-async def get_next_page_url(session: aiohttp.ClientSession, current_url: str) -> Optional[str]:
+async def get_next_page_url(session: 'aiohttp.ClientSession', current_url: str) -> Optional[str]:
     """
     Извлекает URL следующей страницы из текущей страницы категории.
     Обрабатывает параметры pagefrom и pageuntil в URL.
@@ -280,8 +367,10 @@ async def get_next_page_url(session: aiohttp.ClientSession, current_url: str) ->
 
 async def fetch_via_api_method() -> Set[str]:
     """
-    Получает слова с использованием стандартного MediaWiki API
+    Получает заголовки страниц категории (в нижнем регистре) с использованием стандартного MediaWiki API
     """
+    import aiohttp
+
     bad_words = set()
     cmcontinue = None
 
@@ -315,18 +404,9 @@ async def fetch_via_api_method() -> Set[str]:
                         for member in members:
                             title = member.get("title", "").lower()
                             if ":" not in title:
-                                # Добавляем оригинальное слово
+                                # Формы слова генерирует expand_title
                                 bad_words.add(title)
 
-                                # Добавляем вариации с ё/е
-                                bad_words.update(generate_yo_variants(title))
-
-                                # Очищаем слово от знаков препинания
-                                clean_word = re.sub(r'[^\w\s]', '', title)
-                                if clean_word:
-                                    bad_words.add(clean_word)
-                                    bad_words.update(generate_yo_variants(clean_word))
-
                         logging.info(f"Через API получено {len(members)} слов")
 
                     # Проверяем наличие продолжения
@@ -401,143 +481,830 @@ def generate_word_forms(word: str) -> Set[str]:
 
     return forms
 
-async def load_or_update_bad_words() -> Set[str]:
+def dictionary_hash(words: Iterable[str]) -> str:
     """
-    Загружает список нецензурных слов из кеша или обновляет его из Викисловаря.
+    Вычисляет SHA-256 словаря: отсортированные слова, по одному на строку
+    """
+    digest = hashlib.sha256()
+    for word in sorted(words):
+        digest.update(word.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def build_dictionary_artifact(words: Iterable[str], source: str,
+                              previous: Optional[Dict[str, Any]] = None,
+                              base_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Собирает файл словаря: отсортированный список слов с версией и контрольной суммой.
+    При неизменном содержимом версия и дата создания берутся из предыдущего файла,
+    поэтому повторная сборка дает побайтно тот же результат.
+
+    Args:
+        words: Слова словаря
+        source: Источник словаря (для отчета)
+        previous: Предыдущий файл словаря, если он есть
+        base_sha256: Контрольная сумма сборки, в которую сжатием журнала перенесены записи
 
     Returns:
-        Set[str]: Множество нецензурных слов
+        Словарь с полями формата, версии, даты создания, контрольной суммы и слов
     """
-    # Проверяем наличие кеш-файла
+    sorted_words = sorted(set(words))
+    sha256 = dictionary_hash(sorted_words)
+    version, created = 1, datetime.now(timezone.utc).isoformat(timespec='seconds')
+    if previous is not None:
+        if previous.get('sha256') == sha256:
+            version, created = previous['version'], previous.get('created', created)
+        else:
+            version = previous.get('version', 0) + 1
+    artifact = {
+        'format': DICTIONARY_FORMAT,
+        'format_version': DICTIONARY_FORMAT_VERSION,
+        'version': version,
+        'created': created,
+        'source': source,
+        'count': len(sorted_words),
+        'sha256': sha256,
+        'words': sorted_words
+    }
+    if base_sha256 is not None:
+        artifact['base_sha256'] = base_sha256
+    return artifact
+
+def dictionary_build_id(artifact: Dict[str, Any]) -> Optional[str]:
+    """
+    Возвращает идентификатор сборки словаря: контрольную сумму собранного словаря.
+    Сжатие журнала переносит в файл только записи журнала и идентификатор не меняет
+    """
+    return artifact.get('base_sha256') or artifact.get('sha256')
+
+def read_dictionary_file(path: str) -> Dict[str, Any]:
+    """
+    Читает файл словаря: собранный compile_dictionary.py или список слов прежнего формата
+    (блокирующая операция)
+
+    Returns:
+        Файл словаря; для прежнего формата версия равна 0, а контрольной суммы нет
+
+    Raises:
+        ValueError: Если формат неизвестен или контрольная сумма не совпадает
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        return {'format': DICTIONARY_FORMAT, 'format_version': 0, 'version': 0, 'sha256': None, 'words': data}
+    if not isinstance(data, dict) or data.get('format') != DICTIONARY_FORMAT:
+        raise ValueError("неизвестный формат файла словаря")
+    if data.get('format_version', 0) > DICTIONARY_FORMAT_VERSION:
+        raise ValueError(f"версия формата {data['format_version']} новее поддерживаемой {DICTIONARY_FORMAT_VERSION}")
+    if dictionary_hash(data['words']) != data.get('sha256'):
+        raise ValueError("контрольная сумма словаря не совпадает")
+    return data
+
+def _read_cache_file() -> Optional[Dict[str, Any]]:
+    if not os.path.exists(CACHE_FILE):
+        return None
+    try:
+        cache_data = read_dictionary_file(CACHE_FILE)
+        logging.info(f"Загружено {len(cache_data['words'])} слов из кеш-файла (версия {cache_data['version']})")
+        return cache_data
+    except Exception as e:
+        logging.error(f"Ошибка при чтении кеш-файла: {e}")
+        return None
+
+def load_cached_bad_words() -> Optional[Set[str]]:
+    """
+    Читает список нецензурных слов из кеш-файла (блокирующая операция)
+
+    Returns:
+        Множество слов или None, если кеш отсутствует или поврежден
+    """
+    cache_data = _read_cache_file()
+    return set(cache_data['words']) if cache_data is not None else None
+
+def load_compacted_bad_words() -> Optional[Set[str]]:
+    """
+    Читает список нецензурных слов из кеш-файла, если файл записан сжатием журнала
+    (блокирующая операция). Словарь, собранный заново, этой функцией не читается:
+    в многопроцессном режиме воркеры получают его при перезапуске.
+
+    Returns:
+        Множество слов или None, если кеш отсутствует, поврежден или записан не сжатием журнала
+    """
+    cache_data = _read_cache_file()
+    if cache_data is None or 'base_sha256' not in cache_data:
+        return None
+    return set(cache_data['words'])
+
+def save_cached_bad_words(bad_words: Set[str], source: str = "bot", compaction: bool = False) -> None:
+    """
+    Атомарно сохраняет список нецензурных слов в кеш-файл (блокирующая операция).
+    Версия словаря увеличивается, если его содержимое изменилось.
+
+    Args:
+        bad_words: Слова словаря
+        source: Источник словаря (для отчета)
+        compaction: Файл записывается сжатием журнала: идентификатор сборки сохраняется
+    """
+    previous = None
     if os.path.exists(CACHE_FILE):
         try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-                logging.info(f"Загружено {len(cache_data)} слов из кеш-файла")
-                return set(cache_data)
+            previous = read_dictionary_file(CACHE_FILE)
+        except Exception as e:
+            logging.warning(f"Предыдущий кеш-файл не прочитан, версия словаря начнется заново: {e}")
+    base_sha256 = dictionary_build_id(previous) if compaction and previous is not None else None
+    atomic_write_json(CACHE_FILE, build_dictionary_artifact(bad_words, source, previous, base_sha256), indent=0)
+    logging.info(f"Сохранено {len(bad_words)} слов в кеш-файл")
+
+# Идентификатор версии кеш-файла и идентификатор сборки словаря в нем
+_cache_build: tuple = (None, None)
+
+def cache_build_id() -> Optional[str]:
+    """
+    Возвращает идентификатор сборки словаря в кеш-файле (блокирующая операция).
+    Файл перечитывается, только если он перезаписан
+
+    Returns:
+        Идентификатор сборки или None, если кеша нет или он поврежден
+    """
+    global _cache_build
+    current = file_id(CACHE_FILE)
+    if current is None:
+        return None
+    if current != _cache_build[0]:
+        try:
+            build = dictionary_build_id(read_dictionary_file(CACHE_FILE))
         except Exception as e:
             logging.error(f"Ошибка при чтении кеш-файла: {e}")
+            build = None
+        _cache_build = (current, build)
+    return _cache_build[1]
+
+async def load_or_update_bad_words() -> Set[str]:
+    """
+    Загружает список нецензурных слов из кеша или обновляет его из Викисловаря.
+    Работа с файлами выполняется в отдельном потоке, чтобы не блокировать цикл событий.
+    Журнал изменений не применяется: это делает initialize_bad_words.
+
+    Returns:
+        Set[str]: Множество нецензурных слов
+    """
+    # Проверяем наличие кеш-файла
+    cached_words = await asyncio.to_thread(load_cached_bad_words)
+    if cached_words is not None:
+        return cached_words
 
     # Если кеш-файла нет или произошла ошибка, получаем данные из Викисловаря
     bad_words = await get_all_words_in_category()
 
     # Сохраняем полученные данные в кеш
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(list(bad_words), f, ensure_ascii=False, indent=2)
-            logging.info(f"Сохранено {len(bad_words)} слов в кеш-файл")
+        await asyncio.to_thread(save_cached_bad_words, bad_words)
         return bad_words
     except Exception as e:
         logging.error(f"Ошибка при сохранении кеш-файла: {e}")
 
     return bad_words
 
+class DictionarySnapshot:
+    """
+    Словарь вместе с построенными по нему индексами. Объект не изменяется после создания:
+    проверка сообщения работает с одним снимком, даже если словарь в это время подменяется.
+    """
+
+    __slots__ = ('words', 'normalized', 'phrases', 'cover', 'translit', 'fuzzy')
+
+    def __init__(self, words: Set[str], translit: Optional[TransliterationIndex] = None,
+                 fuzzy: Optional[DeletionIndex] = None, cover: Optional[RootCover] = None):
+        self.words = words
+        # Слово с нормализованной 'ё' -> слова словаря (этап 2 проверяет слово сообщения одним обращением)
+        normalized: Dict[str, List[str]] = {}
+        for word in words:
+            normalized.setdefault(normalize_yo(word), []).append(word)
+        self.normalized = normalized
+        # Выражения из нескольких слов для этапа 3 вместе с самым длинным словом выражения
+        # в нормализованном виде: без него в нормализованном тексте выражение не встретится.
+        # Выражения упорядочены, чтобы вариант с 'е' проверялся раньше варианта с 'ё' и причина
+        # не зависела от порядка обхода множества
+        self.phrases = tuple((word, max(normalize_yo(word).split(), key=len))
+                             for word in sorted(words) if len(word) > 3 and ' ' in word)
+        # Корни для этапа 4: слова, содержащие другое слово словаря, не перебираются
+        self.cover = cover if cover is not None else RootCover.build(words)
+        # Индекс записи слов латиницей (None — поиск латиницей отключен)
+        self.translit = translit
+        # Индекс удалений для слов с опечатками (None — поиск опечаток отключен)
+        self.fuzzy = fuzzy
+
+    @classmethod
+    def build(cls, words: Set[str], fuzzy: bool = FUZZY_MATCHING,
+              translit: bool = TRANSLIT_MATCHING) -> 'DictionarySnapshot':
+        """
+        Строит снимок словаря и его индексы (блокирующая операция)
+
+        Args:
+            words: Слова словаря
+            fuzzy: Строить ли индекс для поиска слов с опечатками
+            translit: Строить ли индекс для поиска слов, написанных латиницей
+        """
+        cover = RootCover.build(words)
+        cover.log_report()
+        return cls(words, TransliterationIndex.build(words, KNOWN_ROOTS, latin_words()) if translit else None,
+                   DeletionIndex.build(words, common_words()) if fuzzy else None, cover)
+
+    def with_words(self, new_words: Set[str]) -> 'DictionarySnapshot':
+        """Возвращает новый снимок с добавленными словами (блокирующая операция)"""
+        translit = self.translit.with_words(new_words) if self.translit is not None else None
+        fuzzy = self.fuzzy.with_words(new_words) if self.fuzzy is not None else None
+        # Новое короткое слово может покрыть уже отобранные корни, поэтому покрытие строится заново
+        return DictionarySnapshot(self.words | new_words, translit, fuzzy)
+
+    def without_cover(self) -> 'DictionarySnapshot':
+        """Возвращает снимок с теми же словами, в котором этап 4 перебирает все слова словаря"""
+        return DictionarySnapshot(self.words, self.translit, self.fuzzy,
+                                  RootCover.build(self.words, prune=False))
+
+# Список слов других языков, прочитанный из LATIN_WORDS_FILE при первой сборке индекса транслитерации
+_latin_words: Optional[FrozenSet[str]] = None
+
+
+def latin_words() -> FrozenSet[str]:
+    """Возвращает список слов других языков из LATIN_WORDS_FILE (файл читается один раз)"""
+    global _latin_words
+    if _latin_words is None:
+        _latin_words = load_latin_words(LATIN_WORDS_FILE)
+    return _latin_words
+
+
+# Список обычных слов, прочитанный из RUSSIAN_WORDS_FILE при первой сборке индекса опечаток
+_common_words: Optional[FrozenSet[str]] = None
+
+
+def common_words() -> FrozenSet[str]:
+    """Возвращает список обычных слов из RUSSIAN_WORDS_FILE (файл читается один раз)"""
+    global _common_words
+    if _common_words is None:
+        _common_words = load_common_words(RUSSIAN_WORDS_FILE)
+    return _common_words
+
+
 # Глобальная переменная для хранения списка нецензурных слов
 BAD_WORDS = FALLBACK_BAD_WORDS
 
-async def initialize_bad_words():
+# Текущий снимок словаря с индексами; BAD_WORDS всегда совпадает с его словами
+_snapshot = DictionarySnapshot.build(FALLBACK_BAD_WORDS)
+
+# Задача фоновой загрузки словаря
+_initialization_task: Optional[asyncio.Task] = None
+
+# Журнал изменений словаря и число записей, добавленных после последнего сжатия
+journal = DictionaryJournal(JOURNAL_FILE)
+_journal_entries = 0
+
+# Положение словаря процесса в журнале: с него применяются записи других процессов
+journal_position = JournalPosition(CACHE_FILE)
+
+# Защищает словарь от одновременной подмены при загрузке и добавлении слов
+_dictionary_lock = asyncio.Lock()
+
+# Задача фонового сжатия журнала
+_compaction_task: Optional[asyncio.Task] = None
+
+# Задача слежения за журналом
+_follower_task: Optional[asyncio.Task] = None
+
+def current_snapshot() -> DictionarySnapshot:
+    """Возвращает текущий снимок словаря"""
+    return _snapshot
+
+def set_snapshot(snapshot: DictionarySnapshot) -> None:
+    """
+    Подменяет текущий снимок словаря новым
+    """
+    global BAD_WORDS, _snapshot
+    _snapshot = snapshot
+    BAD_WORDS = snapshot.words
+
+def set_bad_words(words: Set[str]) -> None:
+    """
+    Подменяет текущий список нецензурных слов новым. Индексы строятся сразу,
+    поэтому в работающем боте снимок лучше строить в отдельном потоке и передавать в set_snapshot.
+    """
+    set_snapshot(DictionarySnapshot.build(words))
+
+def _replay_and_build(words: Set[str]) -> tuple[DictionarySnapshot, int]:
+    words, entries = journal.replay(words, journal_position)
+    return DictionarySnapshot.build(words), entries
+
+async def initialize_bad_words(compact: bool = True):
     """
     Инициализирует глобальный список нецензурных слов при запуске приложения.
+    Поверх кеша применяется журнал изменений.
+
+    Args:
+        compact: Сжимать журнал, если в нем накопилось много записей. Приемщик
+            многопроцессного режима журнал не сжимает: это делают воркеры, которые его дописывают
     """
-    global BAD_WORDS
-    BAD_WORDS = await load_or_update_bad_words()
+    global _journal_entries
+    words = await load_or_update_bad_words()
+    async with _dictionary_lock:
+        # Журнал читается под блокировкой, чтобы не потерять слова, добавленные во время загрузки.
+        # Индексы строятся в отдельном потоке, не блокируя цикл событий
+        snapshot, entries = await asyncio.to_thread(_replay_and_build, words)
+        set_snapshot(snapshot)
+        _journal_entries = entries
+    if entries:
+        logging.info(f"Из журнала изменений применено записей: {entries}")
     logging.info(f"Загружено {len(BAD_WORDS)} нецензурных слов")
+    if compact and _journal_entries >= JOURNAL_COMPACT_ENTRIES:
+        schedule_compaction()
 
-def contains_profanity(text: str) -> tuple[bool, Optional[str]]:
+async def add_words(words: Set[str]) -> int:
     """
-    Проверяет содержит ли текст нецензурную лексику.
+    Добавляет слова в словарь. Изменение дописывается в журнал, а не перезаписывает кеш.
 
     Args:
-        text: Проверяемый текст
+        words: Добавляемые слова
 
     Returns:
-        Кортеж (результат, причина), где:
-        - результат: True если содержит нецензурную лексику, иначе False
-        - причина: строка с объяснением причины срабатывания или None, если нецензурная лексика не обнаружена
+        Количество слов, которых еще не было в словаре
+    """
+    global _journal_entries
+    async with _dictionary_lock:
+        new_words = set(words) - BAD_WORDS
+        if not new_words:
+            return 0
+        await asyncio.to_thread(journal.append, OP_ADD, new_words)
+        # Словарь не изменяется на месте: проверки и фоновые потоки видят целый снимок
+        set_snapshot(await asyncio.to_thread(_snapshot.with_words, new_words))
+        _journal_entries += 1
+    if _journal_entries >= JOURNAL_COMPACT_ENTRIES:
+        schedule_compaction()
+    return len(new_words)
+
+def schedule_compaction() -> asyncio.Task:
+    """
+    Запускает сжатие журнала в фоне, если оно еще не запущено
+
+    Returns:
+        Задача сжатия
+    """
+    global _compaction_task
+    if _compaction_task is None or _compaction_task.done():
+        _compaction_task = asyncio.create_task(compact_journal())
+    return _compaction_task
+
+async def compact_journal() -> int:
+    """
+    Переносит записи журнала в кеш-файл. Выполняется в отдельном потоке.
+
+    Returns:
+        Количество перенесенных записей
+    """
+    global _journal_entries
+    try:
+        entries = await asyncio.to_thread(journal.compact, load_cached_bad_words,
+                                          lambda words: save_cached_bad_words(words, compaction=True))
+    except Exception as e:
+        logging.error(f"Ошибка при сжатии журнала словаря: {e}")
+        return 0
+    # Записи, добавленные во время сжатия, остаются в журнале и продолжают учитываться
+    _journal_entries = max(0, _journal_entries - entries)
+    if entries:
+        logging.info(f"Журнал словаря сжат: в кеш-файл перенесено записей: {entries}")
+    return entries
+
+async def follow_journal() -> bool:
+    """
+    Применяет к словарю изменения, сделанные другими процессами: записи, дописанные в журнал
+    после последней проверки, и сжатие журнала в кеш-файл. Добавленные слова
+    применяются через DictionarySnapshot.with_words, без полной перестройки индексов.
+
+    Returns:
+        True, если словарь изменился
+    """
+    global _journal_entries
+    async with _dictionary_lock:
+        words = BAD_WORDS
+        new_words = await asyncio.to_thread(journal.follow, words, journal_position, load_compacted_bad_words)
+        # Счетчик учитывает и записи других процессов, поэтому журнал сжимается,
+        # сколько бы воркеров его ни дописывало
+        _journal_entries = journal_position.entries
+        if new_words is None:
+            return False
+        added = new_words - words
+        if len(new_words) == len(words) + len(added):
+            set_snapshot(await asyncio.to_thread(_snapshot.with_words, added))
+        else:
+            # Слова удалены: индексы строятся заново
+            set_snapshot(await asyncio.to_thread(DictionarySnapshot.build, new_words))
+    logging.info(f"Словарь обновлен по журналу изменений: {len(words)} -> {len(new_words)} слов")
+    if _journal_entries >= JOURNAL_COMPACT_ENTRIES:
+        schedule_compaction()
+    return True
+
+def start_journal_follower(interval: float = JOURNAL_FOLLOW_INTERVAL) -> asyncio.Task:
+    """
+    Запускает периодическое применение изменений словаря, сделанных другими процессами
+    (воркеры многопроцессного режима видят слова, добавленные в соседних воркерах)
+
+    Args:
+        interval: Период проверки журнала, секунды
+
+    Returns:
+        Задача слежения; останавливается отменой
+    """
+    async def _follow() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await follow_journal()
+            except Exception as e:
+                logging.error(f"Ошибка при применении журнала словаря: {e}")
+
+    global _follower_task
+    if _follower_task is None or _follower_task.done():
+        _follower_task = asyncio.create_task(_follow())
+    return _follower_task
+
+async def stop_journal_follower() -> None:
+    """Останавливает слежение за журналом"""
+    global _follower_task
+    if _follower_task is None:
+        return
+    _follower_task.cancel()
+    try:
+        await _follower_task
+    except asyncio.CancelledError:
+        pass
+    _follower_task = None
+
+def _remove_dictionary_files() -> None:
+    with journal.locked():
+        if os.path.exists(CACHE_FILE):
+            os.remove(CACHE_FILE)
+        journal.clear()
+
+async def remove_dictionary_files() -> None:
+    """
+    Удаляет кеш-файл и журнал изменений для принудительного обновления словаря
+    """
+    await asyncio.to_thread(_remove_dictionary_files)
+
+def start_background_initialization(compact: bool = True) -> asyncio.Task:
+    """
+    Запускает загрузку полного словаря в фоне. До ее завершения проверка работает
+    по базовому набору FALLBACK_BAD_WORDS, после — словарь подменяется целиком.
+
+    Args:
+        compact: Сжимать журнал после загрузки (см. initialize_bad_words)
+
+    Returns:
+        Задача загрузки; ее результат — время загрузки в секундах
+    """
+    async def _load() -> float:
+        started = time.perf_counter()
+        await initialize_bad_words(compact)
+        return time.perf_counter() - started
+
+    global _initialization_task
+    logging.info(f"Бот работает с базовым набором из {len(BAD_WORDS)} слов, полный словарь загружается в фоне")
+    # Ссылка на задачу хранится, чтобы ее не удалил сборщик мусора
+    _initialization_task = asyncio.create_task(_load())
+    return _initialization_task
+
+# Этапы проверки, на которых найдено совпадение (в порядке выполнения)
+STAGE_CHAT_DENY = 'chat_deny'  # слово или выражение, запрещенное в чате
+STAGE_EXACT = 'exact'  # слово из словаря
+STAGE_NORMALIZED = 'normalized'  # слово из словаря после замены ё на е
+STAGE_PHRASE = 'phrase'  # выражение из нескольких слов
+STAGE_ROOT = 'root'  # слово, содержащее слово из словаря как корень
+STAGE_KNOWN_ROOT = 'known_root'  # слово, содержащее один из основных корней
+STAGE_TRANSLIT = 'translit'  # слово, написанное латиницей или смесью латиницы и кириллицы
+STAGE_FUZZY = 'fuzzy'  # слово из словаря с одной опечаткой
+
+# Нормализация текста, при которой найдено совпадение
+NORMALIZATION_NONE = 'none'
+NORMALIZATION_YO = 'yo'
+NORMALIZATION_TRANSLIT = 'translit'
+
+# Символ, которым маскируется нецензурная лексика
+MASK_CHAR = '*'
+
+_WORD_PATTERN = re.compile(r'\b\w+\b')
+
+class ProfanityMatch:
+    """
+    Совпадение с нецензурной лексикой в тексте.
+    Причина срабатывания формируется только при обращении к reason.
     """
-    if not text:
-        return False, None
 
-    # Приводим текст к нижнему регистру
+    __slots__ = ('start', 'end', 'token', 'entry', 'stage', 'normalization')
+
+    def __init__(self, start: int, end: int, token: str, entry: str, stage: str, normalization: str):
+        self.start = start  # начало фрагмента в исходном тексте
+        self.end = end  # конец фрагмента в исходном тексте (не включая)
+        self.token = token  # найденный фрагмент в нижнем регистре (после нормализации, если она применялась)
+        self.entry = entry  # слово словаря, корень или выражение, с которым совпал фрагмент
+        self.stage = stage
+        self.normalization = normalization
+
+    @property
+    def span(self) -> tuple[int, int]:
+        return self.start, self.end
+
+    @property
+    def reason(self) -> str:
+        """Объяснение срабатывания фильтра"""
+        normalized = self.normalization == NORMALIZATION_YO
+        if self.stage == STAGE_CHAT_DENY:
+            if ' ' in self.entry:
+                return f"Обнаружено выражение, запрещенное в этом чате: '{self.entry}'"
+            return f"Обнаружено слово, запрещенное в этом чате: '{self.token}'"
+        if self.stage == STAGE_EXACT:
+            return f"Обнаружено нецензурное слово: '{self.token}'"
+        if self.stage == STAGE_NORMALIZED:
+            return f"Обнаружено нецензурное слово (после нормализации): '{self.token}' -> '{self.entry}'"
+        if self.stage == STAGE_PHRASE:
+            if normalized:
+                return f"Обнаружено нецензурное выражение (после нормализации): '{self.entry}'"
+            return f"Обнаружено нецензурное выражение: '{self.entry}'"
+        if self.stage == STAGE_ROOT:
+            if normalized:
+                return f"Обнаружен корень нецензурного слова (после нормализации): '{self.token}' содержит корень '{self.entry}'"
+            return f"Обнаружен корень нецензурного слова: '{self.token}' содержит корень '{self.entry}'"
+        if self.stage == STAGE_FUZZY:
+            return f"Обнаружено нецензурное слово с опечаткой: '{self.token}' -> '{self.entry}'"
+        if self.stage == STAGE_TRANSLIT:
+            return f"Обнаружено нецензурное слово, написанное латиницей: '{self.token}' -> '{self.entry}'"
+        return f"Обнаружен корень нецензурного слова в слове: '{self.token}' (корень: '{self.entry}')"
+
+    def to_dict(self, text: str) -> Dict[str, Any]:
+        """
+        Представляет совпадение в виде словаря для JSON
+
+        Args:
+            text: Проверенный текст, из которого берется найденный фрагмент
+        """
+        return {
+            'start': self.start,
+            'end': self.end,
+            'text': text[self.start:self.end],
+            'entry': self.entry,
+            'stage': self.stage,
+            'normalization': self.normalization
+        }
+
+    def __repr__(self) -> str:
+        return (f"ProfanityMatch({self.start}, {self.end}, token={self.token!r}, entry={self.entry!r}, "
+                f"stage={self.stage!r}, normalization={self.normalization!r})")
+
+def _lower_with_offsets(text: str) -> tuple[str, Optional[List[int]]]:
+    """
+    Приводит текст к нижнему регистру и сопоставляет позиции результата позициям исходного текста.
+    Для подавляющего большинства текстов длина не меняется и сопоставление не нужно (None);
+    оно требуется для редких символов, нижний регистр которых длиннее одного символа (например, 'İ').
+    """
     text_lower = text.lower()
+    if len(text_lower) == len(text):
+        return text_lower, None
+    offsets = []
+    for index, char in enumerate(text):
+        offsets.extend([index] * len(char.lower()))
+    return text_lower, offsets
+
+def _find_all(text: str, fragment: str) -> Iterator[int]:
+    """Находит все вхождения фрагмента в текст (включая пересекающиеся)"""
+    start = text.find(fragment)
+    while start >= 0:
+        yield start
+        start = text.find(fragment, start + 1)
+
+def iter_profanity(text: str, overlay: Optional['ChatOverlay'] = None,
+                   snapshot: Optional[DictionarySnapshot] = None) -> Iterator[ProfanityMatch]:
+    """
+    Находит нецензурную лексику в тексте. Совпадения выдаются по мере нахождения
+    в порядке этапов проверки, поэтому для ответа "есть ли мат" достаточно первого.
+    Каждый фрагмент текста выдается один раз — на самом раннем сработавшем этапе.
+
+    Args:
+        text: Проверяемый текст
+        overlay: Словарь чата с дополнительно запрещенными и разрешенными словами
+        snapshot: Снимок словаря (по умолчанию текущий)
 
-    # Также подготавливаем вариант текста с нормализованными 'ё' -> 'е'
+    Yields:
+        Совпадения с позициями в исходном тексте
+    """
+    if not text:
+        return
+
+    if snapshot is None:
+        snapshot = _snapshot
+    bad_words = snapshot.words
+    cover = snapshot.cover
+
+    # Приводим текст к нижнему регистру, сохраняя соответствие позиций исходному тексту
+    text_lower, offsets = _lower_with_offsets(text)
+
+    # Также подготавливаем вариант текста с нормализованными 'ё' -> 'е' (длина не меняется)
     text_normalized = normalize_yo(text_lower)
 
-    # Разбиваем на слова оба варианта текста
-    words = re.findall(r'\b\w+\b', text_lower)
-    words_normalized = re.findall(r'\b\w+\b', text_normalized)
+    # Разбиваем текст на слова: слово (в исходном и нормализованном виде) -> позиции в тексте
+    positions: Dict[str, List[tuple[int, int, str]]] = {}
+    for word_match in _WORD_PATTERN.finditer(text_lower):
+        word = word_match.group(0)
+        start, end = word_match.span()
+        positions.setdefault(word, []).append((start, end, NORMALIZATION_NONE))
+        normalized_word = normalize_yo(word)
+        if normalized_word != word:
+            positions.setdefault(normalized_word, []).append((start, end, NORMALIZATION_YO))
+
+    # Все варианты слов в порядке появления в тексте
+    all_words = list(positions)
 
-    # Объединяем оба набора слов
-    all_words = set(words + words_normalized)
+    seen = set()
+
+    def make_match(start: int, end: int, token: str, entry: str, stage: str, normalization: str) -> Optional[ProfanityMatch]:
+        if (start, end) in seen:
+            return None
+        seen.add((start, end))
+        if offsets is not None:
+            start, end = offsets[start], offsets[end - 1] + 1
+        return ProfanityMatch(start, end, token, entry, stage, normalization)
+
+    def word_matches(word: str, entry: str, stage: str, normalization: Optional[str] = None) -> Iterator[ProfanityMatch]:
+        for start, end, word_normalization in positions[word]:
+            match = make_match(start, end, word, entry, stage, normalization or word_normalization)
+            if match:
+                yield match
+
+    if overlay:
+        # Слова, разрешенные в чате, не проверяются
+        if overlay.allow:
+            all_words = [word for word in all_words if not overlay.is_allowed(word)]
+
+        # 0. Проверяем слова и выражения, запрещенные в этом чате
+        for word in all_words:
+            if overlay.is_denied(word):
+                yield from word_matches(word, normalize_yo(word), STAGE_CHAT_DENY)
+        for phrase in overlay.deny_phrases:
+            for start in _find_all(text_normalized, phrase):
+                end = start + len(phrase)
+                normalization = NORMALIZATION_NONE if text_lower[start:end] == phrase else NORMALIZATION_YO
+                match = make_match(start, end, phrase, phrase, STAGE_CHAT_DENY, normalization)
+                if match:
+                    yield match
 
     # 1. Проверяем каждое слово на вхождение в список нецензурных слов напрямую
     for word in all_words:
-        if word in BAD_WORDS:
-            reason = f"Обнаружено нецензурное слово: '{word}'"
-            logging.info(reason)
-            return True, reason
+        if word in bad_words:
+            yield from word_matches(word, word, STAGE_EXACT)
 
-    # 2. Проверяем каждое слово с нормализацией ё->е
-    for bad_word in BAD_WORDS:
-        normalized_bad_word = normalize_yo(bad_word)
-        for word in all_words:
-            if word == normalized_bad_word or normalize_yo(word) == bad_word:
-                reason = f"Обнаружено нецензурное слово (после нормализации): '{word}' -> '{bad_word}'"
-                logging.info(reason)
-                return True, reason
+    # 2. Проверяем каждое слово с нормализацией ё->е: слово совпадает с нормализованным
+    # словом словаря, или нормализованное слово совпадает со словом словаря
+    normalized_words = snapshot.normalized
+    for word in all_words:
+        for bad_word in normalized_words.get(word, ()):
+            yield from word_matches(word, bad_word, STAGE_NORMALIZED)
+        normalized_word = normalize_yo(word)
+        if normalized_word != word and normalized_word in bad_words:
+            yield from word_matches(word, normalized_word, STAGE_NORMALIZED)
 
     # 3. Проверяем на вхождение фраз и словосочетаний (для составных выражений)
-    for bad_word in BAD_WORDS:
-        if len(bad_word) > 3 and ' ' in bad_word:
-            # Для фраз проверяем как оригинал, так и нормализованную версию
-            if bad_word in text_lower or bad_word in text_normalized:
-                reason = f"Обнаружено нецензурное выражение: '{bad_word}'"
-                logging.info(reason)
-                return True, reason
-
-            # Проверяем с нормализацией ё->е
-            normalized_bad_word = normalize_yo(bad_word)
-            if normalized_bad_word in text_lower or normalized_bad_word in text_normalized:
-                reason = f"Обнаружено нецензурное выражение (после нормализации): '{bad_word}'"
-                logging.info(reason)
-                return True, reason
-
-    # 4. Проверяем вхождение корней слов (для обхода склонений)
-    for bad_word in BAD_WORDS:
-        if len(bad_word) > 3 and ' ' not in bad_word:
-            # Проверяем оригинальную версию плохого слова
-            for check_text in [text_lower, text_normalized]:
-                if bad_word in check_text:
-                    # Проверяем, что это именно корень слова, а не часть другого слова
-                    word_pattern = re.compile(f'\\b\\w*{re.escape(bad_word)}\\w*\\b')
-                    match = word_pattern.search(check_text)
+    for bad_word, key in snapshot.phrases:
+        if key not in text_normalized:
+            continue
+        if overlay and overlay.is_allowed(bad_word):
+            continue
+
+        # Для фраз проверяем как оригинал, так и нормализованную версию. Как и в исходной
+        # проверке, выражение из словаря в любом из вариантов текста — совпадение без нормализации
+        normalized_bad_word = normalize_yo(bad_word)
+        for fragment in dict.fromkeys((bad_word, normalized_bad_word)):
+            normalization = NORMALIZATION_NONE if fragment == bad_word else NORMALIZATION_YO
+            for check_text in (text_lower, text_normalized):
+                for start in _find_all(check_text, fragment):
+                    match = make_match(start, start + len(fragment), fragment, bad_word, STAGE_PHRASE, normalization)
                     if match:
-                        detected_word = match.group(0)
-                        reason = f"Обнаружен корень нецензурного слова: '{detected_word}' содержит корень '{bad_word}'"
-                        logging.info(reason)
-                        return True, reason
-
-            # Проверяем нормализованную версию плохого слова
-            normalized_bad_word = normalize_yo(bad_word)
-            for check_text in [text_lower, text_normalized]:
-                if normalized_bad_word in check_text:
-                    # Проверяем, что это именно корень слова, а не часть другого слова
-                    word_pattern = re.compile(f'\\b\\w*{re.escape(normalized_bad_word)}\\w*\\b')
-                    match = word_pattern.search(check_text)
+                        yield match
+
+    # 4. Проверяем вхождение корней слов (для обхода склонений). Перебираются только корни
+    # из покрытия: слова словаря, содержащие другое слово словаря, дали бы те же совпадения
+    for bad_word, normalized_bad_word in cover.pairs:
+        if normalized_bad_word not in text_normalized:
+            continue
+        # Проверяем оригинальную и нормализованную версии плохого слова
+        for root in dict.fromkeys((bad_word, normalized_bad_word)):
+            for check_text in (text_lower, text_normalized):
+                if root not in check_text:
+                    continue
+                # Проверяем, что это именно корень слова, а не часть другого слова
+                word_pattern = re.compile(f'\\b\\w*{re.escape(root)}\\w*\\b')
+                for root_match in word_pattern.finditer(check_text):
+                    detected_word = root_match.group(0)
+                    if overlay and overlay.is_allowed(detected_word):
+                        continue
+                    start, end = root_match.span()
+                    surface = text_lower[start:end]
+                    # Для причины берем слово словаря, которое есть в найденном слове в том же написании
+                    entry = cover.entry_for(bad_word, surface)
+                    # Слово словаря в исходном или нормализованном тексте — совпадение без нормализации
+                    normalization = NORMALIZATION_NONE \
+                        if entry in surface or entry in text_normalized[start:end] else NORMALIZATION_YO
+                    match = make_match(start, end, surface, entry, STAGE_ROOT, normalization)
                     if match:
-                        detected_word = match.group(0)
-                        reason = f"Обнаружен корень нецензурного слова (после нормализации): '{detected_word}' содержит корень '{bad_word}'"
-                        logging.info(reason)
-                        return True, reason
+                        yield match
 
     # 5. Прямая проверка слов из текста на основе частей слов
     for word in all_words:
         if len(word) >= 4:  # Минимальная длина слова для проверки
-            for bad_root in ["хуй", "пизд", "залуп"]:
+            for bad_root in KNOWN_ROOTS:
                 if bad_root in word:
-                    reason = f"Обнаружен корень нецензурного слова в слове: '{word}' (корень: '{bad_root}')"
-                    logging.info(reason)
-                    return True, reason
+                    yield from word_matches(word, bad_root, STAGE_KNOWN_ROOT)
+                    break
+
+    # 6. Слова, написанные латиницей или смесью латиницы и кириллицы, ищутся в индексе
+    # транслитерации; текст без латинских букв этот этап не затрагивает
+    translit = snapshot.translit
+    if translit is not None and has_latin(text_lower):
+        for word in all_words:
+            if has_latin(word):
+                found = translit.lookup(word)
+                if found:
+                    yield from word_matches(word, found[0], STAGE_TRANSLIT, NORMALIZATION_TRANSLIT)
+
+    # 7. Слова с одной опечаткой ищутся в индексе удалений (только при FUZZY_MATCHING):
+    # проверка слова стоит len(слово) + 1 обращений к индексу
+    fuzzy = snapshot.fuzzy
+    if fuzzy is not None:
+        for word in all_words:
+            # Слова с 'ё' проверяются в нормализованном виде, который тоже есть в all_words
+            if 'ё' in word or has_latin(word):
+                continue
+            # Слова, уже найденные на предыдущих этапах, повторно не проверяем
+            if all((start, end) in seen for start, end, _ in positions[word]):
+                continue
+            entry = fuzzy.lookup(word)
+            if entry:
+                yield from word_matches(word, entry, STAGE_FUZZY)
+
+def find_profanity(text: str, overlay: Optional['ChatOverlay'] = None,
+                   snapshot: Optional[DictionarySnapshot] = None) -> List[ProfanityMatch]:
+    """
+    Находит все совпадения с нецензурной лексикой за один проход по этапам проверки
+
+    Args:
+        text: Проверяемый текст
+        overlay: Словарь чата с дополнительно запрещенными и разрешенными словами
 
-    return False, None
\ No newline at end of file
+    Returns:
+        Совпадения, отсортированные по позиции в тексте
+    """
+    return sorted(iter_profanity(text, overlay, snapshot), key=lambda match: (match.start, -match.end))
+
+def first_profanity(text: str, overlay: Optional['ChatOverlay'] = None,
+                    snapshot: Optional[DictionarySnapshot] = None) -> Optional[ProfanityMatch]:
+    """
+    Находит первое совпадение с нецензурной лексикой, не выполняя остальные этапы проверки
+
+    Returns:
+        Совпадение или None, если нецензурная лексика не обнаружена
+    """
+    return next(iter_profanity(text, overlay, snapshot), None)
+
+def contains_profanity(text: str, overlay: Optional['ChatOverlay'] = None) -> tuple[bool, Optional[str]]:
+    """
+    Проверяет содержит ли текст нецензурную лексику.
+
+    Args:
+        text: Проверяемый текст
+        overlay: Словарь чата с дополнительно запрещенными и разрешенными словами
+
+    Returns:
+        Кортеж (результат, причина), где:
+        - результат: True если содержит нецензурную лексику, иначе False
+        - причина: строка с объяснением причины срабатывания или None, если нецензурная лексика не обнаружена
+    """
+    match = first_profanity(text, overlay)
+    if match is None:
+        return False, None
+    return True, match.reason
+
+def mask_profanity(text: str, matches: Iterable[ProfanityMatch]) -> str:
+    """
+    Маскирует найденные фрагменты: в каждом фрагменте остается первая буква,
+    остальные символы (кроме пробелов) заменяются на MASK_CHAR
+
+    Args:
+        text: Исходный текст
+        matches: Совпадения, найденные в этом тексте
+
+    Returns:
+        Текст с замаскированной нецензурной лексикой
+    """
+    masked = set()
+    for match in matches:
+        masked.update(range(match.start + 1, match.end))
+    if not masked:
+        return text
+    return ''.join(MASK_CHAR if index in masked and not char.isspace() else char
+                   for index, char in enumerate(text))
\ No newline at end of file
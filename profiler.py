@@ -0,0 +1,255 @@
+"""
+Модуль профилирования работающего бота по запросу администратора.
+
+Во время сеанса профилирования фоновый поток периодически снимает стек основного
+потока (сэмплирующий профилировщик CPU), а tracemalloc отслеживает выделения памяти.
+Вне сеанса профилировщик ничего не делает: поток не запущен, а measure()
+возвращает пустой контекстный менеджер.
+"""
+
+import asyncio
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from constants import PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_FUNCTIONS, PROFILE_TRACEMALLOC_FRAMES
+
+# Функции, время которых выносится в отчете отдельно
+CALLED_OUT_FUNCTIONS = ('iter_profanity', 'get_gif_url', 'process_message')
+
+# Кадр стека: (файл, функция)
+Frame = Tuple[str, str]
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# Текущий сеанс профилирования (None, если профилирование не запущено)
+_active_session: Optional['ProfileSession'] = None
+
+
+class ProfileSession:
+    """Сеанс профилирования CPU и памяти"""
+
+    def __init__(self, seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.seconds = seconds
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = 0
+        self.idle_samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self.stacks: Counter = Counter()
+        # Время выполнения (wall time) отдельных функций: имя -> [количество, сумма, максимум]
+        self.timings: Dict[str, List[float]] = {}
+        self.started = 0.0
+        self.finished = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._own_tracemalloc = False
+        self._snapshot_before: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_after: Optional[tracemalloc.Snapshot] = None
+        self._traced_memory = (0, 0)
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack: List[Frame] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+
+        self.samples += 1
+        leaf = stack[-1]
+        # Основной поток ждет событий в селекторе — цикл событий простаивает
+        if leaf[0] == 'selectors.py':
+            self.idle_samples += 1
+            return
+        self.self_counts[leaf] += 1
+        for item in set(stack):
+            self.total_counts[item] += 1
+        self.stacks[';'.join(f"{name} ({file})" for file, name in stack)] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._own_tracemalloc = True
+        self._snapshot_before = tracemalloc.take_snapshot()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._snapshot_after = tracemalloc.take_snapshot()
+        self._traced_memory = tracemalloc.get_traced_memory()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        self.finished = time.perf_counter()
+
+    def record_timing(self, name: str, duration: float) -> None:
+        stats = self.timings.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+    def _percent(self, count: int) -> float:
+        return 100.0 * count / self.samples if self.samples else 0.0
+
+    def _called_out(self) -> List[str]:
+        lines = []
+        for name in CALLED_OUT_FUNCTIONS:
+            cpu = sum(count for (file, func), count in self.total_counts.items() if func == name)
+            line = f"• {name}: CPU {self._percent(cpu):.1f}%"
+            if name in self.timings:
+                calls, total, longest = self.timings[name]
+                line += f", вызовов {calls}, всего {total:.3f} сек., макс. {longest * 1000:.1f} мс"
+            lines.append(line)
+        return lines
+
+    def _memory_diff(self, limit: int) -> List[str]:
+        if self._snapshot_before is None or self._snapshot_after is None:
+            return []
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        before = self._snapshot_before.filter_traces(filters)
+        after = self._snapshot_after.filter_traces(filters)
+        return [str(stat) for stat in after.compare_to(before, 'lineno')[:limit]]
+
+    def summary(self) -> str:
+        """Возвращает краткий отчет для ответа в чат"""
+        duration = self.finished - self.started
+        busy = self.samples - self.idle_samples
+        current, peak = self._traced_memory
+        lines = [
+            f"📈 Профиль за {duration:.1f} сек.: {self.samples} сэмплов, "
+            f"цикл событий занят {self._percent(busy):.1f}% времени",
+            "",
+            "Ключевые функции:",
+            *self._called_out(),
+            "",
+            f"Топ-{PROFILE_TOP_FUNCTIONS} функций по собственному времени CPU:"
+        ]
+        for (file, func), count in self.self_counts.most_common(PROFILE_TOP_FUNCTIONS):
+            lines.append(f"• {func} ({file}): {self._percent(count):.1f}%")
+        lines += ["", f"Память: сейчас {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ"]
+        lines += [f"• {line}" for line in self._memory_diff(3)]
+        return "\n".join(lines)
+
+    def full_report(self) -> str:
+        """Возвращает полный отчет для отправки файлом"""
+        sections = [self.summary(), "", "=== Суммарное время CPU (включая вложенные вызовы) ==="]
+        for (file, func), count in self.total_counts.most_common(100):
+            sections.append(f"{self._percent(count):6.2f}%  {count:6d}  {func} ({file})")
+        sections += ["", "=== Собственное время CPU ==="]
+        for (file, func), count in self.self_counts.most_common(100):
+            sections.append(f"{self._percent(count):6.2f}%  {count:6d}  {func} ({file})")
+        sections += ["", "=== Время выполнения (wall time) ==="]
+        for name, (calls, total, longest) in sorted(self.timings.items()):
+            sections.append(f"{name}: вызовов {calls}, всего {total:.3f} сек., "
+                            f"среднее {total / calls * 1000:.2f} мс, макс. {longest * 1000:.2f} мс")
+        sections += ["", "=== Изменения памяти (tracemalloc) ==="]
+        sections += self._memory_diff(50)
+        sections += ["", "=== Свернутые стеки (формат flamegraph.pl) ==="]
+        for stack, count in self.stacks.most_common():
+            sections.append(f"{stack} {count}")
+        return "\n".join(sections)
+
+
+def is_running() -> bool:
+    """Проверяет, идет ли сейчас сеанс профилирования"""
+    return _active_session is not None
+
+
+class _Timing:
+    """Контекстный менеджер, замеряющий время выполнения блока"""
+
+    __slots__ = ('name', 'session', 'started')
+
+    def __init__(self, name: str, session: ProfileSession):
+        self.name = name
+        self.session = session
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.session.record_timing(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def measure(name: str):
+    """
+    Замеряет время выполнения блока во время сеанса профилирования.
+    Вне сеанса возвращает пустой контекстный менеджер.
+
+    Args:
+        name: Название замера в отчете
+    """
+    session = _active_session
+    if session is None:
+        return _NULL_CONTEXT
+    return _Timing(name, session)
+
+
+def timed(name: str):
+    """
+    Декоратор корутины, замеряющий время ее выполнения во время сеанса профилирования
+
+    Args:
+        name: Название замера в отчете
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            session = _active_session
+            if session is None:
+                return await func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                session.record_timing(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+async def profile(seconds: float) -> ProfileSession:
+    """
+    Профилирует работающий процесс в течение указанного времени
+
+    Args:
+        seconds: Длительность сеанса
+
+    Returns:
+        Завершенный сеанс профилирования с результатами
+
+    Raises:
+        RuntimeError: Если сеанс профилирования уже запущен
+    """
+    global _active_session
+    if _active_session is not None:
+        raise RuntimeError("Профилирование уже запущено")
+
+    session = ProfileSession(seconds)
+    _active_session = session
+    try:
+        session.start()
+        await asyncio.sleep(seconds)
+    finally:
+        _active_session = None
+        session.stop()
+    return session
@@ -0,0 +1,120 @@
+"""
+Эталонная реализация проверки текста для дифференциального тестирования.
+
+Это замороженная копия функции contains_profanity из исходной версии
+profanity_filter.py (пять этапов: точное совпадение, нормализация ё/е, выражения,
+корни слов и жестко заданные основные корни). Изменены только две вещи:
+словарь передается аргументом, а не берется из глобальной переменной BAD_WORDS,
+и убрана запись причины в лог. Модуль не должен меняться вместе с фильтром:
+с ним сравниваются оптимизированные реализации в differential_check.py.
+"""
+
+import re
+from typing import AbstractSet, Optional
+
+
+def normalize_yo(text: str) -> str:
+    """
+    Заменяет букву 'ё' на 'е' для нормализации текста
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Текст с замененными 'ё' на 'е'
+    """
+    return text.replace('ё', 'е')
+
+
+def contains_profanity(text: str, bad_words: AbstractSet[str]) -> tuple[bool, Optional[str]]:
+    """
+    Проверяет содержит ли текст нецензурную лексику.
+
+    Args:
+        text: Проверяемый текст
+        bad_words: Словарь нецензурных слов
+
+    Returns:
+        Кортеж (результат, причина), где:
+        - результат: True если содержит нецензурную лексику, иначе False
+        - причина: строка с объяснением причины срабатывания или None, если нецензурная лексика не обнаружена
+    """
+    if not text:
+        return False, None
+
+    # Приводим текст к нижнему регистру
+    text_lower = text.lower()
+
+    # Также подготавливаем вариант текста с нормализованными 'ё' -> 'е'
+    text_normalized = normalize_yo(text_lower)
+
+    # Разбиваем на слова оба варианта текста
+    words = re.findall(r'\b\w+\b', text_lower)
+    words_normalized = re.findall(r'\b\w+\b', text_normalized)
+
+    # Объединяем оба набора слов
+    all_words = set(words + words_normalized)
+
+    # 1. Проверяем каждое слово на вхождение в список нецензурных слов напрямую
+    for word in all_words:
+        if word in bad_words:
+            reason = f"Обнаружено нецензурное слово: '{word}'"
+            return True, reason
+
+    # 2. Проверяем каждое слово с нормализацией ё->е
+    for bad_word in bad_words:
+        normalized_bad_word = normalize_yo(bad_word)
+        for word in all_words:
+            if word == normalized_bad_word or normalize_yo(word) == bad_word:
+                reason = f"Обнаружено нецензурное слово (после нормализации): '{word}' -> '{bad_word}'"
+                return True, reason
+
+    # 3. Проверяем на вхождение фраз и словосочетаний (для составных выражений)
+    for bad_word in bad_words:
+        if len(bad_word) > 3 and ' ' in bad_word:
+            # Для фраз проверяем как оригинал, так и нормализованную версию
+            if bad_word in text_lower or bad_word in text_normalized:
+                reason = f"Обнаружено нецензурное выражение: '{bad_word}'"
+                return True, reason
+
+            # Проверяем с нормализацией ё->е
+            normalized_bad_word = normalize_yo(bad_word)
+            if normalized_bad_word in text_lower or normalized_bad_word in text_normalized:
+                reason = f"Обнаружено нецензурное выражение (после нормализации): '{bad_word}'"
+                return True, reason
+
+    # 4. Проверяем вхождение корней слов (для обхода склонений)
+    for bad_word in bad_words:
+        if len(bad_word) > 3 and ' ' not in bad_word:
+            # Проверяем оригинальную версию плохого слова
+            for check_text in [text_lower, text_normalized]:
+                if bad_word in check_text:
+                    # Проверяем, что это именно корень слова, а не часть другого слова
+                    word_pattern = re.compile(f'\\b\\w*{re.escape(bad_word)}\\w*\\b')
+                    match = word_pattern.search(check_text)
+                    if match:
+                        detected_word = match.group(0)
+                        reason = f"Обнаружен корень нецензурного слова: '{detected_word}' содержит корень '{bad_word}'"
+                        return True, reason
+
+            # Проверяем нормализованную версию плохого слова
+            normalized_bad_word = normalize_yo(bad_word)
+            for check_text in [text_lower, text_normalized]:
+                if normalized_bad_word in check_text:
+                    # Проверяем, что это именно корень слова, а не часть другого слова
+                    word_pattern = re.compile(f'\\b\\w*{re.escape(normalized_bad_word)}\\w*\\b')
+                    match = word_pattern.search(check_text)
+                    if match:
+                        detected_word = match.group(0)
+                        reason = f"Обнаружен корень нецензурного слова (после нормализации): '{detected_word}' содержит корень '{bad_word}'"
+                        return True, reason
+
+    # 5. Прямая проверка слов из текста на основе частей слов
+    for word in all_words:
+        if len(word) >= 4:  # Минимальная длина слова для проверки
+            for bad_root in ["хуй", "пизд", "залуп"]:
+                if bad_root in word:
+                    reason = f"Обнаружен корень нецензурного слова в слове: '{word}' (корень: '{bad_root}')"
+                    return True, reason
+
+    return False, None
@@ -0,0 +1,149 @@
+"""
+Покрывающее множество корней для этапа поиска корней (этап 4 проверки).
+
+На этапе 4 слово сообщения считается нецензурным, если содержит слово словаря
+длиннее трех букв. Поэтому слово словаря, содержащее другое такое слово
+(после замены 'ё' на 'е'), для обнаружения ничего не добавляет: везде, где
+встречается "пиздатый", встречается и "пизда", и найденное слово сообщения
+будет тем же. Большая часть словоформ, которые генерирует generate_word_forms,
+именно такая.
+
+Покрытие строится один раз, при загрузке словаря: этап 4 перебирает только
+минимальные корни, а полный словарь остается для объяснения причины — при
+срабатывании среди покрытых корнем слов ищется то, которое есть в найденном
+слове сообщения в том же написании, а из таких — самое длинное.
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Корни из букв, цифр и подчеркивания: только для них найденное слово сообщения
+# не зависит от того, какой из вложенных корней сработал
+_WORD_ROOT = re.compile(r'\w+')
+
+
+def is_root_entry(entry: str) -> bool:
+    """Проверяет, участвует ли слово словаря в поиске корней (этап 4)"""
+    return len(entry) > 3 and ' ' not in entry
+
+
+class RootCover:
+    """
+    Корни для этапа 4: минимальное покрывающее множество и покрытые ими слова словаря.
+    Объект не изменяется после создания.
+    """
+
+    __slots__ = ('roots', 'pairs', 'covered', 'candidates')
+
+    def __init__(self, roots: Tuple[str, ...], covered: Dict[str, Tuple[str, ...]], candidates: int):
+        # Слова словаря, которые перебираются на этапе 4
+        self.roots = roots
+        # Те же слова вместе с нормализованной формой: корень может встретиться в тексте,
+        # только если его нормализованная форма есть в нормализованном тексте
+        self.pairs = tuple((root, root.replace('ё', 'е')) for root in roots)
+        # Корень -> слова словаря, исключенные из перебора, потому что содержат этот корень
+        self.covered = covered
+        # Количество слов словаря, участвующих в поиске корней до сокращения
+        self.candidates = candidates
+
+    @classmethod
+    def build(cls, dictionary: Iterable[str], prune: bool = True) -> 'RootCover':
+        """
+        Строит покрытие для слов словаря (блокирующая операция)
+
+        Args:
+            dictionary: Слова словаря
+            prune: Исключать ли покрытые слова (False — перебирать все слова, как без покрытия)
+        """
+        entries = sorted(entry for entry in dictionary if is_root_entry(entry))
+        if not prune:
+            return cls(tuple(entries), {}, len(entries))
+
+        roots: List[str] = []
+        covered: Dict[str, List[str]] = {}
+        # Нормализованный корень -> слово словаря, под которым он перебирается
+        kept: Dict[str, str] = {}
+        # Короткие слова проверяются первыми: покрыть слово может только слово не длиннее его
+        for entry in sorted(entries, key=lambda entry: (len(entry), entry)):
+            if not _WORD_ROOT.fullmatch(entry):
+                # Корни с дефисом и другими знаками ищутся по своим правилам и не сокращаются
+                roots.append(entry)
+                continue
+            normalized = entry.replace('ё', 'е')
+            root = cls._find_cover(normalized, kept)
+            if root is None:
+                kept[normalized] = entry
+                roots.append(entry)
+            else:
+                covered.setdefault(root, []).append(entry)
+        return cls(tuple(roots), {root: tuple(words) for root, words in covered.items()}, len(entries))
+
+    @staticmethod
+    def _find_cover(normalized: str, kept: Dict[str, str]) -> Optional[str]:
+        """Ищет среди уже отобранных корней содержащийся в слове; проверяются все его подстроки от 4 букв"""
+        length = len(normalized)
+        for size in range(4, length + 1):
+            for start in range(length - size + 1):
+                root = kept.get(normalized[start:start + size])
+                if root is not None:
+                    return root
+        return None
+
+    def entry_for(self, root: str, word: str) -> str:
+        """
+        Находит слово словаря для объяснения причины. Предпочтение отдается словам,
+        которые буквально есть в найденном слове сообщения (с той же 'ё' или 'е'),
+        затем словам, совпадающим после нормализации 'ё'; среди них — самому длинному.
+
+        Args:
+            root: Сработавший корень
+            word: Найденное слово сообщения в нижнем регистре, без нормализации 'ё'
+        """
+        normalized_word = word.replace('ё', 'е')
+
+        def rank(entry: str) -> Tuple[int, int]:
+            if entry in word:
+                return 2, len(entry)
+            if entry in normalized_word:
+                return 1, len(entry)
+            return 0, len(entry)
+
+        best = root
+        candidates = self.covered.get(root)
+        if candidates:
+            best_rank = rank(root)
+            for entry in candidates:
+                if entry.replace('ё', 'е') not in normalized_word:
+                    continue
+                entry_rank = rank(entry)
+                if entry_rank > best_rank:
+                    best, best_rank = entry, entry_rank
+        return best
+
+    @property
+    def pruned(self) -> int:
+        """Количество слов, исключенных из перебора"""
+        return self.candidates - len(self.roots)
+
+    def report(self) -> Dict[str, Union[int, float]]:
+        """Возвращает показатели покрытия для отчетов"""
+        return {
+            'candidates': self.candidates,
+            'roots': len(self.roots),
+            'pruned': self.pruned,
+            'shrink': round(self.pruned / self.candidates, 4) if self.candidates else 0.0
+        }
+
+    def log_report(self) -> None:
+        """Пишет в лог, насколько сократился перебор корней"""
+        report = self.report()
+        logger.info(f"Поиск корней: {report['roots']} корней вместо {report['candidates']} слов "
+                    f"(исключено {report['pruned']}, {report['shrink']:.0%})")
+
+
+def covered_words(cover: RootCover) -> Set[str]:
+    """Возвращает все слова словаря, исключенные из перебора"""
+    return {entry for entries in cover.covered.values() for entry in entries}
@@ -0,0 +1,289 @@
+"""
+Проверка истории чатов из экспорта Telegram Desktop (result.json) на нецензурную лексику.
+
+Файл экспорта читается потоково: в памяти находятся только текущий фрагмент файла
+и ограниченное число пачек сообщений, отправленных на проверку, поэтому расход памяти
+не зависит от размера экспорта. Сообщения проверяются функцией find_profanity
+в пуле процессов, по одному процессу на ядро.
+
+Результаты записываются в директорию отчета:
+    users.csv     — статистика по пользователям
+    days.csv      — статистика по дням
+    matches.jsonl — сообщения с нецензурной лексикой, причиной срабатывания и фрагментами
+
+Пример запуска:
+    python scan_export.py ChatExport/result.json --output-dir scan_report --workers 8
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Set, Tuple
+
+import profanity_filter
+from profanity_filter import FALLBACK_BAD_WORDS, find_profanity, load_cached_bad_words
+
+logger = logging.getLogger(__name__)
+
+# Размер фрагмента файла, читаемого за один раз (в символах)
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Сколько пачек на один процесс может одновременно ожидать проверки
+IN_FLIGHT_PER_WORKER = 4
+
+# Начало массива сообщений чата. Внутри строк JSON кавычки экранированы,
+# а сами сообщения разбираются целиком, поэтому ключ не спутать с текстом сообщения
+MESSAGES_KEY = re.compile(r'"messages"\s*:\s*\[')
+CHAT_NAME = re.compile(r'"name"\s*:\s*("(?:[^"\\]|\\.)*"|null)')
+CHAT_ID = re.compile(r'"id"\s*:\s*(-?\d+)')
+OBJECT_START = re.compile(r'\{\s*"')
+
+# Сколько символов перед массивом сообщений хранится для определения названия чата
+CHAT_HEADER_SIZE = 4096
+
+# Сообщение в пачке: (номер в пачке, текст)
+BatchItem = Tuple[int, str]
+# Результат проверки: (номер в пачке, причина, найденные фрагменты)
+BatchResult = Tuple[int, str, List[Dict[str, Any]]]
+
+
+def _parse_chat_header(header: str) -> Dict[str, Any]:
+    """Извлекает название и ID чата из текста объекта чата перед массивом сообщений"""
+    # Поля чата идут после открывающей скобки его объекта (за ней сразу следует ключ)
+    starts = list(OBJECT_START.finditer(header))
+    if starts:
+        header = header[starts[-1].end() - 1:]
+    chat: Dict[str, Any] = {'name': None, 'id': None}
+    names = CHAT_NAME.findall(header)
+    if names:
+        chat['name'] = json.loads(names[-1])
+    ids = CHAT_ID.findall(header)
+    if ids:
+        chat['id'] = int(ids[-1])
+    return chat
+
+
+def iter_export_messages(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Потоково перебирает сообщения экспорта. Поддерживаются экспорт одного чата
+    и экспорт всего аккаунта (несколько массивов сообщений).
+
+    Args:
+        path: Путь к result.json
+        chunk_size: Размер читаемого фрагмента
+
+    Yields:
+        Кортежи (чат, сообщение), где чат — словарь с полями name и id
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        in_array = False
+        chat: Dict[str, Any] = {}
+
+        def read_more(keep_from: int) -> None:
+            nonlocal buffer, pos, eof
+            buffer = buffer[keep_from:]
+            pos -= keep_from
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+        while True:
+            if not in_array:
+                match = MESSAGES_KEY.search(buffer, pos)
+                if match is None:
+                    if eof:
+                        return
+                    # Хвост сохраняется: ключ и название чата могут попасть на границу фрагментов
+                    read_more(max(pos, len(buffer) - CHAT_HEADER_SIZE))
+                    continue
+                chat = _parse_chat_header(buffer[max(pos, match.start() - CHAT_HEADER_SIZE):match.start()])
+                pos = match.end()
+                in_array = True
+                continue
+
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError("Файл экспорта оборван внутри массива сообщений")
+                read_more(pos)
+                continue
+            if buffer[pos] == ']':
+                pos += 1
+                in_array = False
+                continue
+            try:
+                message, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Сообщение не поместилось во фрагмент целиком
+                if eof:
+                    raise
+                read_more(pos)
+                continue
+            pos = end
+            yield chat, message
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Возвращает текст сообщения; форматированный текст экспортируется списком фрагментов"""
+    text = message.get('text', '')
+    if isinstance(text, str):
+        return text
+    return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+
+
+def load_dictionary() -> Set[str]:
+    """Загружает словарь бота: кеш с примененным журналом изменений"""
+    words = load_cached_bad_words()
+    if words is None:
+        logger.warning(f"Кеш словаря {profanity_filter.CACHE_FILE} не найден, используется базовый набор слов")
+        words = set(FALLBACK_BAD_WORDS)
+    words, _ = profanity_filter.journal.replay(words)
+    return words
+
+
+def _init_worker(words: Set[str]) -> None:
+    """Инициализирует процесс пула: словарь передается один раз при запуске процесса"""
+    profanity_filter.set_bad_words(words)
+
+
+def scan_batch(batch: List[BatchItem]) -> List[BatchResult]:
+    """Проверяет пачку сообщений в процессе пула и возвращает только найденные"""
+    results = []
+    for index, text in batch:
+        matches = find_profanity(text)
+        if matches:
+            spans = [match.to_dict(text) for match in matches]
+            results.append((index, matches[0].reason, spans))
+    return results
+
+
+class ExportScanner:
+    """Распределяет сообщения экспорта по пулу процессов и собирает статистику"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        # user_id -> [имя, сообщений, с нецензурной лексикой]
+        self.users: Dict[str, List[Any]] = {}
+        # день -> [сообщений, с нецензурной лексикой]
+        self.days: Dict[str, List[int]] = {}
+        self.messages = 0
+        self.profane = 0
+        self._pending: Deque[Tuple[Future, List[Dict[str, Any]]]] = deque()
+
+    def _submit(self, pool: ProcessPoolExecutor, meta: List[Dict[str, Any]], matches_file) -> None:
+        batch = [(index, item['text']) for index, item in enumerate(meta)]
+        self._pending.append((pool.submit(scan_batch, batch), meta))
+        # Ограничиваем число пачек в очереди пула, чтобы память не росла с размером экспорта
+        while len(self._pending) >= self.args.workers * IN_FLIGHT_PER_WORKER:
+            self._collect(matches_file)
+
+    def _collect(self, matches_file) -> None:
+        future, meta = self._pending.popleft()
+        for index, reason, spans in future.result():
+            item = meta[index]
+            self.profane += 1
+            self.users[item['user_id']][2] += 1
+            self.days[item['day']][1] += 1
+            record = dict(item, reason=reason, spans=spans)
+            matches_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def run(self, words: Set[str]) -> None:
+        os.makedirs(self.args.output_dir, exist_ok=True)
+        matches_path = os.path.join(self.args.output_dir, 'matches.jsonl')
+        with ProcessPoolExecutor(self.args.workers, initializer=_init_worker, initargs=(words,)) as pool, \
+                open(matches_path, 'w', encoding='utf-8') as matches_file:
+            meta: List[Dict[str, Any]] = []
+            for chat, message in iter_export_messages(self.args.export):
+                if message.get('type') != 'message':
+                    continue
+                text = message_text(message)
+                if not text:
+                    continue
+
+                user_id = str(message.get('from_id') or message.get('from') or 'unknown')
+                day = str(message.get('date', ''))[:10]
+                self.messages += 1
+                self.users.setdefault(user_id, [message.get('from') or user_id, 0, 0])[1] += 1
+                self.days.setdefault(day, [0, 0])[0] += 1
+                meta.append({
+                    'chat': chat.get('name'),
+                    'chat_id': chat.get('id'),
+                    'message_id': message.get('id'),
+                    'date': message.get('date'),
+                    'user_id': user_id,
+                    'user': message.get('from'),
+                    'day': day,
+                    'text': text
+                })
+                if len(meta) >= self.args.batch_size:
+                    self._submit(pool, meta, matches_file)
+                    meta = []
+
+            if meta:
+                self._submit(pool, meta, matches_file)
+            while self._pending:
+                self._collect(matches_file)
+
+    def write_stats(self) -> None:
+        users_path = os.path.join(self.args.output_dir, 'users.csv')
+        with open(users_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['user_id', 'name', 'messages', 'profane', 'profane_share'])
+            for user_id, (name, messages, profane) in sorted(self.users.items(), key=lambda item: -item[1][2]):
+                writer.writerow([user_id, name, messages, profane, f"{profane / messages:.4f}"])
+
+        days_path = os.path.join(self.args.output_dir, 'days.csv')
+        with open(days_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['day', 'messages', 'profane', 'profane_share'])
+            for day, (messages, profane) in sorted(self.days.items()):
+                writer.writerow([day, messages, profane, f"{profane / messages:.4f}"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Проверка экспорта чатов Telegram Desktop на нецензурную лексику")
+    parser.add_argument('export', help="путь к result.json из экспорта Telegram Desktop")
+    parser.add_argument('--output-dir', default='scan_report', help="директория для отчета")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="количество процессов")
+    parser.add_argument('--batch-size', type=int, default=500, help="сообщений в одной пачке")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    words = load_dictionary()
+    logger.info(f"Словарь: {len(words)} слов, процессов: {args.workers}")
+
+    scanner = ExportScanner(args)
+    started = time.perf_counter()
+    try:
+        scanner.run(words)
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка при чтении экспорта {args.export}: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    scanner.write_stats()
+
+    rate = scanner.messages / elapsed if elapsed else 0.0
+    print(f"Проверено сообщений: {scanner.messages} за {elapsed:.1f} сек. ({rate:.0f} сообщ./сек.)")
+    print(f"С нецензурной лексикой: {scanner.profane}, пользователей: {len(scanner.users)}, дней: {len(scanner.days)}")
+    print(f"Отчет записан в {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
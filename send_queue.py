@@ -0,0 +1,429 @@
+"""
+Модуль централизованной очереди исходящих сообщений с учетом лимитов Telegram
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram.utils.exceptions import RetryAfter
+
+import tracing
+from constants import (
+    SEND_GLOBAL_RATE, SEND_PRIVATE_CHAT_RATE, SEND_GROUP_CHAT_RATE,
+    SEND_GROUP_CHAT_BURST, SEND_MAX_RETRY_AFTER_ATTEMPTS, SEND_CHAT_BACKLOG_LIMIT,
+    PRIORITY_PROFANITY, PRIORITY_NOTIFICATION, PRIORITY_DIGEST
+)
+
+logger = logging.getLogger(__name__)
+
+# Фабрика отправки: вызывается в момент отправки и возвращает корутину запроса к API
+SendFactory = Callable[[], Awaitable[Any]]
+
+# Состояния чата в планировщике
+_IDLE = 0  # заданий нет
+_WAITING = 1  # ждет токена в корзине чата
+_READY = 2  # можно отправлять
+_BUSY = 3  # сообщение в чат отправляется
+
+
+class SendDropped(Exception):
+    """Сообщение отброшено из переполненной очереди чата или при остановке очереди"""
+
+
+class TokenBucket:
+    """Корзина токенов для ограничения частоты запросов"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Момент, до которого корзина заблокирована ответом retry_after
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """
+        Возвращает время ожидания до появления токена
+
+        Returns:
+            0, если токен доступен сразу, иначе количество секунд ожидания
+        """
+        now = time.monotonic() if now is None else now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: Optional[float] = None) -> None:
+        """Списывает один токен (вызывать только после delay() == 0)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Блокирует корзину на указанное время (обработка retry_after)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class _SendJob:
+    """Задание на отправку сообщения"""
+
+    __slots__ = ('chat_id', 'factory', 'priority', 'seq', 'future', 'attempts', 'context', 'queued_at')
+
+    def __init__(self, chat_id: int, factory: SendFactory, priority: int, seq: int,
+                 future: asyncio.Future):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.attempts = 0
+        # Контекст отправителя: отправка выполняется в нем, чтобы попасть в трассу обновления
+        self.context = contextvars.copy_context()
+        self.queued_at = time.perf_counter()
+
+
+class _ChatQueue:
+    """Задания одного чата: очередь FIFO для каждого приоритета"""
+
+    __slots__ = ('chat_id', 'jobs', 'size', 'state', 'key')
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        # Приоритет -> задания в порядке поступления; пустые очереди удаляются
+        self.jobs: Dict[int, Deque[_SendJob]] = {}
+        self.size = 0
+        self.state = _IDLE
+        # Ключ актуальной записи чата в куче готовых чатов; записи с другим ключом устарели
+        self.key: Optional[Tuple[int, int]] = None
+
+    def head(self) -> _SendJob:
+        """Первое задание самого высокого приоритета (очередь не пуста)"""
+        return self.jobs[min(self.jobs)][0]
+
+    def append(self, job: _SendJob, first: bool = False) -> None:
+        jobs = self.jobs.setdefault(job.priority, deque())
+        if first:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+        self.size += 1
+
+    def popleft(self, priority: int) -> _SendJob:
+        jobs = self.jobs[priority]
+        job = jobs.popleft()
+        if not jobs:
+            del self.jobs[priority]
+        self.size -= 1
+        return job
+
+
+class SendScheduler:
+    """
+    Планировщик исходящих сообщений.
+
+    Сообщения отправляются в порядке приоритета (ответы на мат, затем уведомления,
+    затем сводки), с соблюдением глобального лимита и лимита для каждого чата.
+    Внутри одного чата порядок отправки сохраняется: следующее сообщение в чат
+    уходит только после завершения предыдущего.
+
+    Задания хранятся в очередях чатов, а планируются сами чаты: готовые к отправке —
+    в куче по приоритету и номеру первого задания, ожидающие лимита чата — в куче
+    по времени готовности. Поэтому выбор задания стоит O(log чатов) независимо
+    от того, сколько сообщений накопилось в одном чате. Очередь чата ограничена
+    SEND_CHAT_BACKLOG_LIMIT: при переполнении отбрасываются самые старые задания
+    самого низкого приоритета (сводки, затем уведомления).
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE,
+                 private_chat_rate: float = SEND_PRIVATE_CHAT_RATE,
+                 group_chat_rate: float = SEND_GROUP_CHAT_RATE):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chats: Dict[int, _ChatQueue] = {}
+        # Готовые чаты: (приоритет, номер первого задания, ID чата)
+        self._ready: List[Tuple[int, int, int]] = []
+        # Чаты, ожидающие лимита: (момент готовности, ID чата)
+        self._waiting: List[Tuple[float, int]] = []
+        self._size = 0
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._in_flight = set()
+        self.sent_count = 0
+        self.failed_count = 0
+        self.retry_after_count = 0
+        self.dropped_count = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID принадлежат группам и каналам, для них лимит строже
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_chat_rate, SEND_GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(self.private_chat_rate, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def set_global_rate(self, rate: float) -> None:
+        """
+        Изменяет глобальный лимит отправки
+
+        Args:
+            rate: Допустимое количество сообщений в секунду
+        """
+        self.global_bucket = TokenBucket(rate, max(rate, 1))
+
+    @property
+    def queue_size(self) -> int:
+        """Количество сообщений, ожидающих отправки"""
+        return self._size
+
+    def submit(self, chat_id: int, factory: SendFactory,
+               priority: int = PRIORITY_NOTIFICATION) -> asyncio.Future:
+        """
+        Ставит отправку в очередь и сразу возвращает управление
+
+        Args:
+            chat_id: ID чата, в который отправляется сообщение
+            factory: Функция без аргументов, возвращающая корутину отправки
+            priority: Приоритет (меньше — важнее)
+
+        Returns:
+            Future с результатом отправки; ожидать его не обязательно
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        # Ошибки отправки логируются планировщиком, поэтому помечаем исключение как полученное
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job = _SendJob(chat_id, factory, priority, next(self._seq), future)
+        self._push(job)
+        return future
+
+    def _push(self, job: _SendJob, first: bool = False) -> None:
+        chat = self._chats.get(job.chat_id)
+        if chat is None:
+            chat = self._chats[job.chat_id] = _ChatQueue(job.chat_id)
+        chat.append(job, first)
+        self._size += 1
+        if chat.size > SEND_CHAT_BACKLOG_LIMIT:
+            self._drop_oldest(chat)
+        if chat.state == _IDLE:
+            self._schedule(chat, time.monotonic())
+        elif chat.state == _READY:
+            self._refresh(chat)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drop_oldest(self, chat: _ChatQueue) -> None:
+        job = chat.popleft(max(chat.jobs))
+        self._size -= 1
+        self.dropped_count += 1
+        logger.debug(f"Очередь отправки в чат {chat.chat_id} переполнена, "
+                     f"отброшено сообщение с приоритетом {job.priority}")
+        self._resolve(job, exception=SendDropped(f"Очередь отправки в чат {chat.chat_id} переполнена"))
+
+    def _schedule(self, chat: _ChatQueue, now: float) -> None:
+        """Помещает чат с заданиями в кучу готовых или ожидающих лимита чата"""
+        delay = self._chat_bucket(chat.chat_id).delay(now)
+        if delay > 0:
+            chat.state = _WAITING
+            heapq.heappush(self._waiting, (now + delay, chat.chat_id))
+        else:
+            chat.state = _READY
+            chat.key = None
+            self._refresh(chat)
+
+    def _refresh(self, chat: _ChatQueue) -> None:
+        """Добавляет запись готового чата, если первое задание в нем сменилось"""
+        head = chat.head()
+        key = (head.priority, head.seq)
+        if key != chat.key:
+            chat.key = key
+            heapq.heappush(self._ready, (head.priority, head.seq, chat.chat_id))
+
+    def _release(self, chat_id: int) -> None:
+        """Снимает с чата отметку отправки и планирует его оставшиеся задания"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return
+        if chat.size:
+            self._schedule(chat, time.monotonic())
+        else:
+            del self._chats[chat_id]
+
+    def _clear(self) -> int:
+        """Очищает очереди и возвращает количество отброшенных заданий"""
+        dropped = self._size
+        for chat in self._chats.values():
+            for jobs in chat.jobs.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+        self._waiting.clear()
+        self._size = 0
+        return dropped
+
+    @property
+    def started(self) -> bool:
+        """Запущена ли обработка очереди в этом процессе"""
+        return self._runner is not None
+
+    def reset_after_fork(self) -> None:
+        """
+        Сбрасывает состояние, унаследованное дочерним процессом при fork: задания и их Future
+        принадлежат циклу событий родительского процесса и отправляться повторно не должны
+        """
+        # Future заданий принадлежат циклу событий родителя, поэтому не отменяются
+        dropped = self._size
+        self._chats.clear()
+        self._ready.clear()
+        self._waiting.clear()
+        self._size = 0
+        self._in_flight = set()
+        self._chat_buckets.clear()
+        self._wakeup = None
+        self._runner = None
+        if dropped:
+            logger.warning(f"Отброшено сообщений, унаследованных от родительского процесса: {dropped}")
+
+    def start(self) -> None:
+        """Запускает фоновую обработку очереди"""
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+            logger.info("Очередь отправки сообщений запущена")
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Останавливает очередь, предварительно дождавшись отправки оставшихся сообщений
+
+        Args:
+            timeout: Максимальное время ожидания опустошения очереди в секундах
+        """
+        if self._runner is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._size or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+        self._clear()
+        logger.info("Очередь отправки сообщений остановлена")
+
+    def _take_ready_job(self) -> Tuple[Optional[_SendJob], float]:
+        """
+        Извлекает из очереди самое приоритетное задание, которое можно отправить сейчас
+
+        Returns:
+            Кортеж (задание или None, время ожидания до следующей попытки)
+        """
+        now = time.monotonic()
+        global_delay = self.global_bucket.delay(now)
+        if global_delay > 0:
+            return None, global_delay
+
+        # Чаты, дождавшиеся лимита, переходят в кучу готовых
+        while self._waiting and self._waiting[0][0] <= now:
+            _, chat_id = heapq.heappop(self._waiting)
+            self._schedule(self._chats[chat_id], now)
+
+        while self._ready:
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            # Запись устарела: чат уже отправляет или первое задание в нем сменилось
+            if chat is None or chat.state != _READY or chat.key != (priority, seq):
+                continue
+            job = chat.popleft(priority)
+            self._size -= 1
+            chat.state = _BUSY
+            chat.key = None
+            return job, 0.0
+
+        return None, self._waiting[0][0] - now if self._waiting else 1.0
+
+    async def _run(self) -> None:
+        while True:
+            job, wait = self._take_ready_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.monotonic()
+            self.global_bucket.consume(now)
+            self._chat_bucket(job.chat_id).consume(now)
+            task = asyncio.create_task(self._send(job), context=job.context)
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, job: _SendJob) -> None:
+        try:
+            job.attempts += 1
+            tracing.record_span('queue', job.queued_at, time.perf_counter(), priority=job.priority)
+            with tracing.span('send', attempt=job.attempts):
+                result = await job.factory()
+        except RetryAfter as e:
+            self.retry_after_count += 1
+            logger.warning(f"Telegram просит подождать {e.timeout} сек. перед отправкой в чат {job.chat_id}")
+            self._chat_bucket(job.chat_id).block(e.timeout)
+            if job.attempts < SEND_MAX_RETRY_AFTER_ATTEMPTS:
+                # Возвращаем задание в очередь с исходным порядковым номером,
+                # чтобы оно ушло раньше более поздних сообщений в этот чат
+                job.queued_at = time.perf_counter()
+                self._push(job, first=True)
+            else:
+                self.failed_count += 1
+                logger.error(f"Не удалось отправить сообщение в чат {job.chat_id}: исчерпаны попытки после retry_after")
+                self._resolve(job, exception=e)
+        except Exception as e:
+            self.failed_count += 1
+            logger.error(f"Ошибка при отправке сообщения в чат {job.chat_id}: {e}")
+            self._resolve(job, exception=e)
+        else:
+            self.sent_count += 1
+            self._resolve(job, result=result)
+        finally:
+            self._release(job.chat_id)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    @staticmethod
+    def _resolve(job: _SendJob, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        if job.future.done():
+            return
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(result)
+
+
+# Общий планировщик отправки для бота
+send_scheduler = SendScheduler()
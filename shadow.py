@@ -0,0 +1,225 @@
+"""
+Модуль теневой проверки кандидата на реальных сообщениях.
+
+Перед заменой словаря (например, после нового обхода Викисловаря) или включением
+нового способа поиска полезно знать, чем его решения и задержка отличаются от текущих.
+Теневая проверка берет выбранную долю сообщений и в отдельном потоке проверяет
+каждое из них дважды: текущим снимком словаря и снимком-кандидатом. На ответы бота
+это не влияет. Расхождения вместе с причинами и задержкой обоих вариантов хранятся
+в кольцевом буфере ограниченного размера, а сводку показывает команда /shadow.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Deque, List, Optional
+
+from dotenv import load_dotenv
+
+import profanity_filter
+from profanity_filter import DictionarySnapshot, first_profanity, read_dictionary_file
+from constants import (SHADOW_STORE_SIZE, SHADOW_LATENCY_WINDOW, SHADOW_MAX_PENDING,
+                       SHADOW_REPORT_EXAMPLES, SHADOW_TEXT_LIMIT)
+
+if TYPE_CHECKING:
+    from chat_dictionaries import ChatOverlay
+
+# Загрузка переменных окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Доля сообщений, проверяемых кандидатом, пока теневая проверка запущена
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0.1'))
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Возвращает перцентиль q (0..100) для отсортированного списка"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class ShadowRecord:
+    """Сообщение, по которому текущий словарь и кандидат разошлись"""
+
+    __slots__ = ('time', 'chat_id', 'text', 'current_reason', 'candidate_reason', 'current_ms', 'candidate_ms')
+
+    def __init__(self, chat_id: int, text: str, current_reason: Optional[str], candidate_reason: Optional[str],
+                 current_ms: float, candidate_ms: float):
+        self.time = time.time()
+        self.chat_id = chat_id
+        self.text = text if len(text) <= SHADOW_TEXT_LIMIT else text[:SHADOW_TEXT_LIMIT] + "…"
+        self.current_reason = current_reason
+        self.candidate_reason = candidate_reason
+        self.current_ms = current_ms
+        self.candidate_ms = candidate_ms
+
+
+class ShadowEvaluator:
+    """Теневая проверка снимка-кандидата на выборке сообщений"""
+
+    def __init__(self, sample_rate: float = SHADOW_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.candidate: Optional[DictionarySnapshot] = None
+        self.label = ''
+        self.records: Deque[ShadowRecord] = deque(maxlen=SHADOW_STORE_SIZE)
+        self.current_latency: Deque[float] = deque(maxlen=SHADOW_LATENCY_WINDOW)
+        self.candidate_latency: Deque[float] = deque(maxlen=SHADOW_LATENCY_WINDOW)
+        # Проверки идут в одном отдельном потоке, чтобы не занимать цикл событий
+        # и не конкурировать с обработкой сообщений несколькими потоками
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.started = time.time()
+        self.checked = 0
+        self.skipped = 0
+        self.candidate_only = 0
+        self.current_only = 0
+        self.reason_changed = 0
+        self.records.clear()
+        self.current_latency.clear()
+        self.candidate_latency.clear()
+
+    @property
+    def running(self) -> bool:
+        return self.candidate is not None
+
+    async def start(self, path: Optional[str] = None, fuzzy: Optional[bool] = None) -> DictionarySnapshot:
+        """
+        Запускает теневую проверку
+
+        Args:
+            path: Файл словаря-кандидата (по умолчанию — текущий словарь)
+            fuzzy: Включить или выключить у кандидата поиск слов с опечатками
+                (по умолчанию — как у текущего словаря)
+
+        Returns:
+            Снимок-кандидат
+
+        Raises:
+            OSError, ValueError: Если файл словаря не прочитан
+        """
+        current = profanity_filter.current_snapshot()
+        if fuzzy is None:
+            fuzzy = current.fuzzy is not None
+        if path:
+            data = await asyncio.to_thread(read_dictionary_file, path)
+            words = set(data['words'])
+            label = f"{os.path.basename(path)} (версия {data['version']})"
+        else:
+            words = current.words
+            label = "текущий словарь"
+        if fuzzy:
+            label += ", с опечатками"
+        # Поиск латиницей у кандидата такой же, как у текущего словаря
+        candidate = await asyncio.to_thread(DictionarySnapshot.build, words, fuzzy, current.translit is not None)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='shadow')
+        self.candidate = candidate
+        self.label = label
+        self._reset_counters()
+        logger.info(f"Теневая проверка запущена: кандидат {label}, {len(words)} слов, доля {self.sample_rate:.0%}")
+        return candidate
+
+    def stop(self) -> None:
+        """Останавливает теневую проверку; накопленная статистика сохраняется до следующего запуска"""
+        self.candidate = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logger.info("Теневая проверка остановлена")
+
+    def submit(self, chat_id: int, text: str, overlay: Optional['ChatOverlay'] = None) -> None:
+        """
+        Отправляет сообщение на теневую проверку, если оно попало в выборку.
+        Возвращает управление сразу и не влияет на обработку сообщения.
+        """
+        candidate = self.candidate
+        if candidate is None or random.random() >= self.sample_rate:
+            return
+        if self._pending >= SHADOW_MAX_PENDING:
+            # Поток проверки не успевает: пропускаем сообщение, а не копим очередь
+            self.skipped += 1
+            return
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._compare, candidate, profanity_filter.current_snapshot(),
+                                      text, overlay)
+        future.add_done_callback(lambda f, c=chat_id, t=text: self._collect(f, c, t))
+
+    @staticmethod
+    def _compare(candidate: DictionarySnapshot, current: DictionarySnapshot, text: str,
+                 overlay: Optional['ChatOverlay']):
+        started = time.perf_counter()
+        current_match = first_profanity(text, overlay, current)
+        current_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        candidate_match = first_profanity(text, overlay, candidate)
+        candidate_ms = (time.perf_counter() - started) * 1000
+        return (current_match.reason if current_match else None, current_ms,
+                candidate_match.reason if candidate_match else None, candidate_ms)
+
+    def _collect(self, future: asyncio.Future, chat_id: int, text: str) -> None:
+        self._pending -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"Ошибка теневой проверки: {future.exception()}")
+            return
+        current_reason, current_ms, candidate_reason, candidate_ms = future.result()
+        self.checked += 1
+        self.current_latency.append(current_ms)
+        self.candidate_latency.append(candidate_ms)
+        if (current_reason is None) == (candidate_reason is None):
+            if current_reason != candidate_reason:
+                self.reason_changed += 1
+            return
+        if current_reason is None:
+            self.candidate_only += 1
+        else:
+            self.current_only += 1
+        self.records.append(ShadowRecord(chat_id, text, current_reason, candidate_reason, current_ms, candidate_ms))
+
+    def summary(self, examples: int = SHADOW_REPORT_EXAMPLES) -> str:
+        """Формирует сводку для команды /shadow"""
+        if not self.running and not self.checked:
+            return "Теневая проверка не запущена"
+
+        state = "идет" if self.running else "остановлена"
+        minutes = (time.time() - self.started) / 60
+        disagreements = self.candidate_only + self.current_only
+        share = disagreements / self.checked if self.checked else 0.0
+        lines = [
+            f"👥 Теневая проверка {state}: кандидат {self.label}, доля сообщений {self.sample_rate:.0%}, "
+            f"{minutes:.0f} мин.",
+            f"Проверено: {self.checked}, пропущено из-за нагрузки: {self.skipped}",
+            f"Расхождений: {disagreements} ({share:.2%}): нашел только кандидат — {self.candidate_only}, "
+            f"только текущий словарь — {self.current_only}",
+            f"Совпал ответ, но различается причина: {self.reason_changed}"
+        ]
+        for title, values in (("текущий", self.current_latency), ("кандидат", self.candidate_latency)):
+            ordered = sorted(values)
+            lines.append(f"Задержка ({title}), мс: p50={_percentile(ordered, 50):.3f} "
+                         f"p99={_percentile(ordered, 99):.3f} max={ordered[-1] if ordered else 0.0:.3f}")
+
+        recent = list(self.records)[-examples:]
+        if recent:
+            lines.append(f"\nПоследние расхождения (хранится {len(self.records)} из {self.records.maxlen}):")
+        for record in reversed(recent):
+            lines.append(f"• [{record.chat_id}] {record.text}\n"
+                         f"  текущий ({record.current_ms:.2f} мс): {record.current_reason or 'не найдено'}\n"
+                         f"  кандидат ({record.candidate_ms:.2f} мс): {record.candidate_reason or 'не найдено'}")
+        return "\n".join(lines)
+
+
+# Общий экземпляр теневой проверки
+shadow = ShadowEvaluator()
@@ -0,0 +1,456 @@
+"""
+Многопроцессный режим работы бота.
+
+Процесс-приемщик получает обновления от Telegram и распределяет их по воркерам
+по хешу chat_id, поэтому все сообщения одного чата обрабатывает один воркер
+в порядке поступления. Словарь загружается один раз в приемщике и замораживается
+(gc.freeze) перед созданием воркеров через fork, так что воркеры разделяют его
+страницы памяти только для чтения, а не читают JSON-кеш каждый сам.
+
+Воркер одновременно обрабатывает не больше UPDATE_WORKERS обновлений и берет
+следующее из очереди только после освобождения места, поэтому при медленных
+обработчиках очередь воркера заполняется и притормаживает приемщик. Команды
+администратора идут через отдельную очередь воркера со своими ADMIN_LANE_WORKERS
+местами и не ждут, пока освободятся места обычных обновлений.
+
+Слова, добавленные в одном воркере, остальные воркеры применяют сами, следя
+за журналом изменений словаря. Воркеры перезапускаются, только когда собран
+новый словарь (меняется идентификатор сборки в кеш-файле).
+"""
+
+import asyncio
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+
+from constants import (
+    SHARD_QUEUE_SIZE, SHARD_POLL_TIMEOUT, SHARD_HEARTBEAT_INTERVAL,
+    SHARD_HEARTBEAT_TIMEOUT, SHARD_STOP_TIMEOUT, SHARD_HEALTH_LOG_INTERVAL,
+    ADMIN_LANE_WORKERS, ADMIN_QUEUE_SIZE
+)
+from update_pool import UPDATE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# fork нужен, чтобы воркеры наследовали загруженный словарь без повторной загрузки
+_mp = multiprocessing.get_context('fork')
+
+ReceiverHook = Callable[[Dispatcher], Awaitable[Any]]
+WorkerHook = Callable[[Dispatcher, int], Awaitable[Any]]
+PriorityCheck = Callable[[types.Update], bool]
+
+
+def get_update_chat_id(update: types.Update) -> int:
+    """
+    Определяет ID чата, к которому относится обновление
+
+    Returns:
+        ID чата, ID пользователя для обновлений без чата или 0
+    """
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                 'my_chat_member', 'chat_member', 'chat_join_request'):
+        obj = getattr(update, attr, None)
+        if obj is not None and obj.chat is not None:
+            return obj.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    for attr in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query'):
+        obj = getattr(update, attr, None)
+        if obj is not None:
+            return obj.from_user.id
+    return 0
+
+
+def shard_for_chat(chat_id: int, workers: int) -> int:
+    """Возвращает номер воркера для чата (стабильно между перезапусками)"""
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+async def _worker_loop(index: int, dp: Dispatcher, updates: multiprocessing.Queue,
+                       admin_updates: multiprocessing.Queue,
+                       health: multiprocessing.Queue,
+                       on_startup: Optional[WorkerHook],
+                       on_shutdown: Optional[WorkerHook]) -> None:
+    loop = asyncio.get_running_loop()
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+
+    if on_startup is not None:
+        await on_startup(dp, index)
+
+    # Последняя задача каждого чата: следующее обновление чата ждет предыдущее
+    chains: Dict[int, asyncio.Task] = {}
+    stats = {'processed': 0, 'errors': 0}
+
+    async def process(previous: Optional[asyncio.Task], update: types.Update, slots: asyncio.Semaphore) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            # Через process_updates, чтобы сработали middleware уровня обновления
+            await dp.process_updates([update], fast=False)
+            stats['processed'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            logger.error(f"Воркер {index}: ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            slots.release()
+
+    def release(chat_id: int, task: asyncio.Task) -> None:
+        if chains.get(chat_id) is task:
+            del chains[chat_id]
+
+    async def heartbeat() -> None:
+        while True:
+            health.put({
+                'worker': index,
+                'pid': os.getpid(),
+                'processed': stats['processed'],
+                'errors': stats['errors'],
+                'in_flight': len(chains),
+                'time': time.time()
+            })
+            await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    logger.info(f"Воркер {index} (pid {os.getpid()}) запущен")
+
+    async def read(source: multiprocessing.Queue, slots: asyncio.Semaphore, name: str) -> None:
+        # Чтение очереди блокирует поток; отдельный поток не задерживает закрытие цикла событий
+        # в asyncio.run, если воркер завершается с ошибкой во время ожидания обновления
+        reader = ThreadPoolExecutor(1, thread_name_prefix=f'shard-{name}-{index}')
+        try:
+            while True:
+                # Следующее обновление читается только при свободном месте: пока места заняты,
+                # обновления остаются в ограниченной очереди воркера и притормаживают приемщик
+                await slots.acquire()
+                item = await loop.run_in_executor(reader, source.get)
+                if item is None:
+                    slots.release()
+                    break
+                chat_id, data = item
+                update = types.Update.to_object(data)
+                task = asyncio.create_task(process(chains.get(chat_id), update, slots))
+                chains[chat_id] = task
+                task.add_done_callback(lambda t, c=chat_id: release(c, t))
+        finally:
+            reader.shutdown(wait=False)
+
+    await asyncio.gather(read(updates, asyncio.Semaphore(UPDATE_WORKERS), 'reader'),
+                         read(admin_updates, asyncio.Semaphore(ADMIN_LANE_WORKERS), 'admin-reader'))
+
+    # Дообрабатываем уже полученные обновления перед выходом
+    if chains:
+        await asyncio.wait(list(chains.values()))
+    heartbeat_task.cancel()
+
+    if on_shutdown is not None:
+        await on_shutdown(dp, index)
+    await dp.bot.close()
+    logger.info(f"Воркер {index} завершен, обработано обновлений: {stats['processed']}")
+
+
+def _worker_main(index: int, dp: Dispatcher, updates: multiprocessing.Queue,
+                 admin_updates: multiprocessing.Queue,
+                 health: multiprocessing.Queue,
+                 on_startup: Optional[WorkerHook],
+                 on_shutdown: Optional[WorkerHook]) -> None:
+    # Остановкой воркеров управляет приемщик через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Унаследованный дескриптор пробуждения принадлежит циклу событий приемщика
+    signal.set_wakeup_fd(-1)
+    # Отметка о работающем цикле приемщика привязана к его pid, поэтому asyncio.run
+    # создает в воркере собственный цикл событий и закрывает его при выходе
+    asyncio.run(_worker_loop(index, dp, updates, admin_updates, health, on_startup, on_shutdown))
+
+
+class _WorkerHandle:
+    """Состояние воркера с точки зрения приемщика"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.queue: multiprocessing.Queue = _mp.Queue(SHARD_QUEUE_SIZE)
+        self.admin_queue: multiprocessing.Queue = _mp.Queue(ADMIN_QUEUE_SIZE)
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.last_heartbeat: Dict[str, Any] = {}
+        self.restarts = 0
+        self.dispatched = 0
+
+
+class ShardedRunner:
+    """
+    Запускает бота в режиме приемщика и N воркеров.
+
+    Args:
+        dp: Диспетчер с зарегистрированными обработчиками
+        token: Токен бота для получения обновлений приемщиком
+        workers: Количество процессов-воркеров
+        on_receiver_startup: Вызывается в приемщике до запуска воркеров (загрузка словаря)
+        on_worker_startup: Вызывается в каждом воркере после запуска
+        on_worker_shutdown: Вызывается в каждом воркере перед завершением
+        on_dictionary_change: Вызывается в приемщике при смене сборки словаря,
+            после чего воркеры поочередно перезапускаются с новым словарем
+        dictionary_version: Возвращает идентификатор сборки словаря (блокирующая функция,
+            вызывается в отдельном потоке; None, если словаря нет). Слова, добавленные
+            через журнал, воркеры применяют сами и перезапуск не нужен
+        health_file: Файл для отчета о состоянии воркеров
+        skip_updates: Пропустить обновления, накопившиеся до запуска
+        is_priority: Функция, отбирающая обновления в очередь команд администратора
+
+    Приемщик получает обновления собственным экземпляром Bot и не должен
+    использовать dp.bot, чтобы воркеры не унаследовали его HTTP-сессию.
+    """
+
+    def __init__(self, dp: Dispatcher, token: str, workers: int,
+                 on_receiver_startup: Optional[ReceiverHook] = None,
+                 on_worker_startup: Optional[WorkerHook] = None,
+                 on_worker_shutdown: Optional[WorkerHook] = None,
+                 on_dictionary_change: Optional[ReceiverHook] = None,
+                 dictionary_version: Optional[Callable[[], Optional[str]]] = None,
+                 health_file: Optional[str] = None,
+                 skip_updates: bool = True,
+                 is_priority: Optional[PriorityCheck] = None):
+        self.dp = dp
+        self.token = token
+        self.on_receiver_startup = on_receiver_startup
+        self.on_worker_startup = on_worker_startup
+        self.on_worker_shutdown = on_worker_shutdown
+        self.on_dictionary_change = on_dictionary_change
+        self.dictionary_version = dictionary_version
+        self.health_file = health_file
+        self.skip_updates = skip_updates
+        self.is_priority = is_priority
+        self.health_queue: multiprocessing.Queue = _mp.Queue()
+        self.workers: List[_WorkerHandle] = [_WorkerHandle(i) for i in range(workers)]
+        self._stopping = False
+        self._restarting = False
+        self._dictionary_build: Optional[str] = None
+
+    def run(self) -> None:
+        """Запускает приемщик и воркеры до получения сигнала завершения"""
+        asyncio.run(self._main())
+
+    def stop(self) -> None:
+        """Запрашивает корректное завершение приемщика и воркеров"""
+        logger.info("Получен сигнал завершения, останавливаем приемщик и воркеры...")
+        self._stopping = True
+
+    def _start_worker(self, handle: _WorkerHandle) -> None:
+        # Всё, что загружено к этому моменту, не будет трогаться сборщиком мусора
+        # в воркере, поэтому страницы словаря остаются общими после fork
+        gc.collect()
+        gc.freeze()
+        handle.process = _mp.Process(
+            target=_worker_main,
+            args=(handle.index, self.dp, handle.queue, handle.admin_queue, self.health_queue,
+                  self.on_worker_startup, self.on_worker_shutdown),
+            name=f"shard-worker-{handle.index}",
+            daemon=True
+        )
+        handle.process.start()
+        handle.started_at = time.time()
+        handle.last_heartbeat = {}
+
+    async def _stop_worker(self, handle: _WorkerHandle) -> None:
+        process = handle.process
+        if process is None:
+            return
+        loop = asyncio.get_running_loop()
+        if process.is_alive():
+            await loop.run_in_executor(None, handle.admin_queue.put, None)
+            await loop.run_in_executor(None, handle.queue.put, None)
+            await loop.run_in_executor(None, process.join, SHARD_STOP_TIMEOUT)
+        if process.is_alive():
+            logger.warning(f"Воркер {handle.index} не завершился за {SHARD_STOP_TIMEOUT} сек., принудительная остановка")
+            process.terminate()
+            await loop.run_in_executor(None, process.join, 5)
+            # Очереди могли остаться заблокированными убитым процессом: их заменяют новыми,
+            # а обновления, которые воркер не успел забрать, теряются
+            dropped = self._queued(handle.queue) + self._queued(handle.admin_queue)
+            if dropped:
+                logger.error(f"Воркер {handle.index}: потеряно обновлений из очереди: {dropped}")
+            handle.queue = _mp.Queue(SHARD_QUEUE_SIZE)
+            handle.admin_queue = _mp.Queue(ADMIN_QUEUE_SIZE)
+        handle.process = None
+
+    async def _restart_worker(self, handle: _WorkerHandle, reason: str) -> None:
+        logger.warning(f"Перезапуск воркера {handle.index}: {reason}")
+        await self._stop_worker(handle)
+        handle.restarts += 1
+        if not self._stopping:
+            self._start_worker(handle)
+
+    async def _dispatch(self, update: types.Update) -> None:
+        chat_id = get_update_chat_id(update)
+        handle = self.workers[shard_for_chat(chat_id, len(self.workers))]
+        target = handle.admin_queue if self.is_priority is not None and self.is_priority(update) else handle.queue
+        item = (chat_id, update.to_python())
+        try:
+            target.put_nowait(item)
+        except queue.Full:
+            # Очередь воркера переполнена: ждем, тем самым притормаживая получение обновлений
+            await asyncio.get_running_loop().run_in_executor(None, target.put, item)
+        handle.dispatched += 1
+
+    def _collect_heartbeats(self) -> None:
+        while True:
+            try:
+                beat = self.health_queue.get_nowait()
+            except queue.Empty:
+                break
+            handle = self.workers[beat['worker']]
+            if handle.process is not None and beat['pid'] == handle.process.pid:
+                handle.last_heartbeat = beat
+
+    def health_report(self) -> Dict[str, Any]:
+        """Возвращает сводку о состоянии воркеров"""
+        now = time.time()
+        workers = []
+        for handle in self.workers:
+            beat = handle.last_heartbeat
+            workers.append({
+                'worker': handle.index,
+                'pid': handle.process.pid if handle.process else None,
+                'alive': bool(handle.process and handle.process.is_alive()),
+                'uptime': round(now - handle.started_at, 1) if handle.process else 0,
+                'restarts': handle.restarts,
+                'dispatched': handle.dispatched,
+                'processed': beat.get('processed', 0),
+                'errors': beat.get('errors', 0),
+                'in_flight': beat.get('in_flight', 0),
+                'heartbeat_age': round(now - beat['time'], 1) if beat else None
+            })
+        return {'time': now, 'workers': workers}
+
+    def _write_health(self) -> None:
+        report = self.health_report()
+        summary = ", ".join(
+            f"#{w['worker']}: {'ok' if w['alive'] else 'down'} "
+            f"{w['processed']}/{w['dispatched']} ошибок {w['errors']}"
+            for w in report['workers']
+        )
+        logger.info(f"Состояние воркеров: {summary}")
+        if self.health_file:
+            try:
+                tmp_file = f"{self.health_file}.tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False)
+                os.replace(tmp_file, self.health_file)
+            except Exception as e:
+                logger.warning(f"Не удалось записать отчет о состоянии воркеров: {e}")
+
+    @staticmethod
+    def _queued(updates: multiprocessing.Queue) -> int:
+        try:
+            return updates.qsize()
+        except NotImplementedError:  # macOS
+            return 0
+
+    async def _dictionary_changed(self) -> bool:
+        if self.dictionary_version is None:
+            return False
+        try:
+            build = await asyncio.to_thread(self.dictionary_version)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке версии словаря: {e}")
+            return False
+        if build is None or build == self._dictionary_build:
+            # Удаление словаря (принудительное обновление) само по себе не требует перезапуска:
+            # воркеры перезапустятся, когда будет записан новый словарь
+            return False
+        changed = self._dictionary_build is not None
+        self._dictionary_build = build
+        return changed
+
+    async def _rolling_restart(self) -> None:
+        """Поочередно перезапускает воркеры, чтобы они получили обновленный словарь"""
+        self._restarting = True
+        try:
+            if self.on_dictionary_change is not None:
+                await self.on_dictionary_change(self.dp)
+            for handle in self.workers:
+                if self._stopping:
+                    break
+                await self._restart_worker(handle, "обновлен словарь")
+        finally:
+            self._restarting = False
+
+    async def _monitor(self) -> None:
+        last_report = time.monotonic()
+        while not self._stopping:
+            await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+            self._collect_heartbeats()
+            if self._restarting:
+                continue
+
+            now = time.time()
+            for handle in self.workers:
+                if handle.process is None:
+                    continue
+                if not handle.process.is_alive():
+                    logger.error(f"Воркер {handle.index} завершился с кодом {handle.process.exitcode}")
+                    await self._restart_worker(handle, "процесс завершился")
+                    continue
+                last_seen = handle.last_heartbeat.get('time', handle.started_at)
+                if now - last_seen > SHARD_HEARTBEAT_TIMEOUT:
+                    await self._restart_worker(handle, f"нет heartbeat {int(now - last_seen)} сек.")
+
+            if await self._dictionary_changed():
+                logger.info("Собран новый словарь, перезапускаем воркеры")
+                asyncio.create_task(self._rolling_restart())
+
+            if time.monotonic() - last_report >= SHARD_HEALTH_LOG_INTERVAL:
+                last_report = time.monotonic()
+                self._write_health()
+
+    async def _main(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        if self.on_receiver_startup is not None:
+            await self.on_receiver_startup(self.dp)
+        await self._dictionary_changed()
+
+        for handle in self.workers:
+            self._start_worker(handle)
+        logger.info(f"Запущено {len(self.workers)} воркеров, приемщик начинает получать обновления")
+
+        receiver_bot = Bot(token=self.token, timeout=SHARD_POLL_TIMEOUT + 10, server=self.dp.bot.server)
+        monitor_task = asyncio.create_task(self._monitor())
+        offset = None
+        try:
+            if self.skip_updates:
+                skipped = await receiver_bot.get_updates(offset=-1, timeout=1)
+                if skipped:
+                    offset = skipped[-1].update_id + 1
+
+            while not self._stopping:
+                try:
+                    updates = await receiver_bot.get_updates(offset=offset, timeout=SHARD_POLL_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Ошибка при получении обновлений: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    await self._dispatch(update)
+        finally:
+            monitor_task.cancel()
+            await asyncio.gather(*(self._stop_worker(handle) for handle in self.workers))
+            self._write_health()
+            await receiver_bot.close()
+            logger.info("Приемщик остановлен")
@@ -0,0 +1,187 @@
+"""
+Модуль трассировки обработки обновлений.
+
+Для выбранной доли обновлений строится дерево интервалов (span): получение обновления,
+ожидание в очереди пула обработки, проверка фильтром, запросы GIF по каждому API и попытке,
+ожидание в очереди отправки и отправка.
+Последние трассы хранятся в кольцевом буфере ограниченного размера.
+Для обновлений, не попавших в выборку, span() возвращает пустой контекстный менеджер.
+"""
+
+import contextlib
+import contextvars
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+from dotenv import load_dotenv
+
+from constants import TRACE_BUFFER_SIZE
+from update_pool import queued_at
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Доля трассируемых обновлений (0 — трассировка выключена, 1 — все обновления)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# Текущий интервал в контексте обработки обновления
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """Интервал трассы"""
+
+    __slots__ = ('name', 'start', 'end', 'children', 'attrs')
+
+    def __init__(self, name: str, start: Optional[float] = None, **attrs: Any):
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.children: List['Span'] = []
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def last_end(self) -> float:
+        """Возвращает момент завершения самого позднего интервала в поддереве"""
+        end = self.end if self.end is not None else time.perf_counter()
+        for child in self.children:
+            end = max(end, child.last_end())
+        return end
+
+
+class Trace:
+    """Трасса обработки одного обновления"""
+
+    __slots__ = ('root', 'update_id', 'chat_id', 'received_at')
+
+    def __init__(self, root: Span, update_id: int, chat_id: Optional[int]):
+        self.root = root
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.received_at = time.time()
+
+    @property
+    def duration(self) -> float:
+        """Полное время от получения обновления до завершения последнего интервала"""
+        return self.root.last_end() - self.root.start
+
+
+# Кольцевой буфер последних трасс
+traces: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+class _SpanContext:
+    """Контекстный менеджер, открывающий вложенный интервал"""
+
+    __slots__ = ('name', 'parent', 'attrs', 'span', 'token')
+
+    def __init__(self, name: str, parent: Span, attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, **self.attrs)
+        self.parent.children.append(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attrs['error'] = exc_type.__name__
+        _current_span.reset(self.token)
+        return False
+
+
+def span(name: str, **attrs: Any):
+    """
+    Открывает вложенный интервал в текущей трассе
+
+    Args:
+        name: Название интервала
+        attrs: Дополнительные атрибуты для отчета
+
+    Returns:
+        Контекстный менеджер; пустой, если обновление не трассируется
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NULL_CONTEXT
+    return _SpanContext(name, parent, attrs)
+
+
+def current_span() -> Optional[Span]:
+    """Возвращает текущий интервал или None, если обновление не трассируется"""
+    return _current_span.get()
+
+
+def record_span(name: str, start: float, end: float, **attrs: Any) -> None:
+    """Добавляет в текущую трассу уже завершившийся интервал (например, ожидание в очереди)"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    item = Span(name, start, **attrs)
+    item.end = end
+    parent.children.append(item)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает корневой интервал для выбранной доли обновлений"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        message = update.message or update.edited_message
+        # Трасса начинается с постановки в очередь пула, чтобы ожидание в ней входило в длительность
+        started = queued_at()
+        root = Span('update', started)
+        data['trace_token'] = _current_span.set(root)
+        if started is not None:
+            record_span('pool_queue', started, time.perf_counter())
+        traces.append(Trace(root, update.update_id, message.chat.id if message else None))
+
+    async def on_post_process_update(self, update: types.Update, result: list, data: dict):
+        token = data.get('trace_token')
+        if token is None:
+            return
+        root = _current_span.get()
+        if root is not None:
+            root.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def slowest_traces(limit: int) -> List[Trace]:
+    """Возвращает самые долгие из последних трасс"""
+    return sorted(traces, key=lambda trace: trace.duration, reverse=True)[:limit]
+
+
+def format_span(item: Span, depth: int = 0) -> List[str]:
+    """Форматирует поддерево интервалов с отступами"""
+    attrs = "".join(f" {key}={value}" for key, value in item.attrs.items())
+    running = "" if item.end is not None else " (выполняется)"
+    lines = [f"{'  ' * depth}{item.name}: {item.duration * 1000:.1f} мс{attrs}{running}"]
+    for child in item.children:
+        lines.extend(format_span(child, depth + 1))
+    return lines
+
+
+def format_trace(trace: Trace) -> str:
+    """Форматирует трассу для отчета"""
+    header = f"update {trace.update_id}, чат {trace.chat_id}: {trace.duration * 1000:.1f} мс"
+    return "\n".join([header] + format_span(trace.root, 1))
@@ -0,0 +1,201 @@
+"""
+Индекс транслитерации словаря для поиска нецензурной лексики, написанной латиницей
+("pizdec", "blyat", "nahui") или смесью латиницы и кириллицы ("xуй").
+
+Варианты записи латиницей строятся для слов словаря один раз, при загрузке словаря,
+по нескольким распространенным схемам сразу. При проверке сообщения латинские слова
+не транслитерируются обратно, а ищутся в готовом индексе, причем только те,
+в которых есть латинские буквы: сообщения, написанные кириллицей, проверяются без
+дополнительных затрат.
+
+Латинская запись слов словаря часто совпадает с обычными словами других языков
+или с их частью ("hernia", "hui" в "Chuikov"), поэтому варианты короче
+TRANSLIT_MIN_ROOT_LENGTH совпадают только с целым словом, а слова сообщения из списка
+слов других языков (LATIN_WORDS_FILE в profanity_filter.py) не проверяются вовсе.
+"""
+
+import logging
+import re
+from typing import AbstractSet, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from constants import TRANSLIT_MAX_TOKEN_LENGTH, TRANSLIT_MAX_VARIANTS, TRANSLIT_MIN_ROOT_LENGTH
+
+# Варианты записи русских букв латиницей: первым идет самый распространенный
+TRANSLIT_OPTIONS: Dict[str, Tuple[str, ...]] = {
+    'а': ('a',), 'б': ('b',), 'в': ('v', 'w'), 'г': ('g',), 'д': ('d',),
+    'е': ('e',), 'ё': ('e', 'yo', 'jo'), 'ж': ('zh', 'j', 'g'), 'з': ('z',),
+    'и': ('i',), 'й': ('y', 'i', 'j'), 'к': ('k',), 'л': ('l',), 'м': ('m',),
+    'н': ('n',), 'о': ('o',), 'п': ('p',), 'р': ('r',), 'с': ('s', 'c'),
+    'т': ('t',), 'у': ('u', 'y'), 'ф': ('f',), 'х': ('h', 'x', 'kh'),
+    'ц': ('c', 'ts', 'tz'), 'ч': ('ch',), 'ш': ('sh',), 'щ': ('sch', 'sh', 'shch'),
+    'ъ': ('',), 'ы': ('y', 'i'), 'ь': ('',), 'э': ('e',), 'ю': ('yu', 'ju', 'u'),
+    'я': ('ya', 'ja', 'ia'),
+}
+
+# Основная схема: ей переводятся в латиницу кириллические буквы слов, написанных смесью алфавитов
+_PRIMARY_SCHEME = str.maketrans({letter: options[0] for letter, options in TRANSLIT_OPTIONS.items()})
+
+# Варианты, совпадающие с распространенными словами других языков
+LATIN_STOPWORDS = frozenset({"her", "hera", "manda", "debil", "debila", "mudo", "bla", "sucka"})
+
+logger = logging.getLogger(__name__)
+
+_LATIN_LETTER = re.compile('[a-z]')
+_CYRILLIC_WORD = re.compile('[а-яё]+')
+
+
+def has_latin(text: str) -> bool:
+    """Проверяет, есть ли в тексте (в нижнем регистре) латинские буквы"""
+    return _LATIN_LETTER.search(text) is not None
+
+
+def transliterate_variants(word: str, limit: int = TRANSLIT_MAX_VARIANTS) -> List[str]:
+    """
+    Строит варианты записи слова латиницей. Сначала идет запись по основной схеме,
+    затем варианты с одной заменой на менее распространенную букву, с двумя и так далее.
+
+    Args:
+        word: Слово кириллицей в нижнем регистре
+        limit: Максимальное количество вариантов
+
+    Returns:
+        Варианты без повторов
+    """
+    options = [TRANSLIT_OPTIONS.get(char, (char,)) for char in word]
+    start = (0,) * len(options)
+    frontier = [start]
+    visited = {start}
+    variants: Dict[str, None] = {}
+    while frontier and len(variants) < limit:
+        next_frontier = []
+        for state in frontier:
+            variants.setdefault(''.join(options[i][choice] for i, choice in enumerate(state)))
+            if len(variants) >= limit:
+                break
+            for i, choice in enumerate(state):
+                if choice + 1 < len(options[i]):
+                    next_state = state[:i] + (choice + 1,) + state[i + 1:]
+                    if next_state not in visited:
+                        visited.add(next_state)
+                        next_frontier.append(next_state)
+        frontier = next_frontier
+    return list(variants)
+
+
+def to_latin(word: str) -> str:
+    """Переводит кириллические буквы слова в латиницу по основной схеме"""
+    return word.translate(_PRIMARY_SCHEME)
+
+
+def load_latin_words(path: str) -> FrozenSet[str]:
+    """
+    Читает список слов других языков: по одному на строку, строки с '#' пропускаются
+
+    Args:
+        path: Путь к файлу списка
+
+    Returns:
+        Слова в нижнем регистре вместе с LATIN_STOPWORDS; без файла — только LATIN_STOPWORDS
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            words = {line.strip().lower() for line in f if line.strip() and not line.startswith('#')}
+    except OSError as e:
+        logger.warning(f"Список слов других языков {path} не прочитан: {e}")
+        return LATIN_STOPWORDS
+    return LATIN_STOPWORDS | words
+
+
+class TransliterationIndex:
+    """
+    Индекс вариантов записи латиницей: вариант -> слово словаря.
+    Объект не изменяется после создания: при добавлении слов создается новый.
+    """
+
+    __slots__ = ('words', 'roots', 'latin_words')
+
+    def __init__(self, words: Dict[str, str], roots: Dict[str, str],
+                 latin_words: AbstractSet[str] = LATIN_STOPWORDS):
+        # Варианты слов словаря для проверки слова целиком
+        self.words = words
+        # Варианты корней для поиска внутри слова
+        self.roots = roots
+        # Слова других языков: слово сообщения из этого списка не проверяется
+        self.latin_words = latin_words
+
+    @classmethod
+    def build(cls, dictionary: Iterable[str], known_roots: Iterable[str] = (),
+              latin_words: AbstractSet[str] = LATIN_STOPWORDS) -> 'TransliterationIndex':
+        """
+        Строит индекс для слов словаря (блокирующая операция)
+
+        Args:
+            dictionary: Слова словаря
+            known_roots: Основные корни, которые ищутся внутри слов независимо от длины слова словаря
+            latin_words: Слова других языков, которые не проверяются
+        """
+        index = cls({}, {}, latin_words)
+        index._add(dictionary)
+        index._add_known_roots(known_roots)
+        return index
+
+    def with_words(self, words: Iterable[str]) -> 'TransliterationIndex':
+        """Возвращает новый индекс с добавленными словами"""
+        index = TransliterationIndex(dict(self.words), dict(self.roots), self.latin_words)
+        index._add(words)
+        return index
+
+    def _add(self, dictionary: Iterable[str]) -> None:
+        for entry in dictionary:
+            # Выражения из нескольких слов и слова с дефисом не совпадут с одним словом сообщения
+            if len(entry) < 3 or not _CYRILLIC_WORD.fullmatch(entry):
+                continue
+            for variant in transliterate_variants(entry):
+                if variant not in LATIN_STOPWORDS:
+                    self.words.setdefault(variant, entry)
+                    # Корни короче проверяются только целым словом, как на этапе поиска корней кириллицей
+                    if len(entry) > 3 and len(variant) >= TRANSLIT_MIN_ROOT_LENGTH:
+                        self.roots.setdefault(variant, entry)
+
+    def _add_known_roots(self, roots: Iterable[str]) -> None:
+        # Короткие варианты основных корней ("hui", "pizd") внутри слова дают ложные
+        # срабатывания ("Chuikov", "huyndai"), поэтому они проверяются только целым словом
+        for root in roots:
+            for variant in transliterate_variants(root):
+                if variant in LATIN_STOPWORDS:
+                    continue
+                if len(variant) >= TRANSLIT_MIN_ROOT_LENGTH:
+                    self.roots.setdefault(variant, root)
+                else:
+                    self.words.setdefault(variant, root)
+
+    def lookup(self, token: str) -> Optional[Tuple[str, str]]:
+        """
+        Ищет слово сообщения, содержащее латинские буквы, в индексе
+
+        Args:
+            token: Слово в нижнем регистре
+
+        Returns:
+            Кортеж (слово или корень словаря, найденный вариант записи) или None
+        """
+        latin = to_latin(token)
+        if latin in self.latin_words:
+            return None
+        entry = self.words.get(latin)
+        if entry is not None:
+            return entry, latin
+        # Корни ищем среди всех подстрок слова, начиная с самых длинных; длина слова ограничена,
+        # поэтому проверок не больше нескольких сотен
+        if len(latin) < TRANSLIT_MIN_ROOT_LENGTH or len(latin) > TRANSLIT_MAX_TOKEN_LENGTH:
+            return None
+        for length in range(len(latin), TRANSLIT_MIN_ROOT_LENGTH - 1, -1):
+            for start in range(len(latin) - length + 1):
+                probe = latin[start:start + length]
+                entry = self.roots.get(probe)
+                if entry is not None:
+                    return entry, probe
+        return None
+
+    def __len__(self) -> int:
+        return len(self.words) + len(self.roots)
@@ -0,0 +1,273 @@
+"""
+Модуль пула обработки обновлений.
+
+При long polling aiogram создает отдельную задачу на каждую пачку обновлений и
+обрабатывает обновления пачки одновременно, без ограничений. Во время всплеска
+сообщений обработчики копятся в ожидании GIF API, а вместе с ними растут расход
+памяти и число открытых соединений. Пул ставит обновления в очереди ограниченного
+размера и обрабатывает их фиксированным числом задач-обработчиков:
+
+- у команд администратора своя очередь и свои обработчики, поэтому они выполняются
+  даже тогда, когда обычная очередь заполнена;
+- при переполнении обычной очереди применяется политика OVERFLOW_POLICY:
+  drop_oldest — самое старое ожидающее обновление отбрасывается,
+  degrade — новое обновление обрабатывается сразу в упрощенном режиме
+  (ответ на нецензурную лексику текстом, без запроса GIF).
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+from dotenv import load_dotenv
+
+from constants import (UPDATE_POOL_WORKERS, UPDATE_QUEUE_SIZE, ADMIN_LANE_WORKERS,
+                       ADMIN_QUEUE_SIZE, UPDATE_POOL_STOP_TIMEOUT)
+
+# Загрузка переменных окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Политики переполнения обычной очереди
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DEGRADE = 'degrade'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DEGRADE)
+
+# Количество одновременно обрабатываемых обычных обновлений, размер очереди и политика переполнения
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', str(UPDATE_POOL_WORKERS)) or UPDATE_POOL_WORKERS)
+UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_SIZE', str(UPDATE_QUEUE_SIZE)) or UPDATE_QUEUE_SIZE)
+OVERFLOW_POLICY = os.getenv('OVERFLOW_POLICY', OVERFLOW_DROP_OLDEST).lower()
+if OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+    logger.warning(f"Неизвестная политика переполнения OVERFLOW_POLICY={OVERFLOW_POLICY}, "
+                   f"используется {OVERFLOW_DROP_OLDEST}")
+    OVERFLOW_POLICY = OVERFLOW_DROP_OLDEST
+
+# Признак упрощенной обработки текущего обновления
+_degraded: contextvars.ContextVar[bool] = contextvars.ContextVar('update_degraded', default=False)
+
+# Время постановки текущего обновления в очередь пула (time.perf_counter)
+_queued_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('update_queued_at', default=None)
+
+
+def is_degraded() -> bool:
+    """Проверяет, обрабатывается ли текущее обновление в упрощенном режиме (без GIF)"""
+    return _degraded.get()
+
+
+def queued_at() -> Optional[float]:
+    """
+    Возвращает время постановки текущего обновления в очередь пула (time.perf_counter)
+    или None, если обновление обрабатывается без очереди
+    """
+    return _queued_at.get()
+
+
+class _Lane:
+    """Очередь обновлений одного типа со своими обработчиками и счетчиками"""
+
+    __slots__ = ('name', 'maxsize', 'workers', 'queue', 'busy', 'accepted', 'processed',
+                 'dropped', 'degraded', 'errors', 'high_water', 'wait_total', 'wait_max')
+
+    def __init__(self, name: str, maxsize: int, workers: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        # Элементы очереди: (обновление, время постановки в очередь)
+        self.queue: Optional[asyncio.Queue] = None
+        self.busy = 0
+        self.accepted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.degraded = 0
+        self.errors = 0
+        self.high_water = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def put(self, update: types.Update) -> None:
+        self.queue.put_nowait((update, time.perf_counter()))
+        self.accepted += 1
+        self.high_water = max(self.high_water, self.queue.qsize())
+
+    def drop_oldest(self) -> types.Update:
+        update, _ = self.queue.get_nowait()
+        self.queue.task_done()
+        self.dropped += 1
+        return update
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'busy': self.busy,
+            'workers': self.workers,
+            'accepted': self.accepted,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'degraded': self.degraded,
+            'errors': self.errors,
+            'high_water': self.high_water,
+            'wait_avg': self.wait_total / self.processed if self.processed else 0.0,
+            'wait_max': self.wait_max
+        }
+
+
+class UpdatePool:
+    """
+    Пул обработки обновлений с двумя очередями ограниченного размера:
+    для команд администратора и для всех остальных обновлений.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, queue_size: int = UPDATE_QUEUE_LIMIT,
+                 policy: str = OVERFLOW_POLICY,
+                 is_priority: Optional[Callable[[types.Update], bool]] = None):
+        """
+        Args:
+            workers: Количество одновременно обрабатываемых обычных обновлений
+            queue_size: Размер очереди обычных обновлений
+            policy: Политика переполнения обычной очереди (OVERFLOW_DROP_OLDEST или OVERFLOW_DEGRADE)
+            is_priority: Функция, отбирающая обновления в очередь администратора
+        """
+        self.policy = policy
+        self.is_priority = is_priority
+        self.default = _Lane('default', max(queue_size, 1), max(workers, 1))
+        self.admin = _Lane('admin', ADMIN_QUEUE_SIZE, ADMIN_LANE_WORKERS)
+        self._dispatcher: Optional[Dispatcher] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, dp: Dispatcher) -> None:
+        """Запускает обработчики очередей"""
+        if self._tasks:
+            return
+        self._dispatcher = dp
+        for lane in (self.default, self.admin):
+            lane.queue = asyncio.Queue(lane.maxsize)
+            self._tasks += [asyncio.create_task(self._worker(lane)) for _ in range(lane.workers)]
+        logger.info(f"Пул обработки обновлений запущен: {self.default.workers} обработчиков, "
+                    f"очередь {self.default.maxsize}, политика переполнения {self.policy}")
+
+    async def stop(self, timeout: float = UPDATE_POOL_STOP_TIMEOUT) -> None:
+        """
+        Останавливает пул, предварительно дождавшись обработки уже принятых обновлений
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        lanes = (self.default, self.admin)
+        while any(lane.depth or lane.busy for lane in lanes) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        lost = sum(lane.depth for lane in lanes)
+        if lost:
+            logger.warning(f"Пул обработки остановлен, не обработано обновлений: {lost}")
+        logger.info("Пул обработки обновлений остановлен")
+
+    async def submit(self, update: types.Update) -> None:
+        """
+        Ставит обновление в очередь. Ожидание возможно только в режиме degrade
+        при переполнении: тогда обновление обрабатывается сразу, в упрощенном режиме.
+        """
+        if self.is_priority is not None and self.is_priority(update):
+            lane = self.admin
+            if lane.queue.full():
+                dropped = lane.drop_oldest()
+                logger.warning(f"Очередь команд администратора переполнена, отброшено обновление {dropped.update_id}")
+            lane.put(update)
+            return
+
+        lane = self.default
+        if not lane.queue.full():
+            lane.put(update)
+        elif self.policy == OVERFLOW_DEGRADE:
+            lane.degraded += 1
+            await self._process_degraded(update)
+        else:
+            dropped = lane.drop_oldest()
+            logger.debug(f"Очередь обновлений переполнена, отброшено обновление {dropped.update_id}")
+            lane.put(update)
+
+    async def _process_degraded(self, update: types.Update) -> None:
+        token = _degraded.set(True)
+        try:
+            await self._dispatcher.updates_handler.notify(update)
+        except Exception as e:
+            self.default.errors += 1
+            logger.error(f"Ошибка при упрощенной обработке обновления {update.update_id}: {e}")
+        finally:
+            _degraded.reset(token)
+
+    async def _worker(self, lane: _Lane) -> None:
+        Bot.set_current(self._dispatcher.bot)
+        Dispatcher.set_current(self._dispatcher)
+        while True:
+            update, queued = await lane.queue.get()
+            wait = time.perf_counter() - queued
+            lane.wait_total += wait
+            lane.wait_max = max(lane.wait_max, wait)
+            lane.busy += 1
+            # Трассировка записывает ожидание в очереди пула в трассу обновления
+            token = _queued_at.set(queued)
+            try:
+                await self._dispatcher.updates_handler.notify(update)
+            except Exception as e:
+                lane.errors += 1
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                _queued_at.reset(token)
+                lane.busy -= 1
+                lane.processed += 1
+                lane.queue.task_done()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает показатели обеих очередей"""
+        return {'default': self.default.metrics(), 'admin': self.admin.metrics()}
+
+    def format_metrics(self) -> str:
+        """Формирует отчет о состоянии очередей для команды /queue"""
+        lines = [f"📥 Очередь обновлений (политика переполнения: {self.policy})"]
+        for title, stats in (("Обычные", self.default.metrics()), ("Администратор", self.admin.metrics())):
+            lines.append(f"{title}: в очереди {stats['depth']}/{stats['maxsize']} "
+                         f"(максимум {stats['high_water']}), в работе {stats['busy']}/{stats['workers']}")
+            lines.append(f"  принято {stats['accepted']}, обработано {stats['processed']}, "
+                         f"отброшено {stats['dropped']}, упрощено {stats['degraded']}, ошибок {stats['errors']}")
+            lines.append(f"  ожидание в очереди: среднее {stats['wait_avg']:.2f} сек., "
+                         f"максимальное {stats['wait_max']:.2f} сек.")
+        return "\n".join(lines)
+
+
+class PooledDispatcher(Dispatcher):
+    """
+    Диспетчер, передающий обновления в пул обработки. Пока пул не запущен
+    (например, в воркерах многопроцессного режима), обновления обрабатываются как обычно.
+    """
+
+    def __init__(self, *args, update_pool: Optional[UpdatePool] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.update_pool = update_pool
+
+    async def process_updates(self, updates, fast: bool = True):
+        if self.update_pool is None or not self.update_pool.running:
+            return await super().process_updates(updates, fast)
+        for update in updates:
+            await self.update_pool.submit(update)
+        # Обработчики бота не возвращают ответов для отправки через polling
+        return []
@@ -4,7 +4,10 @@
 
 import asyncio
 import logging
+import time
+from typing import Dict, Optional
 from constants import RETRY_COUNT, RETRY_DELAY, BOT_RETRY_DELAY
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +15,8 @@ async def retry_on_timeout_gif(func, *args, **kwargs):
     """Функция для повторных попыток выполнения при таймауте (для gif_service)"""
     for attempt in range(RETRY_COUNT):
         try:
-            return await func(*args, **kwargs)
+            with tracing.span('attempt', n=attempt + 1):
+                return await func(*args, **kwargs)
         except (asyncio.TimeoutError, Exception) as e:
             if attempt == RETRY_COUNT - 1:
                 logger.error(f"Все попытки получения GIF исчерпаны: {e}")
@@ -29,4 +33,40 @@ async def retry_on_timeout_bot(func, *args, **kwargs):
             if attempt == RETRY_COUNT - 1:
                 raise
             logger.warning(f"Таймаут при попытке {attempt + 1}/{RETRY_COUNT}, повтор через {BOT_RETRY_DELAY} сек...")
-            await asyncio.sleep(BOT_RETRY_DELAY)
\ No newline at end of file
+            await asyncio.sleep(BOT_RETRY_DELAY)
+
+class StartupTimer:
+    """Замер длительности этапов запуска бота"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """
+        Завершает очередной последовательный этап запуска
+
+        Returns:
+            Длительность этапа в секундах
+        """
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def record(self, phase: str, duration: float) -> None:
+        """Сохраняет длительность этапа, выполнявшегося параллельно (например, в фоне)"""
+        self.phases[phase] = duration
+
+    def has(self, *phases: str) -> bool:
+        """Проверяет, что все указанные этапы уже замерены"""
+        return all(phase in self.phases for phase in phases)
+
+    def report(self, labels: Optional[Dict[str, str]] = None) -> str:
+        """Возвращает отчет о длительности этапов запуска"""
+        labels = labels or {}
+        lines = [f"{labels.get(phase, phase)}: {duration:.3f} сек."
+                 for phase, duration in self.phases.items()]
+        total = self._last - self.started
+        return "Отчет о запуске:\n" + "\n".join(lines) + f"\nДо готовности к работе: {total:.3f} сек."
\ No newline at end of file